@@ -15,7 +15,9 @@
 
 import re, types
 
-from buildbot.util import ComparableMixin, NotABranch
+from twisted.python import failure, log
+from buildbot.util import ComparableMixin, NotABranch, subscription
+from buildbot.process import metrics
 
 class ChangeFilter(ComparableMixin):
 
@@ -73,6 +75,15 @@ class ChangeFilter(ComparableMixin):
                 return False
         return True
 
+    def getIndexKey(self):
+        """Returns (attribute, values), where the filter can only match
+        changes whose attribute is one of the values, or None if there is no
+        such exact-match check."""
+        for (filt_list, filt_re, filt_fn, chg_attr) in self.checks:
+            if filt_list is not None:
+                return (chg_attr, filt_list)
+        return None
+
     def __repr__(self):
         checks = []
         for (filt_list, filt_re, filt_fn, chg_attr) in self.checks:
@@ -115,3 +126,94 @@ class ChangeFilter(ComparableMixin):
             return ChangeFilter(**cfargs)
         else:
             return None
+
+
+class ChangeSubscriptionPoint(subscription.SubscriptionPoint):
+    """
+    A L{SubscriptionPoint} for changes, whose subscribers may give a
+    L{ChangeFilter}.  Subscribers are indexed by the values of the first
+    exact-match check of their filter, so that each change is only checked
+    against the filters of subscribers which could want it, and only those
+    whose filter matches are called.
+    """
+
+    def __init__(self, name):
+        subscription.SubscriptionPoint.__init__(self, name)
+        # attribute -> value -> set of subscriptions
+        self.index = {}
+        # subscriptions which must consider every change
+        self.unindexed = set()
+
+    def subscribe(self, callback, change_filter=None):
+        sub = subscription.SubscriptionPoint.subscribe(self, callback)
+        sub.change_filter = change_filter
+        sub.index_key = None
+        if change_filter is not None:
+            sub.index_key = change_filter.getIndexKey()
+        if sub.index_key is None:
+            self.unindexed.add(sub)
+            return sub
+        attr, values = sub.index_key
+        by_value = self.index.setdefault(attr, {})
+        try:
+            for value in values:
+                by_value.setdefault(value, set()).add(sub)
+        except TypeError:
+            # an unhashable value; this subscription sees every change
+            self._unindex(sub)
+            sub.index_key = None
+            self.unindexed.add(sub)
+        return sub
+
+    def getCandidates(self, change):
+        candidates = set(self.unindexed)
+        for attr, by_value in self.index.iteritems():
+            try:
+                candidates.update(by_value.get(getattr(change, attr, ''), ()))
+            except TypeError:
+                # an unhashable attribute can't match an exact check
+                pass
+        return candidates
+
+    def deliver(self, change):
+        candidates = self.getCandidates(change)
+        matches = 0
+        for sub in candidates:
+            # a subscription may be cancelled by an earlier callback
+            if sub not in self.subscriptions:
+                continue
+            try:
+                if (sub.change_filter is not None
+                        and not sub.change_filter.filter_change(change)):
+                    continue
+                matches += 1
+                sub.callback(change)
+            except:
+                log.err(failure.Failure(),
+                        'while invoking callback %s to %s' % (sub.callback, self))
+        metrics.MetricCountEvent.log('%s.candidates' % self.name,
+                                     len(candidates))
+        metrics.MetricCountEvent.log('%s.matches' % self.name, matches)
+
+    def _unindex(self, sub):
+        if sub.index_key is None:
+            self.unindexed.discard(sub)
+            return
+        attr, values = sub.index_key
+        by_value = self.index.get(attr, {})
+        for value in values:
+            try:
+                subs = by_value.get(value)
+            except TypeError:
+                continue
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del by_value[value]
+        if not by_value and attr in self.index:
+            del self.index[attr]
+
+    def _unsubscribe(self, sub):
+        subscription.SubscriptionPoint._unsubscribe(self, sub)
+        self._unindex(sub)
@@ -83,6 +83,10 @@ class MasterConfig(object):
         self.db = dict(
             db_url='sqlite:///state.sqlite',
             db_poll_interval=None,
+            db_full_poll_interval=None,
+            db_thread_pool_size=None,
+            db_pool_size=None,
+            db_max_overflow=None,
         )
         self.metrics = None
         self.caches = dict(
@@ -247,9 +251,9 @@ class MasterConfig(object):
 
         if 'logCompressionMethod' in config_dict:
             logCompressionMethod = config_dict.get('logCompressionMethod')
-            if logCompressionMethod not in ('bz2', 'gz'):
-                errors.addError(
-                        "c['logCompressionMethod'] must be 'bz2' or 'gz'")
+            if logCompressionMethod not in ('bz2', 'gz', 'zblocks'):
+                errors.addError("c['logCompressionMethod'] must be 'bz2', "
+                                "'gz', or 'zblocks'")
             self.logCompressionMethod = logCompressionMethod
 
         copy_int_param('logMaxSize')
@@ -322,7 +326,10 @@ class MasterConfig(object):
     def load_db(self, filename, config_dict, errors):
         if 'db' in config_dict:
             db = config_dict['db']
-            if set(db.keys()) > set(['db_url', 'db_poll_interval']):
+            if set(db.keys()) - set(['db_url', 'db_poll_interval',
+                                     'db_full_poll_interval',
+                                     'db_thread_pool_size', 'db_pool_size',
+                                     'db_max_overflow']):
                 errors.addError("unrecognized keys in c['db']")
             self.db.update(db)
         if 'db_url' in config_dict:
@@ -340,6 +347,21 @@ class MasterConfig(object):
         else:
             self.db['db_poll_interval'] = db_poll_interval
 
+        # and the db_full_poll_interval
+        db_full_poll_interval = self.db['db_full_poll_interval']
+        if db_full_poll_interval is not None and \
+                    not isinstance(db_full_poll_interval, int):
+            errors.addError("c['db']['db_full_poll_interval'] must be an int")
+
+        # and the pool sizes
+        for key, minimum in (('db_thread_pool_size', 1), ('db_pool_size', 1),
+                             ('db_max_overflow', 0)):
+            value = self.db[key]
+            if value is not None and \
+                    (not isinstance(value, int) or value < minimum):
+                errors.addError("c['db']['%s'] must be an int of at least %d"
+                                % (key, minimum))
+
 
     def load_metrics(self, filename, config_dict, errors):
         # we don't try to validate metrics keys
@@ -64,7 +64,11 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
     @with_master_objectid
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-            bsid=None, _master_objectid=None):
+            bsid=None, brids=None, after_brid=None, claimed_since=None,
+            _master_objectid=None):
+        if claimed_since is not None:
+            claimed_since = datetime2epoch(claimed_since)
+
         def thd(conn):
             reqs_tbl = self.db.model.buildrequests
             claims_tbl = self.db.model.buildrequest_claims
@@ -90,10 +94,46 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
                     q = q.where(reqs_tbl.c.complete == 0)
             if bsid is not None:
                 q = q.where(reqs_tbl.c.buildsetid == bsid)
-            res = conn.execute(q)
+            if after_brid is not None:
+                q = q.where(reqs_tbl.c.id > after_brid)
+            if claimed_since is not None:
+                q = q.where(claims_tbl.c.claimed_at >= claimed_since)
+
+            if brids is None:
+                res = conn.execute(q)
+                return [ self._brdictFromRow(row, _master_objectid)
+                         for row in res.fetchall() ]
+
+            # we'll need to batch the brids into groups of 100, so that the
+            # parameter lists supported by the DBAPI aren't exhausted
+            rv = []
+            iterator = iter(brids)
+            while 1:
+                batch = list(itertools.islice(iterator, 100))
+                if not batch:
+                    break
 
-            return [ self._brdictFromRow(row, _master_objectid)
-                     for row in res.fetchall() ]
+                res = conn.execute(q.where(reqs_tbl.c.id.in_(batch)))
+                rv.extend([ self._brdictFromRow(row, _master_objectid)
+                            for row in res.fetchall() ])
+            return rv
+        return self.db.pool.do(thd)
+
+    def getUnclaimedBuildRequestCounts(self):
+        def thd(conn):
+            reqs_tbl = self.db.model.buildrequests
+            claims_tbl = self.db.model.buildrequest_claims
+            q = sa.select([ reqs_tbl.c.buildername,
+                            sa.func.count(reqs_tbl.c.id) ],
+                    from_obj=[ reqs_tbl.outerjoin(claims_tbl,
+                                    reqs_tbl.c.id == claims_tbl.c.brid) ],
+                    whereclause=((claims_tbl.c.claimed_at == None) &
+                                 (reqs_tbl.c.complete == 0)),
+                    group_by=[ reqs_tbl.c.buildername ])
+            res = conn.execute(q)
+            rv = dict((row[0], row[1]) for row in res.fetchall())
+            res.close()
+            return rv
         return self.db.pool.do(thd)
 
     @with_master_objectid
@@ -122,10 +122,76 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             if not row:
                 return None
             # and fetch the ancillary data (files, properties)
-            return self._chdict_from_change_row_thd(conn, row)
+            return self._chdicts_from_change_rows_thd(conn, [ row ])[changeid]
         d = self.db.pool.do(thd)
         return d
 
+    # SQLite limits the number of bound parameters in a query to 999
+    MAX_CHANGEIDS_PER_QUERY = 500
+
+    def getChanges(self, changeids):
+        # fetch the changes that are not already in the cache in one go, with
+        # a query per table per MAX_CHANGEIDS_PER_QUERY changes, rather than
+        # the three queries per change that getChange would do
+        cache = self.getChange.cache
+        missing = set([ changeid for changeid in changeids
+                        if changeid not in cache ])
+
+        def thd(conn):
+            changes_tbl = self.db.model.changes
+            chdicts = {}
+            ids = sorted(missing)
+            for i in xrange(0, len(ids), self.MAX_CHANGEIDS_PER_QUERY):
+                batch = ids[i:i+self.MAX_CHANGEIDS_PER_QUERY]
+                q = changes_tbl.select(
+                        whereclause=changes_tbl.c.changeid.in_(batch))
+                rows = conn.execute(q).fetchall()
+                chdicts.update(self._chdicts_from_change_rows_thd(conn, rows))
+            return chdicts
+        if missing:
+            d = self.db.pool.do(thd)
+        else:
+            d = defer.succeed({})
+
+        def fill_cache(chdicts):
+            for changeid, chdict in chdicts.iteritems():
+                cache.add(changeid, chdict)
+            dl = []
+            for changeid in changeids:
+                if changeid in chdicts:
+                    dl.append(defer.succeed(chdicts[changeid]))
+                elif changeid in missing:
+                    # no such change
+                    dl.append(defer.succeed(None))
+                else:
+                    dl.append(cache.get(changeid))
+            return defer.gatherResults(dl)
+        d.addCallback(fill_cache)
+        return d
+
+    def getChangesAfter(self, changeid, count):
+        # fetch the next count changes, skipping any gaps in the changeids,
+        # with a query per table
+        cache = self.getChange.cache
+        def thd(conn):
+            changes_tbl = self.db.model.changes
+            q = changes_tbl.select(
+                    whereclause=(changes_tbl.c.changeid > changeid),
+                    order_by=[changes_tbl.c.changeid],
+                    limit=count)
+            rows = conn.execute(q).fetchall()
+            chdicts = self._chdicts_from_change_rows_thd(conn, rows)
+            return [ chdicts[row.changeid] for row in rows ]
+        d = self.db.pool.do(thd)
+
+        def fill_cache(chdicts):
+            for chdict in chdicts:
+                if chdict['changeid'] not in cache:
+                    cache.add(chdict['changeid'], chdict)
+            return chdicts
+        d.addCallback(fill_cache)
+        return d
+
     def getChangeUids(self, changeid):
         assert changeid >= 0
         def thd(conn):
@@ -152,10 +218,7 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         d = self.db.pool.do(thd)
 
         # then turn those into changes, using the cache
-        def get_changes(changeids):
-            return defer.gatherResults([ self.getChange(changeid)
-                                         for changeid in changeids ])
-        d.addCallback(get_changes)
+        d.addCallback(self.getChanges)
         return d
 
     def getLatestChangeid(self):
@@ -201,13 +264,16 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                     table.delete(table.c.changeid.in_(ids_to_delete)))
         return self.db.pool.do(thd)
 
-    def _chdict_from_change_row_thd(self, conn, ch_row):
-        # This method must be run in a db.pool thread, and returns a chdict
-        # given a row from the 'changes' table
+    def _chdicts_from_change_rows_thd(self, conn, ch_rows):
+        # This method must be run in a db.pool thread, and returns a dictionary
+        # mapping changeid to chdict, given rows from the 'changes' table.  The
+        # files and properties are fetched with a single query each.
         change_files_tbl = self.db.model.change_files
         change_properties_tbl = self.db.model.change_properties
 
-        chdict = ChDict(
+        chdicts = {}
+        for ch_row in ch_rows:
+            chdicts[ch_row.changeid] = ChDict(
                 changeid=ch_row.changeid,
                 author=ch_row.author,
                 files=[], # see below
@@ -222,12 +288,15 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                 repository=ch_row.repository,
                 codebase=ch_row.codebase,
                 project=ch_row.project)
+        if not chdicts:
+            return chdicts
+        changeids = chdicts.keys()
 
         query = change_files_tbl.select(
-                whereclause=(change_files_tbl.c.changeid == ch_row.changeid))
+                whereclause=change_files_tbl.c.changeid.in_(changeids))
         rows = conn.execute(query)
         for r in rows:
-            chdict['files'].append(r.filename)
+            chdicts[r.changeid]['files'].append(r.filename)
 
         # and properties must be given without a source, so strip that, but
         # be flexible in case users have used a development version where the
@@ -242,13 +311,13 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             return v, s
 
         query = change_properties_tbl.select(
-                whereclause=(change_properties_tbl.c.changeid == ch_row.changeid))
+                whereclause=change_properties_tbl.c.changeid.in_(changeids))
         rows = conn.execute(query)
         for r in rows:
             try:
                 v, s = split_vs(json.loads(r.property_value))
-                chdict['properties'][r.property_name] = (v,s)
+                chdicts[r.changeid]['properties'][r.property_name] = (v,s)
             except ValueError:
                 pass
 
-        return chdict
+        return chdicts
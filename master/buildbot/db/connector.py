@@ -62,6 +62,7 @@ class DBConnector(config.ReconfigurableServiceMixin, service.MultiService):
         # not configured yet - we don't build an engine until the first
         # reconfig
         self.configured_url = None
+        self.configured_pool_sizes = None
 
         # set up components
         self._engine = None # set up in reconfigService
@@ -83,14 +84,22 @@ class DBConnector(config.ReconfigurableServiceMixin, service.MultiService):
 
 
     def setup(self, check_version=True, verbose=True):
-        db_url = self.configured_url = self.master.config.db['db_url']
+        db_config = self.master.config.db
+        db_url = self.configured_url = db_config['db_url']
+        self.configured_pool_sizes = self._getPoolSizes(db_config)
 
         log.msg("Setting up database with URL %r" % (db_url,))
 
         # set up the engine and pool
+        engine_kwargs = {}
+        if db_config.get('db_pool_size') is not None:
+            engine_kwargs['pool_size'] = db_config['db_pool_size']
+        if db_config.get('db_max_overflow') is not None:
+            engine_kwargs['max_overflow'] = db_config['db_max_overflow']
         self._engine = enginestrategy.create_engine(db_url,
-                                basedir=self.basedir)
-        self.pool = pool.DBThreadPool(self._engine, verbose=verbose)
+                                basedir=self.basedir, **engine_kwargs)
+        self.pool = pool.DBThreadPool(self._engine, verbose=verbose,
+                                pool_size=db_config.get('db_thread_pool_size'))
 
         # make sure the db is up to date, unless specifically asked not to
         if check_version:
@@ -111,10 +120,18 @@ class DBConnector(config.ReconfigurableServiceMixin, service.MultiService):
         # double-check -- the master ensures this in config checks
         assert self.configured_url == new_config.db['db_url']
 
+        if self.configured_pool_sizes != self._getPoolSizes(new_config.db):
+            log.msg("NOTE: changes to the database pool sizes in c['db'] "
+                    "will take effect when the master is restarted")
+
         return config.ReconfigurableServiceMixin.reconfigService(self,
                                                             new_config)
 
 
+    def _getPoolSizes(self, db_config):
+        return [ db_config.get(k) for k in ('db_thread_pool_size',
+                                            'db_pool_size', 'db_max_overflow') ]
+
     def _doCleanup(self):
         """
         Perform any periodic database cleanup tasks.
@@ -48,9 +48,15 @@ class BuildbotEngineStrategy(strategies.ThreadLocalEngineStrategy):
     def special_case_sqlite(self, u, kwargs):
         """For sqlite, percent-substitute %(basedir)s and use a full
         path to the basedir.  If using a memory database, force the
-        pool size to be 1."""
+        pool size to be 1.  Pool sizing arguments are ignored, since
+        SQLite databases do not use a connection pool of the usual sort."""
         max_conns = None
 
+        for arg in ('pool_size', 'max_overflow'):
+            if arg in kwargs:
+                log.msg("ignoring %s=%r for SQLite database" %
+                        (arg, kwargs.pop(arg)))
+
         # when given a database path, stick the basedir in there
         if u.database:
 
@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+import sys
 import time
 import traceback
 import inspect
@@ -22,7 +23,7 @@ import sqlalchemy as sa
 import tempfile
 from buildbot.process import metrics
 from twisted.internet import reactor, threads
-from twisted.python import threadpool, log
+from twisted.python import threadpool, log, failure
 
 # set this to True for *very* verbose query debugging output; this can
 # be monkey-patched from master.cfg, too:
@@ -78,9 +79,22 @@ def timed_do_fn(f):
     wrap.__doc__ = f.__doc__
     return wrap
 
+def _callerName():
+    """Return a short name for the function outside this module that called
+    into the pool, e.g., C{changes.getChange()}.  This only looks at code
+    objects, so it is cheap enough to do for every query."""
+    frame = sys._getframe(1)
+    while frame and frame.f_globals.get('__name__') == __name__:
+        frame = frame.f_back
+    if not frame:
+        return 'unknown()'
+    module = frame.f_globals.get('__name__', '?').rsplit('.', 1)[-1]
+    return "%s.%s()" % (module, frame.f_code.co_name)
+
 class DBThreadPool(threadpool.ThreadPool):
 
     running = False
+    _stop_evt = None
 
     # Some versions of SQLite incorrectly cache metadata about which tables are
     # and are not present on a per-connection basis.  This cache can be flushed
@@ -90,7 +104,7 @@ class DBThreadPool(threadpool.ThreadPool):
     # in bug #1810.
     __broken_sqlite = False
 
-    def __init__(self, engine, verbose=False):
+    def __init__(self, engine, verbose=False, pool_size=None):
         # verbose is used by upgrade scripts, and if it is set we should print
         # messages about versions and other warnings
         log_msg = log.msg
@@ -98,14 +112,19 @@ class DBThreadPool(threadpool.ThreadPool):
             def log_msg(m):
                 print m
 
-        pool_size = 5
-
         # If the engine has an C{optimal_thread_pool_size} attribute, then the
-        # maxthreads of the thread pool will be set to that value.  This is
-        # most useful for SQLite in-memory connections, where exactly one
-        # connection (and thus thread) should be used.
-        if hasattr(engine, 'optimal_thread_pool_size'):
-            pool_size = engine.optimal_thread_pool_size
+        # maxthreads of the thread pool will be set to that value, or to
+        # pool_size if that is smaller - more threads than connections would
+        # just wait for a connection.  This is most useful for SQLite
+        # in-memory connections, where exactly one connection (and thus
+        # thread) should be used.
+        max_size = getattr(engine, 'optimal_thread_pool_size', None)
+        if pool_size is None:
+            pool_size = max_size or 5
+        elif max_size and pool_size > max_size:
+            log_msg("NOTE: limiting the database thread pool to %d threads, "
+                    "the number of available connections" % max_size)
+            pool_size = max_size
 
         threadpool.ThreadPool.__init__(self,
                         minthreads=1,
@@ -151,6 +170,11 @@ class DBThreadPool(threadpool.ThreadPool):
         """Manually stop the pool.  This is only necessary from tests, as the
         pool will stop itself when the reactor stops under normal
         circumstances."""
+        if self._start_evt:
+            # pool was never started
+            reactor.removeSystemEventTrigger(self._start_evt)
+            self._start_evt = None
+            return
         if not self._stop_evt:
             return # pool is already stopped
         reactor.removeSystemEventTrigger(self._stop_evt)
@@ -163,7 +187,15 @@ class DBThreadPool(threadpool.ThreadPool):
     BACKOFF_START = 1.0
     BACKOFF_MULT = 1.05
     MAX_OPERATIONALERROR_TIME = 3600*24 # one day
-    def __thd(self, with_engine, callable, args, kwargs):
+    def __thd(self, with_engine, callable, args, kwargs, stats):
+        # note the start and end times of the query in stats
+        stats['started'] = time.time()
+        try:
+            return self.__thd_retry(with_engine, callable, args, kwargs, stats)
+        finally:
+            stats['finished'] = time.time()
+
+    def __thd_retry(self, with_engine, callable, args, kwargs, stats):
         # try to call callable(arg, *args, **kwargs) repeatedly until no
         # OperationalErrors occur, where arg is either the engine (with_engine)
         # or a connection (not with_engine)
@@ -196,6 +228,7 @@ class DBThreadPool(threadpool.ThreadPool):
 
                         metrics.MetricCountEvent.log(
                                 "DBThreadPool.retry-on-OperationalError")
+                        stats['retries'] += 1
                         log.msg("automatically retrying query after "
                                 "OperationalError (%ss sleep)" % backoff)
 
@@ -214,12 +247,46 @@ class DBThreadPool(threadpool.ThreadPool):
         return rv
 
     def do(self, callable, *args, **kwargs):
-        return threads.deferToThreadPool(reactor, self,
-                self.__thd, False, callable, args, kwargs)
+        return self.__defer(False, callable, args, kwargs)
 
     def do_with_engine(self, callable, *args, **kwargs):
-        return threads.deferToThreadPool(reactor, self,
-                self.__thd, True, callable, args, kwargs)
+        return self.__defer(True, callable, args, kwargs)
+
+    def __defer(self, with_engine, callable, args, kwargs):
+        # the thread only records timestamps in stats; the metrics are logged
+        # from the reactor thread once the query is done
+        stats = dict(name=_callerName(), queued=time.time(),
+                     depth=self.q.qsize(), retries=0)
+        d = threads.deferToThreadPool(reactor, self,
+                self.__thd, with_engine, callable, args, kwargs, stats)
+        d.addBoth(self.__logStats, stats)
+        return d
+
+    def __logStats(self, res, stats):
+        # log the per-query metrics: the query time under the name of the
+        # calling method, as well as the time spent waiting for a thread and
+        # the number of queries already waiting when this one was queued
+        name = stats['name']
+        if 'started' in stats:
+            metrics.MetricHistogramEvent.log("DBThreadPool.queue-wait",
+                    stats['started'] - stats['queued'])
+        if 'finished' in stats:
+            metrics.MetricHistogramEvent.log("db.%s" % name,
+                    stats['finished'] - stats['started'])
+        metrics.MetricHistogramEvent.log("DBThreadPool.queue-depth",
+                stats['depth'])
+        if stats['retries']:
+            metrics.MetricCountEvent.log("db.%s.retries" % name,
+                    stats['retries'])
+        if isinstance(res, (list, tuple)):
+            rows = len(res)
+        elif res is None or isinstance(res, failure.Failure):
+            rows = 0
+        else:
+            rows = 1
+        if rows:
+            metrics.MetricCountEvent.log("db.%s.rows" % name, rows)
+        return res
 
     def detect_bug1810(self):
         # detect buggy SQLite implementations; call only for a known-sqlite
@@ -141,6 +141,12 @@ class IStatus(Interface):
         """Return the IBuilderStatus object for a given named Builder. Raises
         KeyError if there is no Builder by that name."""
 
+    def getPendingBuildRequestCounts(buildernames=None):
+        """Return a dictionary mapping the names of the given Builders (or
+        of all Builders) to the number of their unclaimed build requests,
+        via a Deferred. This makes a single database query for all of them,
+        shared by all callers until it completes."""
+
     def getSlaveNames():
         """Return a list of buildslave names, suitable for passing to
         getSlave()."""
@@ -351,6 +357,13 @@ class IBuilderStatus(Interface):
         longer available. Older builds are likely to have less information
         stored: Logs are the first to go, then Steps."""
 
+    def getBuildSummary(number):
+        """Return a BuildSummary for a build, numbered as for getBuild, or
+        None if the build is not available.  A summary carries only the
+        build's times, results, text, branch, revisions, slave name and
+        reason, but for finished builds it can be retrieved without loading
+        the build itself from disk."""
+
     def getEvent(number):
         """Return an IStatusEvent object for a recent Event. Builders
         connecting and disconnecting are events, as are ping attempts.
@@ -399,6 +412,15 @@ class IBuilderStatus(Interface):
                            of builds that will be examined.
         """
 
+    def generateFinishedBuildSummaries(branches=[],
+                               num_builds=None,
+                               max_buildnum=None, finished_before=None,
+                               max_search=200,
+                               ):
+        """Like generateFinishedBuilds, but produce BuildSummary objects
+        instead of IBuildStatus objects, so that no builds need be loaded
+        from disk."""
+
     def subscribe(receiver):
         """Register an IStatusReceiver to receive new status events. The
         receiver will be given builderChangedState, buildStarted, and
@@ -805,7 +827,10 @@ class IStatusLog(Interface):
     def readlines(channel=LOG_CHANNEL_STDOUT):
         """Read lines from one channel of the logfile. This returns an
         iterator that will provide single lines of text (including the
-        trailing newline).
+        trailing newline). The log is read as the iterator is consumed, so
+        this is suitable for very large logs. C{channel} may also be a list
+        of channels, in which case the lines of each channel are kept
+        separate.
         """
 
     def getTextWithHeaders():
@@ -817,6 +842,20 @@ class IStatusLog(Interface):
         0 for stdout, 1 for stderr, 2 for header. (note that stderr is merged
         into stdout if PTYs are in use)."""
 
+    def getTextLength(channels=[]):
+        """Return the total length of the text on the given channels (all
+        channels if empty)."""
+
+    def getRange(offset, length, channels=[]):
+        """Return a list of (channel, text) tuples holding C{length} bytes
+        of the text on the given channels, starting at C{offset}. Offsets
+        count only the text on those channels."""
+
+    def getTail(size, channels=[], lines=False):
+        """Return a list of (channel, text) tuples holding the last C{size}
+        bytes of the text on the given channels, or the last C{size} lines
+        if C{lines} is true."""
+
 class IStatusLogConsumer(Interface):
     """I am an object which can be passed to IStatusLog.subscribeConsumer().
     I represent a target for writing the contents of an IStatusLog. This
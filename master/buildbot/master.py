@@ -29,6 +29,7 @@ from buildbot.util import subscription, epoch2datetime
 from buildbot.status.master import Status
 from buildbot.changes import changes
 from buildbot.changes.manager import ChangeManager
+from buildbot.changes.filter import ChangeSubscriptionPoint
 from buildbot import interfaces
 from buildbot.process.builder import BuilderControl
 from buildbot.db import connector
@@ -65,6 +66,16 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
     # database poll operation.
     WARNING_UNCLAIMED_COUNT = 10000
 
+    # when polling incrementally for build requests, look for claims made up
+    # to this many seconds before the previous poll, to allow for clock skew
+    # between masters and for transactions committed after they were stamped;
+    # gaps in the changeids are also waited on for this long
+    CLAIM_POLL_SLACK = 60
+
+    # number of changes fetched from the database at a time when catching up
+    # with new changes
+    CHANGE_POLL_BATCH = 100
+
     def __init__(self, basedir, configFileName="master.cfg", umask=None):
         service.MultiService.__init__(self)
         self.setName("buildmaster")
@@ -93,7 +104,7 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
 
         # subscription points
         self._change_subs = \
-                subscription.SubscriptionPoint("changes")
+                ChangeSubscriptionPoint("changes")
         self._new_buildrequest_subs = \
                 subscription.SubscriptionPoint("buildrequest_additions")
         self._new_buildset_subs = \
@@ -492,14 +503,17 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         d.addCallback(notify)
         return d
 
-    def subscribeToChanges(self, callback):
+    def subscribeToChanges(self, callback, change_filter=None):
         """
         Request that C{callback} be called with each Change object added to the
-        cluster.
+        cluster, or, if C{change_filter} is given, with each such Change that
+        it matches.  Changes are only checked against the filters which could
+        match them.
 
         Note: this method will go away in 0.9.x
         """
-        return self._change_subs.subscribe(callback)
+        return self._change_subs.subscribe(callback,
+                                           change_filter=change_filter)
 
     def addBuildset(self, **kwargs):
         """
@@ -622,6 +636,8 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         return d
 
     _last_processed_change = None
+    # (changeid after a gap in the changeids, time the gap was first seen)
+    _change_gap = None
     @defer.inlineCallbacks
     def pollDatabaseChanges(self):
         # Older versions of Buildbot had each scheduler polling the database
@@ -658,29 +674,51 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
             timer.stop()
             return
 
-        while True:
-            changeid = self._last_processed_change + 1
-            chdict = yield self.db.changes.getChange(changeid)
-
-            # if there's no such change, we've reached the end and can
-            # stop polling
-            if not chdict:
+        at_gap = False
+        while not at_gap:
+            # fetch the next page of changes
+            chdicts = yield self.db.changes.getChangesAfter(
+                    self._last_processed_change, self.CHANGE_POLL_BATCH)
+
+            for chdict in chdicts:
+                changeid = chdict['changeid']
+                if changeid != self._last_processed_change + 1:
+                    # the missing changes may be in another master's
+                    # transactions, not yet committed, so wait for them;
+                    # if they have not arrived after CLAIM_POLL_SLACK, they
+                    # were deleted or rolled back, and are skipped
+                    now = reactor.seconds()
+                    if (self._change_gap is None
+                            or self._change_gap[0] != changeid):
+                        self._change_gap = (changeid, now)
+                    if now - self._change_gap[1] < self.CLAIM_POLL_SLACK:
+                        at_gap = True
+                        break
+                self._change_gap = None
+                change = yield changes.Change.fromChdict(self, chdict)
+                self._change_subs.deliver(change)
+                self._last_processed_change = changeid
+                need_setState = True
+
+            # write back the state once per page, so that a restart while
+            # catching up only repeats the current page
+            if need_setState:
+                yield self._setState('last_processed_change',
+                                self._last_processed_change)
+                need_setState = False
+
+            # if the page wasn't full, we've reached the end and can stop
+            # polling
+            if len(chdicts) < self.CHANGE_POLL_BATCH:
                 break
 
-            change = yield changes.Change.fromChdict(self, chdict)
-
-            self._change_subs.deliver(change)
-
-            self._last_processed_change = changeid
-            need_setState = True
-
-        # write back the updated state, if it's changed
-        if need_setState:
-            yield self._setState('last_processed_change',
-                            self._last_processed_change)
         timer.stop()
 
     _last_unclaimed_brids_set = None
+    _last_claimed_brids_set = None
+    _brid_high_water_mark = None
+    _last_full_brid_poll = 0
+    _last_claim_poll = 0
     _last_claim_cleanup = 0
     @defer.inlineCallbacks
     def pollDatabaseBuildRequests(self):
@@ -710,14 +748,54 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
                     "producing builds for which no builder is running?"
                     % len(last_unclaimed))
 
+        # unless db_full_poll_interval is set, every poll scans the whole
+        # table; otherwise, only poll for requests that have changed since
+        # the last poll, with an occasional full scan to catch anything that
+        # slipped through.
+        full_poll_interval = self.config.db['db_full_poll_interval']
+        now = reactor.seconds()
+        if (not full_poll_interval
+                or self._brid_high_water_mark is None
+                or now - self._last_full_brid_poll >= full_poll_interval):
+            rows = yield self._pollAllBuildRequests(last_unclaimed,
+                                            track_claims=bool(full_poll_interval))
+            self._last_full_brid_poll = now
+        else:
+            rows = yield self._pollChangedBuildRequests(last_unclaimed)
+        self._last_claim_poll = now
+
+        metrics.MetricCountEvent.log(
+                "BuildMaster.pollDatabaseBuildRequests.rows", rows,
+                absolute=True)
+        timer.stop()
+
+    @defer.inlineCallbacks
+    def _pollAllBuildRequests(self, last_unclaimed, track_claims):
         # get the current set of unclaimed buildrequests
         now_unclaimed_brdicts = \
             yield self.db.buildrequests.getBuildRequests(claimed=False)
         now_unclaimed = set([ brd['brid'] for brd in now_unclaimed_brdicts ])
+        rows = len(now_unclaimed_brdicts)
 
         # and store that for next time
         self._last_unclaimed_brids_set = now_unclaimed
 
+        # if we will be polling incrementally, also note which requests are
+        # claimed but incomplete, and the highest brid we have seen
+        if track_claims:
+            claimed_brdicts = yield self.db.buildrequests.getBuildRequests(
+                    claimed=True, complete=False)
+            rows += len(claimed_brdicts)
+            self._last_claimed_brids_set = \
+                    set([ brd['brid'] for brd in claimed_brdicts ])
+            self._brid_high_water_mark = max(
+                    [ self._brid_high_water_mark or 0 ]
+                    + list(now_unclaimed)
+                    + list(self._last_claimed_brids_set))
+        else:
+            self._last_claimed_brids_set = None
+            self._brid_high_water_mark = None
+
         # see what's new, and notify if anything is
         new_unclaimed = now_unclaimed - last_unclaimed
         if new_unclaimed:
@@ -726,7 +804,59 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
                 brd = brdicts[brid]
                 self.buildRequestAdded(brd['buildsetid'], brd['brid'],
                                        brd['buildername'])
-        timer.stop()
+
+        defer.returnValue(rows)
+
+    @defer.inlineCallbacks
+    def _pollChangedBuildRequests(self, last_unclaimed):
+        unclaimed = set(last_unclaimed)
+        claimed = self._last_claimed_brids_set
+        hwm = self._brid_high_water_mark
+        notify = []
+
+        # requests added since the last poll
+        new_brdicts = yield self.db.buildrequests.getBuildRequests(
+                claimed=False, after_brid=hwm)
+        for brd in new_brdicts:
+            hwm = max(hwm, brd['brid'])
+            if brd['brid'] not in unclaimed:
+                unclaimed.add(brd['brid'])
+                notify.append(brd)
+
+        # requests claimed (or reclaimed) since the last poll
+        claimed_since = epoch2datetime(max(0,
+                        self._last_claim_poll - self.CLAIM_POLL_SLACK))
+        claimed_brdicts = yield self.db.buildrequests.getBuildRequests(
+                claimed=True, claimed_since=claimed_since)
+        for brd in claimed_brdicts:
+            hwm = max(hwm, brd['brid'])
+            unclaimed.discard(brd['brid'])
+            if not brd['complete']:
+                claimed.add(brd['brid'])
+
+        # and check up on the requests we knew to be claimed, to find those
+        # that have since completed or been unclaimed
+        known_brdicts = yield self.db.buildrequests.getBuildRequests(
+                brids=list(claimed))
+        claimed.intersection_update([ brd['brid'] for brd in known_brdicts ])
+        for brd in known_brdicts:
+            if brd['complete']:
+                claimed.discard(brd['brid'])
+            elif not brd['claimed']:
+                claimed.discard(brd['brid'])
+                if brd['brid'] not in unclaimed:
+                    unclaimed.add(brd['brid'])
+                    notify.append(brd)
+
+        self._last_unclaimed_brids_set = unclaimed
+        self._brid_high_water_mark = hwm
+
+        for brd in notify:
+            self.buildRequestAdded(brd['buildsetid'], brd['brid'],
+                                   brd['buildername'])
+
+        defer.returnValue(len(new_brdicts) + len(claimed_brdicts)
+                          + len(known_brdicts))
 
     ## state maintenance (private)
 
@@ -141,6 +141,9 @@ class BotMaster(config.ReconfigurableServiceMixin, service.MultiService):
 
     def startService(self):
         def buildRequestAdded(notif):
+            builder = self.builders.get(notif['buildername'])
+            if builder:
+                builder.buildRequestAdded(notif['brid'])
             self.maybeStartBuildsForBuilder(notif['buildername'])
         self.buildrequest_sub = \
             self.master.subscribeToBuildRequests(buildRequestAdded)
@@ -19,7 +19,7 @@ from zope.interface import implements
 from twisted.python import log, failure
 from twisted.spread import pb
 from twisted.application import service, internet
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 
 from buildbot import interfaces, config
 from buildbot.status.progress import Expectations
@@ -37,6 +37,11 @@ class Builder(config.ReconfigurableServiceMixin,
     # reconfigure builders before slaves
     reconfig_priority = 196
 
+    # interval at which the in-memory queue of unclaimed build requests is
+    # re-read from the database, to catch changes made by other masters that
+    # were not signalled with buildRequestAdded
+    UNCLAIMED_RECONCILE_INTERVAL = 5*60
+
     def __init__(self, name):
         service.MultiService.__init__(self)
         self.name = name
@@ -61,6 +66,14 @@ class Builder(config.ReconfigurableServiceMixin,
         self.config = None
         self.builder_status = None
 
+        # unclaimed build requests for this builder, as brdicts sorted by
+        # submitted_at; this is None until it is first read from the database
+        self._unclaimed_requests = None
+        self._unclaimed_fetched_at = 0
+        # brids of requests that may have become claimable since the queue
+        # was last read, and which must be fetched before it is used
+        self._unclaimed_pending_brids = set()
+
         self.reclaim_svc = internet.TimerService(10*60, self.reclaimAllBuilds)
         self.reclaim_svc.setServiceParent(self)
 
@@ -108,16 +121,80 @@ class Builder(config.ReconfigurableServiceMixin,
 
         @returns: datetime instance or None, via Deferred
         """
-        unclaimed = yield self.master.db.buildrequests.getBuildRequests(
-                        buildername=self.name, claimed=False)
+        unclaimed = yield self._getUnclaimedRequests()
 
         if unclaimed:
-            unclaimed = [ brd['submitted_at'] for brd in unclaimed ]
-            unclaimed.sort()
-            defer.returnValue(unclaimed[0])
+            defer.returnValue(unclaimed[0]['submitted_at'])
         else:
             defer.returnValue(None)
 
+    def buildRequestAdded(self, brid):
+        """Note that build request C{brid} may have become available to be
+        claimed, either because it is new or because it has been unclaimed.
+        It will be added to the queue of unclaimed requests the next time
+        that queue is used."""
+        self._unclaimed_pending_brids.add(brid)
+
+    @defer.inlineCallbacks
+    def _getUnclaimedRequests(self):
+        """
+        Get the queue of unclaimed build requests for this builder, oldest
+        first.  The queue is kept in memory, and only requests signalled via
+        L{buildRequestAdded} are fetched from the database, except that the
+        whole queue is re-read every C{UNCLAIMED_RECONCILE_INTERVAL} seconds.
+
+        The caller must not modify the returned list.
+
+        @returns: sorted list of brdicts, via Deferred
+        """
+        db = self.master.db
+        now = reactor.seconds()
+        if (self._unclaimed_requests is None or now - self._unclaimed_fetched_at
+                        >= self.UNCLAIMED_RECONCILE_INTERVAL):
+            self._unclaimed_pending_brids.clear()
+            brdicts = yield db.buildrequests.getBuildRequests(
+                    buildername=self.name, claimed=False)
+            self._unclaimed_fetched_at = now
+
+            # keep the existing brdicts, and any BuildRequest objects cached
+            # in them, for requests that are still unclaimed
+            old = dict((brd['brid'], brd)
+                       for brd in self._unclaimed_requests or [])
+            new_brids = set([ brd['brid'] for brd in brdicts ])
+            self._breakBrdictRefloops([ brd for brid, brd in old.iteritems()
+                                        if brid not in new_brids ])
+            self._setUnclaimedRequests([ old.get(brd['brid'], brd)
+                                         for brd in brdicts ])
+
+        elif self._unclaimed_pending_brids:
+            brids = list(self._unclaimed_pending_brids)
+            self._unclaimed_pending_brids.clear()
+            brdicts = yield db.buildrequests.getBuildRequests(
+                    buildername=self.name, claimed=False, brids=brids)
+
+            known = set([ brd['brid'] for brd in self._unclaimed_requests ])
+            self._setUnclaimedRequests(self._unclaimed_requests +
+                    [ brd for brd in brdicts if brd['brid'] not in known ])
+
+        defer.returnValue(self._unclaimed_requests)
+
+    def _setUnclaimedRequests(self, brdicts):
+        # sort by submitted_at, so the first is the oldest
+        brdicts.sort(key=lambda brd : brd['submitted_at'])
+        self._unclaimed_requests = brdicts
+
+    def _removeUnclaimedRequests(self, brids):
+        """Remove the given requests from the queue of unclaimed requests,
+        because they have been claimed."""
+        if self._unclaimed_requests is None:
+            return
+        brids = set(brids)
+        removed = [ brd for brd in self._unclaimed_requests
+                    if brd['brid'] in brids ]
+        self._breakBrdictRefloops(removed)
+        self._unclaimed_requests = [ brd for brd in self._unclaimed_requests
+                                     if brd['brid'] not in brids ]
+
     def reclaimAllBuilds(self):
         brids = set()
         for b in self.building:
@@ -420,7 +497,12 @@ class Builder(config.ReconfigurableServiceMixin,
 
     def _resubmit_buildreqs(self, build):
         brids = [br.id for br in build.requests]
-        return self.master.db.buildrequests.unclaimBuildRequests(brids)
+        d = self.master.db.buildrequests.unclaimBuildRequests(brids)
+        def requeue(_):
+            for brid in brids:
+                self.buildRequestAdded(brid)
+        d.addCallback(requeue)
+        return d
 
     def setExpectations(self, progress):
         """Mark the build as successful and update expectations for the next
@@ -461,18 +543,14 @@ class Builder(config.ReconfigurableServiceMixin,
             self.updateBigStatus()
             return
 
-        # now, get the available build requests
-        unclaimed_requests = \
-            yield self.master.db.buildrequests.getBuildRequests(
-                    buildername=self.name, claimed=False)
+        # now, get the available build requests; this is a copy of the
+        # queue, from which requests are removed as they are handled
+        unclaimed_requests = list((yield self._getUnclaimedRequests()))
 
         if not unclaimed_requests:
             self.updateBigStatus()
             return
 
-        # sort by submitted_at, so the first is the oldest
-        unclaimed_requests.sort(key=lambda brd : brd['submitted_at'])
-
         # get the mergeRequests function for later
         mergeRequests_fn = self._getMergeRequestsFn()
 
@@ -511,12 +589,13 @@ class Builder(config.ReconfigurableServiceMixin,
                 yield self.master.db.buildrequests.claimBuildRequests(brids)
             except buildrequests.AlreadyClaimedError:
                 # one or more of the build requests was already claimed;
-                # re-fetch the now-partially-claimed build requests and keep
-                # trying to match them
-                self._breakBrdictRefloops(unclaimed_requests)
+                # drop them from the queue, re-fetch those that are still
+                # unclaimed, and keep trying to match them
+                self._removeUnclaimedRequests(brids)
+                for brid in brids:
+                    self.buildRequestAdded(brid)
                 unclaimed_requests = \
-                    yield self.master.db.buildrequests.getBuildRequests(
-                            buildername=self.name, claimed=False)
+                    list((yield self._getUnclaimedRequests()))
 
                 # go around the loop again
                 continue
@@ -531,11 +610,16 @@ class Builder(config.ReconfigurableServiceMixin,
                     [ self._brdictToBuildRequest(brdict)
                       for brdict in brdicts ])
 
+            # the requests are no longer unclaimed
+            self._removeUnclaimedRequests(brids)
+
             build_started = yield self._startBuildFor(slavebuilder, breqs)
 
             if not build_started:
                 # build was not started, so unclaim the build requests
                 yield self.master.db.buildrequests.unclaimBuildRequests(brids)
+                for brid in brids:
+                    self.buildRequestAdded(brid)
 
                 # and try starting builds again.  If we still have a working slave,
                 # then this may re-claim the same buildrequests
@@ -543,12 +627,10 @@ class Builder(config.ReconfigurableServiceMixin,
 
             # finally, remove the buildrequests and slavebuilder from the
             # respective queues
-            self._breakBrdictRefloops(brdicts)
             for brdict in brdicts:
                 unclaimed_requests.remove(brdict)
             available_slavebuilders.remove(slavebuilder)
 
-        self._breakBrdictRefloops(unclaimed_requests)
         self.updateBigStatus()
         return
 
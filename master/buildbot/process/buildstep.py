@@ -175,10 +175,10 @@ class RemoteCommand(pb.Referenceable):
                 if self.active and not self.ignore_updates:
                     self.remoteUpdate(update)
             except:
-                # log failure, terminate build, let slave retire the update
+                # log failure, terminate build, let slave retire the update.
+                # Slaves batch several updates into one call, so any that
+                # follow are skipped (self.active is now False) but acked.
                 self._finished(Failure())
-                # TODO: what if multiple updates arrive? should
-                # skip the rest but ack them all
             if num > max_updatenum:
                 max_updatenum = num
         return max_updatenum
@@ -658,7 +658,7 @@ class BuildStep(properties.PropertiesMixin):
         sv = self.build.getSlaveCommandVersion(command, None)
         if sv is None:
             return True
-        if map(int, sv.split(".")) < map(int, minversion.split(".")):
+        if map(int, str(sv).split(".")) < map(int, minversion.split(".")):
             return True
         return False
 
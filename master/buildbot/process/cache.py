@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+import weakref
 from buildbot.util import lru
 from buildbot import config
 from twisted.application import service
@@ -35,6 +36,7 @@ class CacheManager(config.ReconfigurableServiceMixin, service.Service):
         self.setName('caches')
         self.config = {}
         self._caches = {}
+        self._registered = weakref.WeakKeyDictionary()
 
     def get_cache(self, cache_name, miss_fn):
         """
@@ -57,6 +59,19 @@ class CacheManager(config.ReconfigurableServiceMixin, service.Service):
             c = self._caches[cache_name] = lru.AsyncLRUCache(miss_fn, max_size)
             return c
 
+    def register_cache(self, cache_name, cache):
+        """
+        Register a cache that is managed elsewhere, such as the per-builder
+        L{LRUCache} of build status objects, so that it is included in
+        C{get_metrics}.  Any number of caches may be registered under the
+        same name; their metrics are summed.  Registered caches are only
+        weakly referenced.
+
+        @param cache_name: name of the cache
+        @param cache: L{LRUCache} or L{AsyncLRUCache} instance
+        """
+        self._registered[cache] = cache_name
+
     def reconfigService(self, new_config):
         self.config = new_config.caches
         for name, cache in self._caches.iteritems():
@@ -67,7 +82,17 @@ class CacheManager(config.ReconfigurableServiceMixin, service.Service):
                                                             new_config)
 
     def get_metrics(self):
-        return dict([
-            (n, dict(hits=c.hits, refhits=c.refhits,
-                     misses=c.misses, max_size=c.max_size))
+        metrics = dict([
+            (n, dict(hits=c.hits, refhits=c.refhits, misses=c.misses,
+                     evictions=c.evictions, size=len(c.cache),
+                     max_size=c.max_size))
             for n, c in self._caches.iteritems()])
+        for c, n in self._registered.items():
+            m = metrics.setdefault(n, dict(hits=0, refhits=0, misses=0,
+                                evictions=0, size=0, max_size=c.max_size))
+            m['hits'] += c.hits
+            m['refhits'] += c.refhits
+            m['misses'] += c.misses
+            m['evictions'] += c.evictions
+            m['size'] += len(c.cache)
+        return metrics
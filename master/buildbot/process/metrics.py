@@ -42,7 +42,7 @@ from twisted.application import service
 from buildbot import util, config
 from buildbot.util.bbcollections import defaultdict
 
-import gc, os, sys
+import gc, os, sys, bisect
 # Make use of the resource module if we can
 try:
     import resource
@@ -66,6 +66,11 @@ class MetricTimeEvent(MetricEvent):
         self.timer = timer
         self.elapsed = elapsed
 
+class MetricHistogramEvent(MetricEvent):
+    def __init__(self, histogram, value):
+        self.histogram = histogram
+        self.value = value
+
 ALARM_OK, ALARM_WARN, ALARM_CRIT = range(3)
 ALARM_TEXT = ["OK", "WARN", "CRIT"]
 
@@ -154,6 +159,60 @@ class AveragingFiniteList(FiniteList):
 
         return self.average
 
+class Histogram(object):
+    """
+    Counts of values falling into a fixed set of buckets, with upper bounds
+    running 1, 2, 5, 10, 20, 50.. from 0.0001 up to 10000; anything larger
+    lands in a final, unbounded bucket.  This keeps a summary of a
+    distribution (of query times, say) in constant space.
+    """
+
+    bounds = [ m * 10 ** e for e in range(-4, 4) for m in (1, 2, 5) ] + [ 10000 ]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def average(self):
+        if not self.count:
+            return 0
+        return float(self.total) / self.count
+
+    def percentile(self, pct):
+        """Return the upper bound of the bucket containing the given
+        percentile (or the largest value seen, if that is smaller)"""
+        if not self.count:
+            return 0
+        rank = self.count * pct / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.max)
+                break
+        return self.max
+
+    def asDict(self):
+        buckets = {}
+        for i, n in enumerate(self.buckets):
+            if n:
+                if i < len(self.bounds):
+                    buckets['<=%g' % self.bounds[i]] = n
+                else:
+                    buckets['>%g' % self.bounds[-1]] = n
+        return dict(count=self.count, total=self.total, max=self.max,
+                    buckets=buckets)
+
 class MetricHandler(object):
     def __init__(self, metrics):
         self.metrics = metrics
@@ -241,6 +300,36 @@ class MetricTimeHandler(MetricHandler):
             retval[timer] = self.get(timer)
         return dict(timers=retval)
 
+class MetricHistogramHandler(MetricHandler):
+    _histograms = None
+    def reset(self):
+        self._histograms = defaultdict(Histogram)
+
+    def handle(self, eventDict, metric):
+        self._histograms[metric.histogram].add(metric.value)
+
+    def keys(self):
+        return self._histograms.keys()
+
+    def get(self, histogram):
+        return self._histograms[histogram]
+
+    def report(self):
+        retval = []
+        for name in sorted(self.keys()):
+            h = self.get(name)
+            retval.append("Histogram %s: count=%i avg=%.3g p50=%.3g p90=%.3g "
+                          "p99=%.3g max=%.3g" % (name, h.count, h.average(),
+                            h.percentile(50), h.percentile(90),
+                            h.percentile(99), h.max))
+        return "\n".join(retval)
+
+    def asDict(self):
+        retval = {}
+        for name in sorted(self.keys()):
+            retval[name] = self.get(name).asDict()
+        return dict(histograms=retval)
+
 class MetricAlarmHandler(MetricHandler):
     _alarms = None
     def reset(self):
@@ -384,6 +473,8 @@ class MetricLogObserver(config.ReconfigurableServiceMixin,
         self.registerHandler(MetricCountEvent, MetricCountHandler(self))
         self.registerHandler(MetricTimeEvent, MetricTimeHandler(self))
         self.registerHandler(MetricAlarmEvent, MetricAlarmHandler(self))
+        self.registerHandler(MetricHistogramEvent,
+                             MetricHistogramHandler(self))
 
         # Make sure our changes poller is behaving
         self.getHandler(MetricTimeEvent).addWatcher(PollerWatcher(self))
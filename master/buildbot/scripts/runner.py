@@ -438,6 +438,15 @@ def upgradeMaster(config):
     m.move_if_present(os.path.join(basedir, "public_html/index.html"),
                         os.path.join(basedir, "templates/root.html"))
 
+    from buildbot.status import buildsummary
+    for builder_config in master_cfg.builders:
+        builder_basedir = os.path.join(basedir, builder_config.builddir)
+        if not os.path.isdir(builder_basedir):
+            continue
+        if not config['quiet']:
+            print "indexing builds for builder '%s'" % (builder_config.name,)
+        buildsummary.indexBuilds(builder_basedir)
+
     from buildbot.db import connector
     from buildbot.master import BuildMaster
 
@@ -86,6 +86,36 @@ class StatusReceiverBase:
     def checkConfig(self, otherStatusReceivers, errors):
         pass
 
+class StatusSubscriber(StatusReceiverBase):
+    """A status receiver which subscribes to the status, and to each builder
+    it is told about, until it is stopped.  Subclasses which override
+    C{builderAdded} must call this class's version."""
+
+    def __init__(self, status):
+        self.status = status
+        self.subscribed = False
+        self.builders = []
+
+    def subscribe(self):
+        if not self.subscribed:
+            self.subscribed = True
+            self.status.subscribe(self)
+
+    def stop(self):
+        if self.subscribed:
+            self.status.unsubscribe(self)
+            for builder_status in self.builders:
+                try:
+                    builder_status.unsubscribe(self)
+                except ValueError:
+                    pass
+            self.builders = []
+            self.subscribed = False
+
+    def builderAdded(self, builderName, builder):
+        self.builders.append(builder)
+        return self
+
 class StatusReceiverMultiService(StatusReceiverBase, service.MultiService,
                                  util.ComparableMixin):
 
@@ -16,7 +16,6 @@
 from __future__ import with_statement
 
 
-import weakref
 import os, re, itertools
 from cPickle import load, dump
 
@@ -25,8 +24,10 @@ from twisted.python import log, runtime
 from twisted.persisted import styles
 from buildbot.process import metrics
 from buildbot import interfaces, util
+from buildbot.util import lru
 from buildbot.status.event import Event
 from buildbot.status.build import BuildStatus
+from buildbot.status.buildsummary import BuildSummary, BuildSummaryStore
 from buildbot.status.buildrequest import BuildRequestStatus
 
 # user modules expect these symbols to be present here
@@ -78,8 +79,9 @@ class BuilderStatus(styles.Versioned):
         self.currentBuilds = []
         self.nextBuild = None
         self.watchers = []
-        self.buildCache = weakref.WeakValueDictionary()
-        self.buildCache_LRU = []
+        # the size is set from the master's config on first use
+        self.buildCache = lru.LRUCache(self._loadBuildFromDisk, 1)
+        self._summaries = None
 
     # persistence
 
@@ -91,7 +93,7 @@ class BuilderStatus(styles.Versioned):
         d = styles.Versioned.__getstate__(self)
         d['watchers'] = []
         del d['buildCache']
-        del d['buildCache_LRU']
+        d.pop('_summaries', None)
         for b in self.currentBuilds:
             b.saveYourself()
             # TODO: push a 'hey, build was interrupted' event
@@ -108,8 +110,9 @@ class BuilderStatus(styles.Versioned):
         # when loading, re-initialize the transient stuff. Remember that
         # upgradeToVersion1 and such will be called after this finishes.
         styles.Versioned.__setstate__(self, d)
-        self.buildCache = weakref.WeakValueDictionary()
-        self.buildCache_LRU = []
+        # the size is set from the master's config on first use
+        self.buildCache = lru.LRUCache(self._loadBuildFromDisk, 1)
+        self._summaries = None
         self.currentBuilds = []
         self.watchers = []
         self.slavenames = []
@@ -166,29 +169,30 @@ class BuilderStatus(styles.Versioned):
         return os.path.join(self.basedir, "%d" % number)
 
     def touchBuildCache(self, build):
-        self.buildCache[build.number] = build
-        if build in self.buildCache_LRU:
-            self.buildCache_LRU.remove(build)
-        cache_size = self.master.config.caches['Builds']
-        self.buildCache_LRU = self.buildCache_LRU[-(cache_size-1):] + [ build ]
+        self.buildCache.set_max_size(self.master.config.caches['Builds'])
+        self.buildCache.add(build.number, build)
         return build
 
+    def getSummaryStore(self):
+        if self._summaries is None:
+            self._summaries = BuildSummaryStore(self.basedir)
+        return self._summaries
+
     def getBuildByNumber(self, number):
         # first look in currentBuilds
         for b in self.currentBuilds:
             if b.number == number:
                 return self.touchBuildCache(b)
 
-        # then in the buildCache
-        try:
-            b = self.buildCache[number]
-        except KeyError:
-            metrics.MetricCountEvent.log("buildCache.misses", 1)
-        else:
+        # then in the buildCache, which falls back to loading it from disk
+        if number in self.buildCache:
             metrics.MetricCountEvent.log("buildCache.hits", 1)
-            return self.touchBuildCache(b)
+        else:
+            metrics.MetricCountEvent.log("buildCache.misses", 1)
+        self.buildCache.set_max_size(self.master.config.caches['Builds'])
+        return self.buildCache.get(number)
 
-        # then fall back to loading it from disk
+    def _loadBuildFromDisk(self, number):
         filename = self.makeBuildFilename(number)
         try:
             log.msg("Loading builder %s's build %d from on-disk pickle"
@@ -210,7 +214,7 @@ class BuilderStatus(styles.Versioned):
 
             # check that logfiles exist
             build.checkLogfiles()
-            return self.touchBuildCache(build)
+            return build
         except IOError:
             raise IndexError("no such build %d" % number)
         except EOFError:
@@ -271,6 +275,8 @@ class BuilderStatus(styles.Versioned):
                 try: os.unlink(pathname)
                 except OSError: pass
 
+        self.getSummaryStore().prune(earliest_build)
+
     # IBuilderStatus methods
     def getName(self):
         return self.name
@@ -321,7 +327,31 @@ class BuilderStatus(styles.Versioned):
         except IndexError:
             return None
 
-    def generateFinishedBuilds(self, branches=[],
+    def getBuildSummary(self, number):
+        if number < 0:
+            number = self.nextBuildNumber + number
+        if number < 0 or number >= self.nextBuildNumber:
+            return None
+
+        for b in self.currentBuilds:
+            if b.number == number:
+                return BuildSummary.fromBuildStatus(b)
+
+        store = self.getSummaryStore()
+        summary = store.get(number)
+        if summary is None:
+            # not indexed (yet); load the build itself, and index it if it
+            # is finished, so that we need not do so again
+            try:
+                build = self.getBuildByNumber(number)
+            except IndexError:
+                return None
+            summary = BuildSummary.fromBuildStatus(build)
+            if build.isFinished():
+                store.add(summary)
+        return summary
+
+    def generateFinishedBuildSummaries(self, branches=[],
                                num_builds=None,
                                max_buildnum=None,
                                finished_before=None,
@@ -332,27 +362,57 @@ class BuilderStatus(styles.Versioned):
                 break
             if Nb > max_search:
                 break
-            build = self.getBuild(-Nb)
-            if build is None:
+            summary = self.getBuildSummary(-Nb)
+            if summary is None:
                 continue
             if max_buildnum is not None:
-                if build.getNumber() > max_buildnum:
+                if summary.getNumber() > max_buildnum:
                     continue
-            if not build.isFinished():
+            if not summary.isFinished():
                 continue
             if finished_before is not None:
-                start, end = build.getTimes()
+                start, end = summary.getTimes()
                 if end >= finished_before:
                     continue
             if branches:
-                if build.getSourceStamp().branch not in branches:
+                if summary.getBranch() not in branches:
                     continue
             got += 1
-            yield build
+            yield summary
             if num_builds is not None:
                 if got >= num_builds:
                     return
 
+    def generateBuildSummaryHistory(self, before=None):
+        """Generate the summaries of all finished builds numbered below
+        C{before} (or of all finished builds, if it is None), newest first.
+        Builds that have not been indexed are loaded once, and indexed."""
+        if before is None or before > self.nextBuildNumber:
+            before = self.nextBuildNumber
+        # don't look for builds which have been pruned
+        earliest = 0
+        buildHorizon = self.master.config.buildHorizon
+        if buildHorizon is not None:
+            earliest = max(0, self.nextBuildNumber - buildHorizon)
+        for number in xrange(before - 1, earliest - 1, -1):
+            summary = self.getBuildSummary(number)
+            if summary is not None and summary.isFinished():
+                yield summary
+
+    def generateFinishedBuilds(self, branches=[],
+                               num_builds=None,
+                               max_buildnum=None,
+                               finished_before=None,
+                               max_search=200):
+        # filter using the summaries, and only load the builds that match
+        summaries = self.generateFinishedBuildSummaries(branches=branches,
+                num_builds=num_builds, max_buildnum=max_buildnum,
+                finished_before=finished_before, max_search=max_search)
+        for summary in summaries:
+            build = self.getBuild(summary.getNumber())
+            if build is not None:
+                yield build
+
     def eventGenerator(self, branches=[], categories=[], committers=[], minTime=0):
         """This function creates a generator which will provide all of this
         Builder's status events, starting with the most recent and
@@ -508,6 +568,7 @@ class BuilderStatus(styles.Versioned):
         assert s in self.currentBuilds
         s.saveYourself()
         self.currentBuilds.remove(s)
+        self.getSummaryStore().add(BuildSummary.fromBuildStatus(s))
 
         name = self.getName()
         results = s.getResults()
@@ -551,9 +612,9 @@ class BuilderStatus(styles.Versioned):
     def asDict_async(self):
         """Just like L{asDict}, but with a nonzero pendingBuilds."""
         result = self.asDict()
-        d = self.getPendingBuildRequestStatuses()
-        def combine(statuses):
-            result['pendingBuilds'] = len(statuses)
+        d = self.status.getPendingBuildRequestCounts([ self.name ])
+        def combine(counts):
+            result['pendingBuilds'] = counts[self.name]
             return result
         d.addCallback(combine)
         return d
@@ -0,0 +1,236 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os, re
+from cPickle import load
+from twisted.python import log, runtime
+from twisted.persisted import styles
+from buildbot.util import json
+
+class BuildSummary(object):
+    """
+    A compact summary of a single build: enough to answer questions like
+    "what was the result of build N" without loading the build's pickle.
+
+    The methods here mirror those of the same name on L{IBuildStatus}.  For
+    anything else (steps, logs, changes, properties), use the full
+    L{BuildStatus}, available from the builder with C{getBuild(number)}.
+    """
+
+    fields = ( 'number', 'started', 'finished', 'results', 'text', 'branch',
+               'revision', 'got_revision', 'slavename', 'reason' )
+
+    def __init__(self, number, started=None, finished=None, results=None,
+                 text=None, branch=None, revision=None, got_revision=None,
+                 slavename=None, reason=None):
+        self.number = number
+        self.started = started
+        self.finished = finished
+        self.results = results
+        self.text = text or []
+        self.branch = branch
+        self.revision = revision
+        self.got_revision = got_revision
+        self.slavename = slavename
+        self.reason = reason
+
+    @classmethod
+    def fromBuildStatus(cls, build):
+        started, finished = build.getTimes()
+        ss = build.getSourceStamp()
+        branch = revision = None
+        if ss:
+            branch, revision = ss.branch, ss.revision
+        return cls(number=build.getNumber(),
+                   started=started,
+                   finished=finished,
+                   results=build.getResults(),
+                   text=list(build.getText() or []),
+                   branch=branch,
+                   revision=revision,
+                   got_revision=build.getProperty('got_revision', None),
+                   slavename=build.getSlavename(),
+                   reason=build.getReason())
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(**dict((str(k), v) for k, v in d.iteritems()
+                          if k in cls.fields))
+
+    def asDict(self):
+        return dict((k, getattr(self, k)) for k in self.fields)
+
+    def __repr__(self):
+        return "<%s #%s>" % (self.__class__.__name__, self.number)
+
+    def __eq__(self, other):
+        return (isinstance(other, BuildSummary)
+                and self.asDict() == other.asDict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    # IBuildStatus-like methods
+
+    def getNumber(self):
+        return self.number
+
+    def getTimes(self):
+        return (self.started, self.finished)
+
+    def isFinished(self):
+        return self.finished is not None
+
+    def getResults(self):
+        return self.results
+
+    def getText(self):
+        return self.text
+
+    def getSlavename(self):
+        return self.slavename
+
+    def getReason(self):
+        return self.reason
+
+    def getBranch(self):
+        return self.branch
+
+    def getRevision(self):
+        return self.revision
+
+    def getGotRevision(self):
+        return self.got_revision
+
+
+class BuildSummaryStore(object):
+    """
+    An index of L{BuildSummary} objects for the finished builds of one
+    builder, kept in a file named C{summaries} in the builder's status
+    directory.  The file is append-only, with one JSON-encoded summary per
+    line, and is only rewritten when old builds are pruned.  It is read into
+    memory the first time it is needed.
+    """
+
+    filename = "summaries"
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.path = os.path.join(basedir, self.filename)
+        self._summaries = None
+
+    def _load(self):
+        if self._summaries is not None:
+            return
+        self._summaries = {}
+        try:
+            f = open(self.path, "rb")
+        except IOError:
+            return
+        with f:
+            for line in f:
+                try:
+                    summary = BuildSummary.fromDict(json.loads(line))
+                except ValueError:
+                    # most likely a line truncated by a crash while appending
+                    log.msg("ignoring corrupt line in %s" % (self.path,))
+                    continue
+                self._summaries[summary.number] = summary
+
+    def _encode(self, summary):
+        return json.dumps(summary.asDict()) + "\n"
+
+    def get(self, number):
+        """Get the summary for build C{number}, or None if it is not
+        indexed"""
+        self._load()
+        return self._summaries.get(number)
+
+    def getNumbers(self):
+        """Get the numbers of all indexed builds, in ascending order"""
+        self._load()
+        return sorted(self._summaries)
+
+    def add(self, summary):
+        """Add (or replace) the summary for a build, appending it to the
+        file"""
+        self._load()
+        self._summaries[summary.number] = summary
+        try:
+            with open(self.path, "ab") as f:
+                f.write(self._encode(summary))
+        except IOError:
+            log.msg("unable to add build %d to %s" % (summary.number,
+                                                      self.path))
+            log.err()
+
+    def prune(self, earliest):
+        """Remove the summaries for all builds numbered before C{earliest}"""
+        self._load()
+        old = [ n for n in self._summaries if n < earliest ]
+        if not old:
+            return
+        for n in old:
+            del self._summaries[n]
+        self.rewrite()
+
+    def rewrite(self):
+        """Rewrite the file, removing any superseded or corrupt lines"""
+        self._load()
+        tmpfilename = self.path + ".tmp"
+        try:
+            with open(tmpfilename, "wb") as f:
+                for n in sorted(self._summaries):
+                    f.write(self._encode(self._summaries[n]))
+            if runtime.platformType  == 'win32':
+                # windows cannot rename a file on top of an existing one
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+            os.rename(tmpfilename, self.path)
+        except:
+            log.msg("unable to rewrite %s" % (self.path,))
+            log.err()
+
+
+def indexBuilds(basedir, store=None):
+    """
+    Build the summary index for the builder whose status directory is
+    C{basedir} from its build pickles, replacing any existing index.  This is
+    used to upgrade existing basedirs; new builds are indexed as they finish.
+
+    @returns: the number of builds indexed
+    """
+    if store is None:
+        store = BuildSummaryStore(basedir)
+    store._summaries = {}
+
+    numbers = sorted([ int(f) for f in os.listdir(basedir)
+                       if re.match(r"^\d+$", f) ])
+    for number in numbers:
+        filename = os.path.join(basedir, "%d" % number)
+        try:
+            with open(filename, "rb") as f:
+                build = load(f)
+            styles.doUpgrade()
+        except:
+            log.msg("unable to load build pickle %s; skipping" % filename)
+            log.err()
+            continue
+        store._summaries[number] = BuildSummary.fromBuildStatus(build)
+
+    store.rewrite()
+    return len(store._summaries)
@@ -0,0 +1,248 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Block-compressed log files.
+
+A log compressed with the 'zblocks' method is stored in two files.  The data
+file (C{NN-log-name.zblocks}) is a sequence of independently zlib-compressed
+blocks, each holding a run of whole netstring chunks exactly as they appear
+in an uncompressed log file.  The index file (C{NN-log-name.zblocks.idx})
+has one fixed-size entry per chunk, giving the chunk's offset in the log's
+text, its channel, and the offset in the data file of the block containing
+it.  A final entry with channel C{END} gives the total text length and the
+length of the data file.
+
+Finding the chunk at a given text offset is a binary search of the index,
+and reading it requires decompressing only the block that contains it.
+"""
+
+import os
+import struct
+import zlib
+from bisect import bisect_right
+
+from buildbot.util import netstrings
+
+MAGIC = "BBZBLK1\n"
+ENTRY = struct.Struct(">QBQ") # text offset, channel, block offset
+END = 0xff
+
+# uncompressed size of each block; blocks always contain whole chunks, so
+# they may be a little larger than this
+BLOCKSIZE = 64*1024
+
+def _rawLength(textlen):
+    # length of the netstring encoding of a chunk with textlen bytes of text
+    size = textlen + 1 # channel digit
+    return len(str(size)) + 1 + size + 1
+
+class _ChunkCollector(netstrings.NetstringParser):
+    def stringReceived(self, line):
+        self.strings.append((int(line[0]), line[1:]))
+
+def _writeBlock(df, block):
+    data = zlib.compress("".join(block))
+    df.write(data)
+    return len(data)
+
+def writeBlockLog(infile, datafile, indexfile, blocksize=BLOCKSIZE):
+    """
+    Read an uncompressed log from the file object C{infile}, writing the
+    compressed blocks to a file named C{datafile} and the index to a file
+    named C{indexfile}.
+    """
+    p = _ChunkCollector()
+    df = open(datafile, "wb")
+    xf = open(indexfile, "wb")
+    try:
+        xf.write(MAGIC)
+        text_offset = block_offset = 0
+        block = []
+        blocklen = 0
+        bufsize = 1024*1024
+        while True:
+            buf = infile.read(bufsize)
+            p.feed(buf)
+            for channel, text in p.strings:
+                xf.write(ENTRY.pack(text_offset, channel, block_offset))
+                text_offset += len(text)
+                raw = "%d:%d%s," % (len(text) + 1, channel, text)
+                block.append(raw)
+                blocklen += len(raw)
+                if blocklen >= blocksize:
+                    block_offset += _writeBlock(df, block)
+                    block = []
+                    blocklen = 0
+            p.strings = []
+            if len(buf) < bufsize:
+                break
+        if block:
+            block_offset += _writeBlock(df, block)
+        xf.write(ENTRY.pack(text_offset, END, block_offset))
+    finally:
+        df.close()
+        xf.close()
+
+class BlockLogReader(object):
+    """
+    Random access to a block-compressed log.  Creating an instance reads the
+    whole index into memory; the compressed data is read one block at a time,
+    as needed.  The most recently used block is kept decompressed.
+
+    @ivar length: total length of the log's text (not of its encoding)
+    @ivar offsets: text offset of each chunk
+    @ivar channels: channel of each chunk
+    """
+
+    def __init__(self, datafile, indexfile):
+        """
+        @raises IOError: if either file cannot be opened or the index is not
+        valid
+        """
+        with open(indexfile, "rb") as f:
+            index = f.read()
+        if not index.startswith(MAGIC) or \
+                (len(index) - len(MAGIC)) % ENTRY.size != 0:
+            raise IOError("invalid log index %s" % (indexfile,))
+        self.datafile = datafile
+        self.f = open(datafile, "rb")
+
+        self.offsets = []
+        self.channels = []
+        self._chunkBlocks = [] # index into self._blocks, for each chunk
+        self._chunkRaw = [] # offset of each chunk in the netstring stream
+        self._blocks = [] # data file offset of each block
+        self._rawOffsets = [] # offset of each block in the netstring stream
+        raw = 0
+        unpack = ENTRY.unpack_from
+        for pos in xrange(len(MAGIC), len(index), ENTRY.size):
+            offset, channel, block = unpack(index, pos)
+            if self.offsets:
+                raw += _rawLength(offset - self.offsets[-1])
+            if channel == END:
+                break
+            if not self._blocks or self._blocks[-1] != block:
+                self._blocks.append(block)
+                self._rawOffsets.append(raw)
+            self.offsets.append(offset)
+            self.channels.append(channel)
+            self._chunkBlocks.append(len(self._blocks) - 1)
+            self._chunkRaw.append(raw)
+        else:
+            self.f.close()
+            raise IOError("truncated log index %s" % (indexfile,))
+        self.length = offset
+        self.rawLength = raw
+        self._blocks.append(block) # end of the data file
+        self._cached = (None, None)
+
+    def close(self):
+        self.f.close()
+
+    def _readBlock(self, b):
+        if self._cached[0] != b:
+            start, end = self._blocks[b], self._blocks[b+1]
+            self.f.seek(start)
+            self._cached = (b, zlib.decompress(self.f.read(end - start)))
+        return self._cached[1]
+
+    def findChunk(self, offset):
+        """Return the index of the chunk containing text offset C{offset}"""
+        return max(bisect_right(self.offsets, offset) - 1, 0)
+
+    def chunkLength(self, i):
+        if i + 1 < len(self.offsets):
+            return self.offsets[i+1] - self.offsets[i]
+        return self.length - self.offsets[i]
+
+    def getChunk(self, i):
+        """Return chunk C{i} as a (channel, text) tuple"""
+        b = self._chunkBlocks[i]
+        data = self._readBlock(b)
+        textlen = self.chunkLength(i)
+        start = (self._chunkRaw[i] - self._rawOffsets[b]
+                 + len(str(textlen + 1)) + 2)
+        return (self.channels[i], data[start:start+textlen])
+
+    def iterChunks(self, channels=[], offset=0):
+        """
+        Generate (channel, text) tuples for the chunks of this log, starting
+        with the chunk containing text offset C{offset}.  If C{channels} is
+        given, only chunks on those channels are generated.
+        """
+        start = 0
+        if offset:
+            start = self.findChunk(offset)
+        for i in xrange(start, len(self.offsets)):
+            if channels and self.channels[i] not in channels:
+                continue
+            yield self.getChunk(i)
+
+    def open(self):
+        """Return a read-only file object giving the uncompressed log, in the
+        same format as an uncompressed log file"""
+        return BlockLogFile(self)
+
+class BlockLogFile(object):
+    """
+    A seekable, read-only file-like view of the netstring encoding of a
+    block-compressed log.  Seeking costs at most one block decompression.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.pos = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.reader.rawLength
+        self.pos = max(offset, 0)
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        reader = self.reader
+        if size < 0:
+            size = reader.rawLength
+        result = []
+        while size > 0 and self.pos < reader.rawLength:
+            b = bisect_right(reader._rawOffsets, self.pos) - 1
+            data = reader._readBlock(b)
+            start = self.pos - reader._rawOffsets[b]
+            piece = data[start:start+size]
+            result.append(piece)
+            self.pos += len(piece)
+            size -= len(piece)
+        return "".join(result)
+
+    def close(self):
+        self.reader.close()
+
+def openBlockLog(filename):
+    """
+    Open the block-compressed form of the log whose uncompressed filename is
+    C{filename}.
+
+    @returns: L{BlockLogReader} instance
+    @raises IOError: if there is no block-compressed log
+    """
+    return BlockLogReader(filename + ".zblocks", filename + ".zblocks.idx")
+
+def exists(filename):
+    return os.path.exists(filename + ".zblocks.idx")
@@ -14,22 +14,37 @@
 # Copyright Buildbot Team Members
 
 import os
-from cStringIO import StringIO
 from bz2 import BZ2File
 from gzip import GzipFile
 
 from zope.interface import implements
-from twisted.python import log, runtime
+from twisted.python import log, runtime, threadpool
 from twisted.internet import defer, threads, reactor
 from buildbot.util import netstrings
 from buildbot.util.eventual import eventually
 from buildbot import interfaces
+from buildbot.status import logblocks
 
 STDOUT = interfaces.LOG_CHANNEL_STDOUT
 STDERR = interfaces.LOG_CHANNEL_STDERR
 HEADER = interfaces.LOG_CHANNEL_HEADER
 ChunkTypes = ["stdout", "stderr", "header"]
 
+# LogFileProducers read logs in a pool of threads of their own, so that
+# viewers of many large logs cannot hold up other users of the reactor's
+# thread pool
+READER_THREADS = 4
+_readerPool = None
+
+def _getReaderPool():
+    global _readerPool
+    if _readerPool is None:
+        _readerPool = threadpool.ThreadPool(minthreads=0,
+                maxthreads=READER_THREADS, name='LogReaderPool')
+        reactor.callWhenRunning(_readerPool.start)
+        reactor.addSystemEventTrigger('during', 'shutdown', _readerPool.stop)
+    return _readerPool
+
 class LogFileScanner(netstrings.NetstringParser):
     def __init__(self, chunk_cb, channels=[]):
         self.chunk_cb = chunk_cb
@@ -44,24 +59,25 @@ class LogFileScanner(netstrings.NetstringParser):
 class LogFileProducer:
     """What's the plan?
 
-    the LogFile has just one FD, used for both reading and writing.
-    Each time you add an entry, fd.seek to the end and then write.
+    the LogFile has just one FD, used for writing. Each time you add an
+    entry, fd.seek to the end and then write.
 
-    Each reader (i.e. Producer) keeps track of their own offset. The reader
-    starts by seeking to the start of the logfile, and reading forwards.
-    Between each hunk of file they yield chunks, so they must remember their
-    offset before yielding and re-seek back to that offset before reading
-    more data. When their read() returns EOF, they're finished with the first
-    phase of the reading (everything that's already been written to disk).
+    Each reader (i.e. Producer) opens its own handle on the logfile and
+    keeps track of their own offset. The reader starts at the start of the
+    logfile, and reads forwards. The reads from disk (and any decompression)
+    are done in a small pool of threads, one read at a time for each reader,
+    and the parsed chunks are handed to the consumer in the reactor thread.
+    When a read reaches the end of what has been written so far, they're
+    finished with the first phase of the reading (everything that's already
+    been written to disk).
 
     After EOF, the remaining data is entirely in the current entries list.
     These entries are all of the same channel, so we can do one "".join and
-    obtain a single chunk to be sent to the listener. But since that involves
-    a yield, and more data might arrive after we give up control, we have to
-    subscribe them before yielding. We can't subscribe them any earlier,
-    otherwise they'd get data out of order.
+    obtain a single chunk to be sent to the listener. We subscribe them in the
+    same reactor turn, so no data can arrive in between. We can't subscribe
+    them any earlier, otherwise they'd get data out of order.
 
-    We're using a generator in the first place so that the listener can
+    We're reading in steps in the first place so that the listener can
     throttle us, which means they're pulling. But the subscription means
     we're pushing. Really we're a Producer. In the first phase we can be
     either a PullProducer or a PushProducer. In the second phase we're only a
@@ -73,35 +89,105 @@ class LogFileProducer:
     except that writeChunk() takes chunks (tuples of (channel,text)) instead
     of the normal write() which takes just text. The LogFileConsumer is
     allowed to call stopProducing, pauseProducing, and resumeProducing on the
-    producer instance it is given. """
+    producer instance it is given. The next read is not started until the
+    chunks from the last one have been written, so pausing stops the reading,
+    too. Each read is twice as large as the last, up to MAXBUFFERSIZE, as
+    long as the consumer keeps up. """
 
     paused = False
     subscribed = False
-    BUFFERSIZE = 2048
+    BUFFERSIZE = 16*1024
+    MAXBUFFERSIZE = 1024*1024
 
     def __init__(self, logfile, consumer):
         self.logfile = logfile
         self.consumer = consumer
-        self.chunkGenerator = self.getChunks()
+        self.chunks = [] # parsed, but not yet written
+        self.reading = False
+        self.caughtUp = False
+        self.eof = False
+        self.file = None
+        self.offset = 0
+        self.bufsize = self.BUFFERSIZE
+        self.parsed = []
+        self.scanner = LogFileScanner(self.parsed.append)
         consumer.registerProducer(self, True)
 
-    def getChunks(self):
-        f = self.logfile.getFile()
-        offset = 0
-        chunks = []
-        p = LogFileScanner(chunks.append)
-        f.seek(offset)
-        data = f.read(self.BUFFERSIZE)
-        offset = f.tell()
-        while data:
-            p.dataReceived(data)
-            while chunks:
-                c = chunks.pop(0)
-                yield c
-            f.seek(offset)
-            data = f.read(self.BUFFERSIZE)
-            offset = f.tell()
-        del f
+    def _produce(self):
+        while self.chunks and not self.paused and self.consumer:
+            self.consumer.writeChunk(self.chunks.pop(0))
+        if self.chunks or self.paused or self.reading or self.caughtUp \
+                or not self.consumer:
+            return
+
+        openfile = self.logfile.openfile
+        if openfile:
+            # the log is still being written, so read up to its current end.
+            # Nothing can be written to it between this check and the
+            # subscription in _caughtUp.
+            openfile.flush()
+            if self.offset < os.fstat(openfile.fileno()).st_size:
+                self._read(self.logfile.getFilename())
+            else:
+                self._caughtUp()
+        elif not self.eof:
+            self._read(None)
+        else:
+            self._caughtUp()
+
+    def _read(self, filename):
+        self.reading = True
+        d = threads.deferToThreadPool(reactor, _getReaderPool(),
+                self._readThd, filename, self.bufsize)
+        def eb(f):
+            log.err(f, "while reading %s" % self.logfile.getFilename())
+            self.reading = False
+            # give them what we have, rather than waiting forever
+            self.logfileFinished(self.logfile)
+        d.addCallbacks(self._readDone, eb)
+
+    def _readThd(self, filename, bufsize):
+        # this runs in a thread, but only one of them runs at a time
+        if not self.file:
+            if filename:
+                # open a handle of our own for a log that is being written
+                self.file = open(filename, "r")
+            else:
+                self.file = self.logfile.getFile()
+        if filename:
+            # clear any EOF seen before more data was written
+            self.file.seek(self.offset)
+        data = self.file.read(bufsize)
+        self.offset += len(data)
+        if not data:
+            self.eof = True
+        else:
+            self.scanner.dataReceived(data)
+        chunks = self.parsed[:]
+        del self.parsed[:]
+        return chunks
+
+    def _readDone(self, chunks):
+        self.reading = False
+        if not self.consumer:
+            self._closeFile()
+            return
+        if chunks:
+            self.chunks.extend(chunks)
+        if not self.paused:
+            self.bufsize = min(self.bufsize * 2, self.MAXBUFFERSIZE)
+        else:
+            self.bufsize = max(self.bufsize / 2, self.BUFFERSIZE)
+        self._produce()
+
+    def _closeFile(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _caughtUp(self):
+        self.caughtUp = True
+        self._closeFile()
 
         # now subscribe them to receive new entries
         self.subscribed = True
@@ -112,12 +198,10 @@ class LogFileProducer:
         if self.logfile.runEntries:
             channel = self.logfile.runEntries[0][0]
             text = "".join([c[1] for c in self.logfile.runEntries])
-            yield (channel, text)
+            self.consumer.writeChunk((channel, text))
 
         # now we've caught up to the present. Anything further will come from
-        # the logfile subscription. We add the callback *after* yielding the
-        # data from runEntries, because the logfile might have finished
-        # during the yield.
+        # the logfile subscription.
         d.addCallback(self.logfileFinished)
 
     def stopProducing(self):
@@ -127,8 +211,9 @@ class LogFileProducer:
         self.done()
 
     def done(self):
-        if self.chunkGenerator:
-            self.chunkGenerator = None # stop making chunks
+        self.chunks = [] # stop making chunks
+        if not self.reading:
+            self._closeFile()
         if self.subscribed:
             self.logfile.watchers.remove(self)
             self.subscribed = False
@@ -149,19 +234,9 @@ class LogFileProducer:
 
     def _resumeProducing(self):
         self.paused = False
-        if not self.chunkGenerator:
-            return
-        try:
-            while not self.paused:
-                chunk = self.chunkGenerator.next()
-                self.consumer.writeChunk(chunk)
-                # we exit this when the consumer says to stop, or we run out
-                # of chunks
-        except StopIteration:
-            # if the generator finished, it will have done releaseFile
-            self.chunkGenerator = None
-        # now everything goes through the subscription, and they don't get to
-        # pause anymore
+        # once we've caught up, everything goes through the subscription, and
+        # they don't get to pause anymore
+        self._produce()
 
     def logChunk(self, build, step, logfile, channel, chunk):
         if self.consumer:
@@ -200,7 +275,7 @@ class LogFile:
     maxLengthExceeded = False
     runEntries = [] # provided so old pickled builds will getChunks() ok
     entries = None
-    BUFFERSIZE = 2048
+    BUFFERSIZE = 64*1024
     filename = None # relative to the Builder's basedir
     openfile = None
 
@@ -252,6 +327,7 @@ class LogFile:
         """
         return os.path.exists(self.getFilename() + '.bz2') or \
             os.path.exists(self.getFilename() + '.gz') or \
+            logblocks.exists(self.getFilename()) or \
             os.path.exists(self.getFilename())
 
     def getName(self):
@@ -307,6 +383,9 @@ class LogFile:
             return self.openfile
         # otherwise they get their own read-only handle
         # try a compressed log first
+        reader = self.getBlockReader()
+        if reader:
+            return reader.open()
         try:
             return BZ2File(self.getFilename() + ".bz2", "r")
         except IOError:
@@ -317,6 +396,24 @@ class LogFile:
             pass
         return open(self.getFilename(), "r")
 
+    def getBlockReader(self):
+        """
+        Get a L{logblocks.BlockLogReader} for this log, if it has been
+        compressed with the 'zblocks' method.  Such logs can be read starting
+        from any offset without decompressing the data before it.
+
+        @returns: L{logblocks.BlockLogReader} instance, or None
+        """
+        if self.openfile or not logblocks.exists(self.getFilename()):
+            return None
+        try:
+            return logblocks.openBlockLog(self.getFilename())
+        except IOError:
+            log.msg("unable to read block-compressed log %s"
+                    % self.getFilename())
+            log.err()
+            return None
+
     def getText(self):
         # this produces one ginormous string
         return "".join(self.getChunks([STDOUT, STDERR], onlyText=True))
@@ -337,6 +434,10 @@ class LogFile:
         # data, you must insure that nothing will be added to the log during
         # yield() calls.
 
+        reader = self.getBlockReader()
+        if reader:
+            return self._generateBlockChunks(reader, channels, onlyText)
+
         f = self.getFile()
         if not self.finished:
             offset = 0
@@ -392,15 +493,155 @@ class LogFile:
             else:
                 yield leftover
 
+    def _generateBlockChunks(self, reader, channels, onlyText):
+        for channel, text in reader.iterChunks(channels):
+            if onlyText:
+                yield text
+            else:
+                yield (channel, text)
+        reader.close()
+
+    # random access to the log's text, for serving parts of large logs.
+    # Offsets count only the text on the requested channels.
+
+    def _getSpans(self, channels):
+        # generate (channel, length, read) for each chunk on the given
+        # channels, where read() returns the chunk's text.  This reads as
+        # little of the log as it can: just the index of a block-compressed
+        # log, or the netstring headers of an uncompressed log.
+        reader = self.getBlockReader()
+        if reader:
+            try:
+                for i in xrange(len(reader.offsets)):
+                    if channels and reader.channels[i] not in channels:
+                        continue
+                    yield (reader.channels[i], reader.chunkLength(i),
+                           lambda i=i: reader.getChunk(i)[1])
+            finally:
+                reader.close()
+            return
+
+        f = self._getSeekableFile()
+        if not f:
+            # a stream-compressed log can't be seeked without decompressing
+            # everything before the seek point, so just read it through
+            for channel, text in self.getChunks(channels):
+                yield (channel, len(text), lambda text=text: text)
+            return
+
+        f.seek(0, 2)
+        end = f.tell()
+        leftover = self._getLeftover(channels)
+        try:
+            for channel, pos, length in _scanChunks(f, end):
+                if channels and channel not in channels:
+                    continue
+                def read(pos=pos, length=length):
+                    f.seek(pos)
+                    return f.read(length)
+                yield (channel, length, read)
+        finally:
+            self._releaseSeekableFile(f)
+        if leftover:
+            yield (leftover[0], len(leftover[1]), lambda: leftover[1])
+
+    def _getSeekableFile(self):
+        # get the uncompressed log file, or None if the log is compressed
+        if self.openfile:
+            return self.openfile
+        if os.path.exists(self.getFilename() + '.bz2') or \
+                os.path.exists(self.getFilename() + '.gz'):
+            return None
+        return open(self.getFilename(), "r")
+
+    def _releaseSeekableFile(self, f):
+        if f is self.openfile:
+            # leave the write position at the end of the file
+            f.seek(0, 2)
+        else:
+            f.close()
+
+    def _getLeftover(self, channels):
+        # the not-yet-merged data, as a (channel, text) tuple
+        if self.runEntries and (not channels or
+                                (self.runEntries[0][0] in channels)):
+            return (self.runEntries[0][0],
+                    "".join([c[1] for c in self.runEntries]))
+        return None
+
+    def getTextLength(self, channels=[]):
+        spans = self._getSpans(channels)
+        total = sum([ length for channel, length, read in spans ])
+        spans.close()
+        return total
+
+    def getRange(self, offset, length, channels=[]):
+        chunks = []
+        pos = 0
+        end = offset + length
+        spans = self._getSpans(channels)
+        for channel, size, read in spans:
+            if pos >= end:
+                break
+            if pos + size > offset:
+                text = read()
+                chunks.append((channel, text[max(offset - pos, 0):end - pos]))
+            pos += size
+        spans.close()
+        return chunks
+
+    def getTail(self, size, channels=[], lines=False):
+        if size <= 0:
+            return []
+        reader = self.getBlockReader()
+        if reader:
+            def chunks():
+                try:
+                    for i in xrange(len(reader.offsets) - 1, -1, -1):
+                        if channels and reader.channels[i] not in channels:
+                            continue
+                        yield reader.getChunk(i)
+                finally:
+                    reader.close()
+            return _tailChunks(chunks(), size, lines)
+
+        f = self._getSeekableFile()
+        if not f:
+            # read through a stream-compressed log, keeping only as many
+            # chunks as are needed to make up the tail
+            kept = []
+            for chunk in self.getChunks(channels):
+                kept.append(chunk)
+                if len(kept) > 1 and _tailCovered(kept[1:], size, lines):
+                    del kept[0]
+            kept.reverse()
+            return _tailChunks(kept, size, lines)
+
+        f.seek(0, 2)
+        end = f.tell()
+        leftover = self._getLeftover(channels)
+        def chunks():
+            if leftover:
+                yield leftover
+            try:
+                for channel, text in _scanChunksBackward(f, end):
+                    if channels and channel not in channels:
+                        continue
+                    yield (channel, text)
+            finally:
+                self._releaseSeekableFile(f)
+        return _tailChunks(chunks(), size, lines)
+
     def readlines(self, channel=STDOUT):
         """Return an iterator that produces newline-terminated lines,
-        excluding header chunks."""
-        # TODO: make this memory-efficient, by turning it into a generator
-        # that retrieves chunks as necessary, like a pull-driven version of
-        # twisted.protocols.basic.LineReceiver
-        alltext = "".join(self.getChunks([channel], onlyText=True))
-        io = StringIO(alltext)
-        return io.readlines()
+        excluding header chunks.  C{channel} may also be a list of channels,
+        in which case the lines of each channel are put together separately,
+        and produced in the order in which they end."""
+        if isinstance(channel, (list, tuple)):
+            channels = channel
+        else:
+            channels = [channel]
+        return _iterLines(self.getChunks(channels))
 
     def subscribe(self, receiver, catchup):
         if self.finished:
@@ -572,18 +813,26 @@ class LogFile:
         logCompressionMethod = self.master.config.logCompressionMethod
         # bail out if there's no compression support
         if logCompressionMethod == "bz2":
-            compressed = self.getFilename() + ".bz2.tmp"
+            suffixes = [ ".bz2" ]
         elif logCompressionMethod == "gz":
-            compressed = self.getFilename() + ".gz.tmp"
+            suffixes = [ ".gz" ]
+        elif logCompressionMethod == "zblocks":
+            # the data file is renamed first, so the log is never seen
+            # with an index but no data
+            suffixes = [ ".zblocks", ".zblocks.idx" ]
         else:
             return defer.succeed(None)
+        compressed = [ self.getFilename() + s + ".tmp" for s in suffixes ]
 
         def _compressLog():
             infile = self.getFile()
+            if logCompressionMethod == "zblocks":
+                logblocks.writeBlockLog(infile, compressed[0], compressed[1])
+                return
             if logCompressionMethod == "bz2":
-                cf = BZ2File(compressed, 'w')
+                cf = BZ2File(compressed[0], 'w')
             elif logCompressionMethod == "gz":
-                cf = GzipFile(compressed, 'w')
+                cf = GzipFile(compressed[0], 'w')
             bufsize = 1024*1024
             while True:
                 buf = infile.read(bufsize)
@@ -594,25 +843,24 @@ class LogFile:
         d = threads.deferToThread(_compressLog)
 
         def _renameCompressedLog(rv):
-            if logCompressionMethod == "bz2":
-                filename = self.getFilename() + '.bz2'
-            else:
-                filename = self.getFilename() + '.gz'
-            if runtime.platformType  == 'win32':
-                # windows cannot rename a file on top of an existing one, so
-                # fall back to delete-first. There are ways this can fail and
-                # lose the builder's history, so we avoid using it in the
-                # general (non-windows) case
-                if os.path.exists(filename):
-                    os.unlink(filename)
-            os.rename(compressed, filename)
+            for suffix, tmpfilename in zip(suffixes, compressed):
+                filename = self.getFilename() + suffix
+                if runtime.platformType  == 'win32':
+                    # windows cannot rename a file on top of an existing one,
+                    # so fall back to delete-first. There are ways this can
+                    # fail and lose the builder's history, so we avoid using
+                    # it in the general (non-windows) case
+                    if os.path.exists(filename):
+                        os.unlink(filename)
+                os.rename(tmpfilename, filename)
             _tryremove(self.getFilename(), 1, 5)
         d.addCallback(_renameCompressedLog)
 
         def _cleanupFailedCompress(failure):
             log.msg("failed to compress %s" % self.getFilename())
-            if os.path.exists(compressed):
-                _tryremove(compressed, 1, 5)
+            for tmpfilename in compressed:
+                if os.path.exists(tmpfilename):
+                    _tryremove(tmpfilename, 1, 5)
             failure.trap() # reraise the failure
         d.addErrback(_cleanupFailedCompress)
         return d
@@ -683,6 +931,128 @@ class HTMLLogFile:
         return d
 
 
+def _iterLines(chunks):
+    # generate the lines in a sequence of (channel, text) chunks, reading only
+    # as many chunks as necessary.  A line may be split over several chunks,
+    # with chunks of other channels in between.
+    partial = {}
+    for channel, text in chunks:
+        lines = text.split("\n")
+        if len(lines) > 1:
+            if channel in partial:
+                lines[0] = "".join(partial.pop(channel)) + lines[0]
+            for line in lines[:-1]:
+                yield line + "\n"
+        if lines[-1]:
+            partial.setdefault(channel, []).append(lines[-1])
+    for channel in sorted(partial):
+        yield "".join(partial[channel])
+
+def _scanChunks(f, end):
+    # generate (channel, text offset, text length) for each chunk of the
+    # netstring-encoded log in f, up to file offset end, reading only the
+    # netstring headers
+    pos = 0
+    while pos < end:
+        f.seek(pos)
+        header = f.read(12)
+        colon = header.find(":")
+        if colon < 1:
+            break
+        size = int(header[:colon])
+        if pos + colon + size + 2 > end:
+            break
+        yield (int(header[colon+1]), pos + colon + 2, size - 1)
+        pos += colon + size + 2
+
+def _findLastChunk(buf, end, bufstart, verify=True):
+    # find the chunk that ends at buf[end], where buf begins at file offset
+    # bufstart.  Netstrings can't be parsed backward unambiguously, so look
+    # for the last header whose length spans exactly to the end, and which
+    # directly follows the end of another chunk; with verify, that other
+    # chunk must be found in the same way.  Returns (file offset, channel,
+    # text), or None if buf does not reach back far enough to tell.
+    if buf[end-1:end] != ",":
+        return None
+    colon = end - 1
+    while True:
+        colon = buf.rfind(":", 0, colon)
+        if colon < 0:
+            return None
+        size = end - colon - 2
+        digits = str(size)
+        start = colon - len(digits)
+        if start <= 0 and bufstart > 0:
+            return None
+        if start < 0 or buf[start:colon] != digits:
+            continue
+        if start > 0 and buf[start-1] != ",":
+            continue
+        if not buf[colon+1:colon+2].isdigit():
+            continue
+        if verify and start > 0 and \
+                not _findLastChunk(buf, start, bufstart, False):
+            continue
+        return (bufstart + start, int(buf[colon+1]), buf[colon+2:end-1])
+
+def _scanChunksBackward(f, end, window=64*1024):
+    # generate (channel, text) for each chunk of the netstring-encoded log
+    # in f, last chunk first, starting with the chunk that ends at file
+    # offset end
+    while end > 0:
+        size = window
+        while True:
+            start = max(end - size, 0)
+            f.seek(start)
+            buf = f.read(end - start)
+            found = _findLastChunk(buf, len(buf), start)
+            if found or start == 0:
+                break
+            size *= 2
+        if not found:
+            log.msg("unable to parse log backward from offset %d" % end)
+            return
+        end, channel, text = found
+        yield (channel, text)
+
+def _tailCovered(chunks, size, lines):
+    # true if chunks hold at least the last size bytes or lines of a log
+    if lines:
+        # one extra newline, in case the log ends with one
+        return sum([ text.count("\n") for c, text in chunks ]) > size
+    return sum([ len(text) for c, text in chunks ]) >= size
+
+def _tailChunks(chunks, size, lines):
+    # given chunks in reverse order, return the chunks (in forward order)
+    # holding the last size bytes or lines of the text
+    result = []
+    remaining = size
+    last = True
+    for channel, text in chunks:
+        if lines:
+            cut = len(text)
+            if last and text.endswith("\n"):
+                # a newline at the very end of the log doesn't start a line
+                cut -= 1
+            while remaining:
+                cut = text.rfind("\n", 0, cut)
+                if cut < 0:
+                    break
+                remaining -= 1
+            if not remaining:
+                text = text[cut+1:]
+        else:
+            if len(text) >= remaining:
+                text = text[len(text)-remaining:]
+            remaining -= len(text)
+        if text:
+            last = False
+            result.append((channel, text))
+        if not remaining:
+            break
+    result.reverse()
+    return result
+
 def _tryremove(filename, timeout, retries):
     """Try to remove a file, and if failed, try again in timeout.
     Increases the timeout by a factor of 4, and only keeps trying for
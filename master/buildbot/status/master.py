@@ -44,6 +44,7 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         self._builder_observers = bbcollections.KeyedSets()
         self._buildreq_observers = bbcollections.KeyedSets()
         self._buildset_finished_waiters = bbcollections.KeyedSets()
+        self._pending_count_waiters = None
 
     # service management
 
@@ -213,6 +214,30 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         """
         return self.botmaster.builders[name].builder_status
 
+    def getPendingBuildRequestCounts(self, buildernames=None):
+        if buildernames is None:
+            buildernames = self.getBuilderNames()
+        d = defer.Deferred()
+        d.addCallback(lambda counts :
+                dict((name, counts.get(name, 0)) for name in buildernames))
+        # callers arriving while a query is outstanding share its result, so
+        # a page asking for each of its builders in turn makes one query
+        if self._pending_count_waiters is not None:
+            self._pending_count_waiters.append(d)
+            return d
+        # the list must be in place before the query, which may fire at once
+        self._pending_count_waiters = [ d ]
+        db_d = self.master.db.buildrequests.getUnclaimedBuildRequestCounts()
+        db_d.addBoth(self._gotPendingBuildRequestCounts)
+        return d
+
+    def _gotPendingBuildRequestCounts(self, result):
+        waiters = self._pending_count_waiters
+        self._pending_count_waiters = None
+        for d in waiters:
+            # result may be a Failure, in which case this errbacks
+            d.callback(result)
+
     def getSlaveNames(self):
         return self.botmaster.slaves.keys()
 
@@ -341,6 +366,7 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         builder_status.basedir = os.path.join(self.basedir, basedir)
         builder_status.name = name # it might have been updated
         builder_status.status = self
+        self.master.caches.register_cache('Builds', builder_status.buildCache)
 
         if not os.path.isdir(builder_status.basedir):
             os.makedirs(builder_status.basedir)
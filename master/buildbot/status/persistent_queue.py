@@ -18,9 +18,17 @@ from __future__ import with_statement
 
 from collections import deque
 import os
+import struct
 import cPickle as pickle
 
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
 from zope.interface import implements, Interface
+from twisted.python import runtime
 
 
 def ReadFile(path):
@@ -124,19 +132,34 @@ class MemoryQueue(object):
 
 
 class DiskQueue(object):
-    """Keeps a list of abstract items and serializes it to the disk.
-
-    Use pickle for serialization."""
+    """Keeps a list of abstract items in an append-only log on disk.
+
+    The items are pickled into records, each prefixed by its length, which are
+    appended to segment files of about segmentSize bytes.  Items are read a
+    whole segment at a time, and a segment is removed once all its items have
+    been popped.  Items inserted back are written to a new segment before the
+    first one.  A small index file records the segments and where the first
+    item starts; it is rewritten when items are popped or inserted back, and on
+    save(), but not for each item pushed, so a restart only has to check the
+    last segments for items pushed since.  Once the queue is empty, all its
+    files are removed.
+
+    fsync may be 'never', to leave the data to the OS, 'segment', to sync each
+    segment as it is filled and the index whenever it is written, or 'always',
+    to sync each item pushed as well."""
     implements(IQueue)
 
     def __init__(self, path, maxItems=None, pickleFn=pickle.dumps,
-                 unpickleFn=pickle.loads):
+                 unpickleFn=pickle.loads, segmentSize=2**20, fsync='never'):
         """
         @path: directory to save the items.
         @maxItems: maximum number of items to keep on disk, flush the
         older ones.
         @pickleFn: function used to pack the items to disk.
         @unpickleFn: function used to unpack items from disk.
+        @segmentSize: size in bytes after which a new segment file is started.
+        @fsync: when to sync the files to disk: 'never', 'segment' or
+        'always'.
         """
         self.path = path
         self._maxItems = maxItems
@@ -146,29 +169,30 @@ class DiskQueue(object):
             os.mkdir(self.path)
         self.pickleFn = pickleFn
         self.unpickleFn = unpickleFn
+        self.segmentSize = segmentSize
+        if fsync not in ('never', 'segment', 'always'):
+            raise ValueError("fsync must be 'never', 'segment' or 'always'")
+        self.fsync = fsync
 
         # Total number of items.
         self._nbItems = 0
-        # The actual items id start at one.
-        self.firstItemId = 0
-        self.lastItemId = 0
+        # [segment number, offset of its first item], oldest first; items
+        # are appended to the last one.
+        self._segments = deque()
+        self._tailSize = 0
+        self._writer = None
+        # The unread part of the first segment.
+        self._buf = None
+        self._bufPos = 0
         self._loadFromDisk()
 
     def pushItem(self, item):
         ret = None
-        if self._nbItems == self._maxItems:
-            id = self._findNext(self.firstItemId)
-            path = os.path.join(self.path, str(id))
-            ret = self.unpickleFn(ReadFile(path))
-            os.remove(path)
-            self.firstItemId = id + 1
-        else:
-            self._nbItems += 1
-        self.lastItemId += 1
-        path = os.path.join(self.path, str(self.lastItemId))
-        if os.path.exists(path):
-            raise IOError('%s already exists.' % path)
-        WriteFile(path, self.pickleFn(item))
+        if self._nbItems >= self._maxItems:
+            ret = self._dropOldest(self._nbItems - self._maxItems + 1)
+        self._append([self.pickleFn(item)])
+        if self.fsync == 'always':
+            self._sync(self._writer)
         return ret
 
     def insertBackChunk(self, chunk):
@@ -177,40 +201,48 @@ class DiskQueue(object):
         if excess > 0:
             ret = chunk[0:excess]
             chunk = chunk[excess:]
-        for i in reversed(chunk):
-            self.firstItemId -= 1
-            path = os.path.join(self.path, str(self.firstItemId))
+        if not chunk:
+            return ret
+        records = [self.pickleFn(i) for i in chunk]
+        if not self._nbItems:
+            self._append(records)
+        else:
+            number = self._segments[0][0] - 1
+            path = self._segmentPath(number)
             if os.path.exists(path):
                 raise IOError('%s already exists.' % path)
-            WriteFile(path, self.pickleFn(i))
-            self._nbItems += 1
+            with open(path, 'wb') as f:
+                f.write(''.join([self._encode(r) for r in records]))
+                if self.fsync != 'never':
+                    self._sync(f)
+            self._segments.appendleft([number, 0])
+            self._buf = None
+            self._nbItems += len(records)
+        self._writeIndex()
         return ret
 
     def popChunk(self, nbItems=None):
         if nbItems is None:
             nbItems = self._maxItems
         ret = []
-        for i in range(nbItems):
-            if self._nbItems == 0:
-                break
-            id = self._findNext(self.firstItemId)
-            path = os.path.join(self.path, str(id))
-            ret.append(self.unpickleFn(ReadFile(path)))
-            os.remove(path)
+        while len(ret) < nbItems and self._nbItems:
+            ret.append(self.unpickleFn(self._readRecord()))
             self._nbItems -= 1
-            self.firstItemId = id + 1
+        if ret:
+            self._writeIndex()
         return ret
 
     def save(self):
-        pass
+        if self._nbItems:
+            self._writeIndex()
 
     def items(self):
         """Warning, very slow."""
+        self._flush()
         ret = []
-        for id in range(self.firstItemId, self.lastItemId + 1):
-            path = os.path.join(self.path, str(id))
-            if os.path.exists(path):
-                ret.append(self.unpickleFn(ReadFile(path)))
+        for number, offset in self._segments:
+            records, end = self._decode(self._readSegment(number, offset))
+            ret.extend([self.unpickleFn(r) for r in records])
         return ret
 
     def nbItems(self):
@@ -221,30 +253,220 @@ class DiskQueue(object):
 
     #### Protected functions
 
-    def _findNext(self, id):
-        while True:
-            path = os.path.join(self.path, str(id))
-            if os.path.isfile(path):
-                return id
-            id += 1
-        return None
+    def _segmentPath(self, number):
+        return os.path.join(self.path, 'segment.%d' % number)
+
+    def _encode(self, record):
+        return struct.pack('>I', len(record)) + record
+
+    def _decode(self, buf):
+        """Returns the complete records in buf, and where they end."""
+        records = []
+        pos = 0
+        while pos + 4 <= len(buf):
+            (length,) = struct.unpack('>I', buf[pos:pos + 4])
+            if pos + 4 + length > len(buf):
+                break
+            records.append(buf[pos + 4:pos + 4 + length])
+            pos += 4 + length
+        return records, pos
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _readSegment(self, number, offset):
+        with open(self._segmentPath(number), 'rb') as f:
+            f.seek(offset)
+            return f.read()
+
+    def _append(self, records):
+        for record in records:
+            record = self._encode(record)
+            if (not self._segments or (self._tailSize and
+                    self._tailSize + len(record) > self.segmentSize)):
+                self._startSegment()
+            self._writer.write(record)
+            self._tailSize += len(record)
+            self._nbItems += 1
+        self._writer.flush()
+
+    def _startSegment(self):
+        if self._segments:
+            number = self._segments[-1][0] + 1
+        else:
+            number = 0
+        self._closeWriter()
+        self._segments.append([number, 0])
+        self._tailSize = 0
+        self._writer = open(self._segmentPath(number), 'ab')
+        # The first segment may have been read while it was still written to.
+        self._buf = None
+
+    def _closeWriter(self):
+        if self._writer is not None:
+            if self.fsync != 'never':
+                self._sync(self._writer)
+            self._writer.close()
+            self._writer = None
+
+    def _flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _readRecord(self):
+        """Removes the first record and returns it."""
+        while self._buf is None or self._bufPos == len(self._buf):
+            number, offset = self._segments[0]
+            if len(self._segments) == 1:
+                self._flush()
+            self._buf = self._readSegment(number, offset)
+            self._bufPos = 0
+            if not self._buf:
+                if len(self._segments) == 1:
+                    raise IOError('%s is truncated.' %
+                                  self._segmentPath(number))
+                self._removeFirstSegment()
+        pos = self._bufPos
+        (length,) = struct.unpack('>I', self._buf[pos:pos + 4])
+        record = self._buf[pos + 4:pos + 4 + length]
+        if len(record) != length:
+            raise IOError('%s is truncated.' %
+                          self._segmentPath(self._segments[0][0]))
+        self._bufPos += 4 + length
+        self._segments[0][1] += 4 + length
+        # Segments other than the last are not written to any more, so once
+        # their items are read they can go.
+        if self._bufPos == len(self._buf) and len(self._segments) > 1:
+            self._removeFirstSegment()
+        return record
+
+    def _dropOldest(self, nbItems):
+        """Removes the oldest nbItems items, and returns the last of them.  The
+        index is rewritten, so that they do not come back after a restart."""
+        for i in range(nbItems):
+            record = self._readRecord()
+            self._nbItems -= 1
+        self._writeIndex()
+        return self.unpickleFn(record)
+
+    def _removeFirstSegment(self):
+        number, offset = self._segments.popleft()
+        os.remove(self._segmentPath(number))
+        self._buf = None
+
+    def _writeIndex(self):
+        """Records the segments, or removes all the files once the queue is
+        empty."""
+        if not self._nbItems:
+            self._closeWriter()
+            for number, offset in self._segments:
+                os.remove(self._segmentPath(number))
+            self._segments = deque()
+            self._tailSize = 0
+            self._buf = None
+            path = os.path.join(self.path, 'index')
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        if self.fsync == 'never':
+            self._flush()
+        elif self._writer is not None:
+            self._sync(self._writer)
+        path = os.path.join(self.path, 'index')
+        tmppath = path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            json.dump({'segments': list(self._segments),
+                       'tailSize': self._tailSize,
+                       'nbItems': self._nbItems}, f)
+            if self.fsync != 'never':
+                self._sync(f)
+        if runtime.platformType == 'win32':
+            # windows cannot rename a file on top of an existing one
+            if os.path.exists(path):
+                os.unlink(path)
+        os.rename(tmppath, path)
 
     def _loadFromDisk(self):
-        """Loads the queue from disk upto self.maxMemoryItems items into
-        self.items.
-        """
+        """Finds the segments and counts the items, checking only the
+        segments written to since the index was last written.  Items left by
+        older versions, one file per item, are moved into segments."""
         def SafeInt(item):
             try:
                 return int(item)
             except ValueError:
                 return None
 
-        files = filter(None, [SafeInt(x) for x in os.listdir(self.path)])
-        files.sort()
-        self._nbItems = len(files)
-        if self._nbItems:
-            self.firstItemId = files[0]
-            self.lastItemId = files[-1]
+        segments = {}
+        legacy = []
+        for name in os.listdir(self.path):
+            if name.startswith('segment.'):
+                number = SafeInt(name[len('segment.'):])
+                if number is not None:
+                    segments[number] = name
+            elif SafeInt(name) is not None:
+                legacy.append(int(name))
+
+        index = {'segments': [], 'tailSize': 0, 'nbItems': 0}
+        path = os.path.join(self.path, 'index')
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                index = json.load(f)
+        self._segments = deque([list(s) for s in index['segments']])
+        self._nbItems = index['nbItems']
+        self._tailSize = index['tailSize']
+        known = [number for number, offset in self._segments]
+        if (not known or [n for n in known if n not in segments] or
+                os.path.getsize(self._segmentPath(known[-1])) <
+                    self._tailSize):
+            # No usable index: count the items of every segment.
+            self._segments = deque()
+            self._nbItems = 0
+            self._tailSize = 0
+            known = []
+        for number in sorted(segments):
+            if known and number < known[-1]:
+                if number not in known:
+                    # Left over from a crash before the index was written.
+                    os.remove(self._segmentPath(number))
+                continue
+            offset = 0
+            if known and number == known[-1]:
+                offset = self._tailSize
+            self._scanSegment(number, offset)
+
+        if self._nbItems > self._maxItems:
+            # Left over from a larger maxItems.
+            self._dropOldest(self._nbItems - self._maxItems)
+
+        if legacy:
+            legacy.sort()
+            self._append([ReadFile(os.path.join(self.path, str(id)))
+                          for id in legacy])
+            self._writeIndex()
+            for id in legacy:
+                os.remove(os.path.join(self.path, str(id)))
+
+    def _scanSegment(self, number, offset):
+        """Counts the items of a segment from offset, dropping any partly
+        written last item, and makes it the last segment."""
+        path = self._segmentPath(number)
+        buf = self._readSegment(number, offset)
+        records, end = self._decode(buf)
+        if end < len(buf):
+            with open(path, 'r+b') as f:
+                f.truncate(offset + end)
+        start = 0
+        if self._segments and self._segments[-1][0] == number:
+            start = self._segments.pop()[1]
+        elif not offset and not records:
+            os.remove(path)
+            return
+        self._segments.append([number, start])
+        self._nbItems += len(records)
+        self._tailSize = offset + end
+        self._closeWriter()
+        self._writer = open(path, 'ab')
 
 
 class PersistentQueue(object):
@@ -20,7 +20,10 @@ from __future__ import with_statement
 
 Implements the HTTP receiver."""
 
+from collections import deque
+from cStringIO import StringIO
 import datetime
+import gzip
 import os
 import urllib
 import urlparse
@@ -31,13 +34,21 @@ try:
 except ImportError:
     import json
 
+from buildbot.process import metrics
 from buildbot.status.base import StatusReceiverMultiService
 from buildbot.status.persistent_queue import DiskQueue, IndexedQueue, \
         MemoryQueue, PersistentQueue
 from buildbot.status.web.status_json import FilterOut
-from twisted.internet import defer, reactor
+from twisted.internet import defer, protocol, reactor
 from twisted.python import log
-from twisted.web import client
+from twisted.web import client, error, http_headers, iweb
+from zope.interface import implements
+
+try:
+    from twisted.web.client import HTTPConnectionPool
+except ImportError:
+    # persistent connections need Twisted-12.1.0
+    HTTPConnectionPool = None
 
 
 
@@ -322,12 +333,85 @@ class StatusPush(StatusReceiverMultiService):
         self.push('slaveDisconnected', slavename=slavename)
 
 
+def GzipString(data):
+    """Returns data, gzip-compressed."""
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def EventAge(packet):
+    """Returns how many seconds ago an event was pushed."""
+    try:
+        when = datetime.datetime.strptime(packet['timestamp'].split('.')[0],
+                                          '%Y-%m-%d %H:%M:%S')
+    except (KeyError, ValueError):
+        return 0
+    delta = datetime.datetime.utcnow() - when
+    return delta.days * 86400 + delta.seconds
+
+
+class StringProducer(object):
+    """Produces a request body which is already in memory."""
+    implements(iweb.IBodyProducer)
+
+    def __init__(self, body):
+        self.body = body
+        self.length = len(body)
+
+    def startProducing(self, consumer):
+        consumer.write(self.body)
+        return defer.succeed(None)
+
+    def pauseProducing(self):
+        pass
+
+    def resumeProducing(self):
+        pass
+
+    def stopProducing(self):
+        pass
+
+
+class DiscardBody(protocol.Protocol):
+    """Reads a response body, so that its connection can be used again, and
+    fires finished once it has been read."""
+
+    def __init__(self, finished):
+        self.finished = finished
+
+    def dataReceived(self, data):
+        pass
+
+    def connectionLost(self, reason):
+        self.finished.callback(None)
+
+
+class HttpBatch(object):
+    """Events sent in a single HTTP POST."""
+
+    def __init__(self, items, size):
+        self.items = items
+        self.size = size
+        self.done = False
+        self.failure = None
+
+
 class HttpStatusPush(StatusPush):
-    """Event streamer to a HTTP server."""
+    """Event streamer to a HTTP server.
+
+    Up to maxInFlight batches of events are sent at once, each as soon as
+    chunkSize events are queued, or after bufferDelay otherwise.  They are
+    acknowledged in the order they were sent: if a batch fails, its events and
+    those of all the batches sent after it are queued again, so the server may
+    receive some events twice, but never out of order with the events before
+    them.  Packet ids can be used to drop the duplicates."""
 
     def __init__(self, serverUrl, debug=None, maxMemoryItems=None,
                  maxDiskItems=None, chunkSize=200, maxHttpRequestSize=2**20,
-                 **kwargs):
+                 fsync='never', compress=False, maxInFlight=1, **kwargs):
         """
         @serverUrl: Base URL to be used to push events notifications.
         @maxMemoryItems: Maximum number of items to keep queued in memory.
@@ -337,6 +421,10 @@ class HttpStatusPush(StatusPush):
         @chunkSize: maximum number of items to send in each at each HTTP POST.
         @maxHttpRequestSize: limits the size of encoded data for AE, the default
         is 1MB.
+        @fsync: when the disk queue syncs its files to disk: 'never',
+        'segment' or 'always'.
+        @compress: gzip the requests, sent with 'Content-Encoding: gzip'.
+        @maxInFlight: maximum number of HTTP POSTs waiting for their response.
         """
         # Parameters.
         self.serverUrl = serverUrl
@@ -344,13 +432,25 @@ class HttpStatusPush(StatusPush):
         self.chunkSize = chunkSize
         self.lastPushWasSuccessful = True
         self.maxHttpRequestSize = maxHttpRequestSize
+        self.compress = compress
+        self.maxInFlight = maxInFlight
+        # Batches sent and not yet acknowledged, oldest first.
+        self.inFlight = deque()
+        if HTTPConnectionPool is not None:
+            self.pool = HTTPConnectionPool(reactor)
+            self.pool.maxPersistentPerHost = maxInFlight
+            self.agent = client.Agent(reactor, pool=self.pool)
+        else:
+            self.pool = None
+            self.agent = client.Agent(reactor)
         if maxDiskItems != 0:
             # The queue directory is determined by the server url.
             path = ('events_' +
                     urlparse.urlparse(self.serverUrl)[1].split(':')[0])
             queue = PersistentQueue(
                         primaryQueue=MemoryQueue(maxItems=maxMemoryItems),
-                        secondaryQueue=DiskQueue(path, maxItems=maxDiskItems))
+                        secondaryQueue=DiskQueue(path, maxItems=maxDiskItems,
+                                                 fsync=fsync))
         else:
             path = None
             queue = MemoryQueue(maxItems=maxMemoryItems)
@@ -359,71 +459,152 @@ class HttpStatusPush(StatusPush):
         StatusPush.__init__(self, serverPushCb=HttpStatusPush.pushHttp,
                             queue=queue, path=path, **kwargs)
 
+    def stopService(self):
+        d = StatusPush.stopService(self)
+        if self.pool is not None:
+            d.addBoth(lambda _ : self.pool.closeCachedConnections())
+        return d
+
     def wasLastPushSuccessful(self):
         return self.lastPushWasSuccessful
 
+    def push(self, event, **objs):
+        d = StatusPush.push(self, event, **objs)
+        # Don't wait for bufferDelay once there is a full batch to send.
+        if (self.queue.nbItems() >= self.chunkSize and
+                len(self.inFlight) < self.maxInFlight and
+                self.wasLastPushSuccessful() and not self.stopped):
+            self.sendBatch()
+        return d
+
+    def encodeItem(self, item):
+        if self.debug:
+            packet = json.dumps(item, indent=2, sort_keys=True)
+        else:
+            packet = json.dumps(item, separators=(',',':'))
+        return urllib.quote_plus(packet)
+
     def popChunk(self):
         """Pops items from the pending list.
 
-        They must be queued back on failure."""
+        Each item is encoded once, and as many items are sent as fit in
+        maxHttpRequestSize.  They must be queued back on failure."""
         if self.wasLastPushSuccessful():
             chunkSize = self.chunkSize
         else:
             chunkSize = 1
 
+        prefix = 'packets=' + urllib.quote_plus('[')
+        suffix = urllib.quote_plus(']')
+        separator = urllib.quote_plus(',')
         while True:
             items = self.queue.popChunk(chunkSize)
-            if self.debug:
-                packets = json.dumps(items, indent=2, sort_keys=True)
-            else:
-                packets = json.dumps(items, separators=(',',':'))
-            data = urllib.urlencode({'packets': packets})
-            if (not self.maxHttpRequestSize or
-                len(data) < self.maxHttpRequestSize):
-                return (data, items)
-
-            if chunkSize == 1:
-                # This packet is just too large. Drop this packet.
-                log.msg("ERROR: packet %s was dropped, too large: %d > %d" %
-                        (items[0]['id'], len(data), self.maxHttpRequestSize))
-                chunkSize = self.chunkSize
-            else:
-                # Try with half the packets.
-                chunkSize /= 2
-                self.queue.insertBackChunk(items)
+            if not items:
+                return ('', [])
+            packets = []
+            size = len(prefix) + len(suffix)
+            for item in items:
+                packet = self.encodeItem(item)
+                size += len(packet) + (packets and len(separator) or 0)
+                if (self.maxHttpRequestSize and
+                        size >= self.maxHttpRequestSize):
+                    break
+                packets.append(packet)
+            if packets:
+                self.queue.insertBackChunk(items[len(packets):])
+                return (prefix + separator.join(packets) + suffix,
+                        items[:len(packets)])
+
+            # This packet is just too large. Drop this packet.
+            log.msg("ERROR: packet %s was dropped, too large: %d > %d" %
+                    (items[0]['id'], size, self.maxHttpRequestSize))
+            self.queue.insertBackChunk(items[1:])
 
     def pushHttp(self):
-        """Do the HTTP POST to the server."""
+        """Do the HTTP POSTs to the server, up to maxInFlight at once, or
+        only one while the server is failing."""
+        dl = []
+        while (self.queue.nbItems() and len(self.inFlight) < self.maxInFlight):
+            dl.append(self.sendBatch())
+            if not self.wasLastPushSuccessful():
+                break
+        return defer.DeferredList(dl)
+
+    def sendBatch(self):
+        """POST the next batch of items."""
         (encoded_packets, items) = self.popChunk()
-
-        def Success(result):
-            """Queue up next push."""
-            log.msg('Sent %d events to %s' % (len(items), self.serverUrl))
-            self.lastPushWasSuccessful = True
-            return self.queueNextServerPush()
-
-        def Failure(result):
-            """Insert back items not sent and queue up next push."""
-            # Server is now down.
-            log.msg('Failed to push %d events to %s: %s' %
-                    (len(items), self.serverUrl, str(result)))
-            self.queue.insertBackChunk(items)
-            if self.stopped:
-                # Bad timing, was being called on shutdown and the server died
-                # on us. Make sure the queue is saved since we just queued back
-                # items.
-                self.queue.save()
-            self.lastPushWasSuccessful = False
-            return self.queueNextServerPush()
+        if not items:
+            return defer.succeed(None)
+        headers = {'Content-Type': ['application/x-www-form-urlencoded'],
+                   'User-Agent': ['buildbot']}
+        if self.compress:
+            encoded_packets = GzipString(encoded_packets)
+            headers['Content-Encoding'] = ['gzip']
+        batch = HttpBatch(items, len(encoded_packets))
+        self.inFlight.append(batch)
+        metrics.MetricCountEvent.log('HttpStatusPush.queued',
+                                     self.queue.nbItems(), absolute=True)
+
+        def CheckResponse(response):
+            finished = defer.Deferred()
+            response.deliverBody(DiscardBody(finished))
+            if not 200 <= response.code < 300:
+                def Fail(_):
+                    raise error.Error(response.code, response.phrase)
+                finished.addCallback(Fail)
+            return finished
 
         # Trigger the HTTP POST request.
-        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        connection = client.getPage(self.serverUrl,
-                                    method='POST',
-                                    postdata=encoded_packets,
-                                    headers=headers,
-                                    agent='buildbot')
-        connection.addCallbacks(Success, Failure)
-        return connection
+        d = self.agent.request('POST', self.serverUrl,
+                               http_headers.Headers(headers),
+                               StringProducer(encoded_packets))
+        d.addCallback(CheckResponse)
+        d.addCallbacks(lambda _ : self.batchDone(batch, None),
+                       lambda f : self.batchDone(batch, f))
+        return d
+
+    def batchDone(self, batch, failure):
+        """Acknowledge the batches sent before, and including, this one, and
+        queue up the next push."""
+        if batch not in self.inFlight:
+            # Its items were queued again when an earlier batch failed.
+            return
+        batch.done = True
+        batch.failure = failure
+        while self.inFlight and self.inFlight[0].done:
+            batch = self.inFlight[0]
+            if batch.failure is not None:
+                self.batchFailed(batch.failure)
+                break
+            self.inFlight.popleft()
+            log.msg('Sent %d events to %s' % (len(batch.items),
+                                              self.serverUrl))
+            metrics.MetricCountEvent.log('HttpStatusPush.events_sent',
+                                         len(batch.items))
+            metrics.MetricCountEvent.log('HttpStatusPush.bytes_sent',
+                                         batch.size)
+            metrics.MetricTimeEvent.log('HttpStatusPush.lag',
+                                        EventAge(batch.items[0]))
+            self.lastPushWasSuccessful = True
+        metrics.MetricCountEvent.log('HttpStatusPush.queued',
+                                     self.queue.nbItems(), absolute=True)
+        return self.queueNextServerPush()
+
+    def batchFailed(self, failure):
+        """Insert back the items of all the batches not acknowledged yet."""
+        # Server is now down.
+        items = []
+        for batch in self.inFlight:
+            items.extend(batch.items)
+        self.inFlight.clear()
+        log.msg('Failed to push %d events to %s: %s' %
+                (len(items), self.serverUrl, str(failure)))
+        self.queue.insertBackChunk(items)
+        if self.stopped:
+            # Bad timing, was being called on shutdown and the server died
+            # on us. Make sure the queue is saved since we just queued back
+            # items.
+            self.queue.save()
+        self.lastPushWasSuccessful = False
 
 # vim: set ts=4 sts=4 sw=4 et:
@@ -37,6 +37,7 @@ from buildbot.status.web.builder import BuildersResource
 from buildbot.status.web.buildstatus import BuildStatusStatusResource
 from buildbot.status.web.slaves import BuildSlavesResource
 from buildbot.status.web.status_json import JsonStatusResource
+from buildbot.status.web.events import EventsResource
 from buildbot.status.web.about import AboutBuildbot
 from buildbot.status.web.authz import Authz
 from buildbot.status.web.auth import AuthFailResource,AuthzFailResource, LoginResource, LogoutResource
@@ -91,6 +92,8 @@ class WebStatus(service.MultiService):
      /one_line_per_build : summarize the last few builds, one line each
      /one_line_per_build/BUILDERNAME : same, but only for a single builder
      /about : describe this buildmaster (Buildbot and support library versions)
+     /events : status events as they happen, as server-sent events
+     /events/poll : the same events, by long polling
      /change_hook[/DIALECT] : accepts changes from external sources, optionally
                               choosing the dialect that will be permitted
                               (i.e. github format, etc..)
@@ -320,6 +323,8 @@ class WebStatus(service.MultiService):
 
         # create the web site page structure
         self.childrenToBeAdded = {}
+        # the status subscribers of the pages, stopped with this service
+        self.statusCaches = []
         self.setupUsualPages(numbuilds=numbuilds, num_events=num_events,
                              num_events_max=num_events_max)
 
@@ -360,6 +365,7 @@ class WebStatus(service.MultiService):
         self.putChild("one_line_per_build",
                       OneLinePerBuild(numbuilds=numbuilds))
         self.putChild("about", AboutBuildbot())
+        self.putChild("events", EventsResource())
         self.putChild("authfail", AuthFailResource())
         self.putChild("authzfail", AuthzFailResource())
         self.putChild("users", UsersResource())
@@ -473,7 +479,9 @@ class WebStatus(service.MultiService):
         if "atom" in self.provide_feeds:
             root.putChild("atom", Atom10StatusResource(status))
         if "json" in self.provide_feeds:
-            root.putChild("json", JsonStatusResource(status))
+            json_resource = JsonStatusResource(status)
+            self.addStatusCache(json_resource.jsonCache)
+            root.putChild("json", json_resource)
 
         self.site.resource = root
 
@@ -481,10 +489,17 @@ class WebStatus(service.MultiService):
         """This behaves a lot like root.putChild() . """
         self.childrenToBeAdded[name] = child_resource
 
+    def addStatusCache(self, cache):
+        """Stop the given L{buildbot.status.base.StatusSubscriber} when this
+        service stops."""
+        self.statusCaches.append(cache)
+
     def registerChannel(self, channel):
         self.channels[channel] = 1 # weakrefs
 
     def stopService(self):
+        for cache in self.statusCaches:
+            cache.stop()
         for channel in self.channels:
             try:
                 channel.transport.loseConnection()
@@ -476,16 +476,7 @@ class BuildersResource(HtmlResource):
         branches = [b for b in req.args.get("branch", []) if b]
 
         # get counts of pending builds for each builder
-        brstatus_ds = []
-        brcounts = {}
-        def keep_count(statuses, builderName):
-            brcounts[builderName] = len(statuses)
-        for builderName in builders:
-            builder_status = status.getBuilder(builderName)
-            d = builder_status.getPendingBuildRequestStatuses()
-            d.addCallback(keep_count, builderName)
-            brstatus_ds.append(d)
-        yield defer.gatherResults(brstatus_ds)
+        brcounts = yield status.getPendingBuildRequestCounts(builders)
 
         cxt['branches'] = branches
         bs = cxt['builders'] = []
@@ -14,17 +14,20 @@
 # Copyright Buildbot Team Members
 
 import time
+import copy
 import operator
 import re
 import urllib
 from twisted.internet import defer
 from buildbot import util
-from buildbot.status import builder
+from buildbot.status import base, builder
 from buildbot.status.web.base import HtmlResource
 from buildbot.changes import changes
 
 class DoesNotPassFilter(Exception): pass # Used for filtering revs
 
+stripHtml = re.compile(r'<.*?>')
+
 def getResultsClass(results, prevResults, inProgress):
     """Given the current and past results, return the class that will be used
     by the css to display the right color for a box."""
@@ -86,6 +89,121 @@ class DevBuild:
         self.details = details
         self.when = build.getTimes()[0]
         self.source = build.getSourceStamp()
+        self.changes = list(build.getChanges() or [])
+
+
+class DevBuildList(list):
+    """The DevBuilds for one builder, newest first, with the boxes already
+    worked out for each revision, as (introducedIn, firstNotIn) pairs."""
+
+    def __init__(self, builds=[]):
+        list.__init__(self, builds)
+        self.boxes = {}
+
+
+class ConsoleBuildCache(base.StatusSubscriber):
+    """The console's revision x builder matrix.
+
+    This keeps the DevBuilds of the most recent finished builds of each
+    builder (at most maxBuilds of them), newest first, adding to them as
+    builds finish, so that they need not be read from disk and examined on
+    every page load.  It also keeps the DevBuildList for each builder that
+    has no running builds, with the boxes that have been worked out for it,
+    until the builder starts or finishes a build, or a change arrives."""
+
+    maxBuilds = 100
+
+    def __init__(self, status, makeDevBuild):
+        base.StatusSubscriber.__init__(self, status)
+        self.makeDevBuild = makeDevBuild
+        # builderName -> list of (number, DevBuild or None), newest first
+        self.history = {}
+        # builderName -> number of the next older build to load, or None
+        self.nextOlder = {}
+        # builderName -> { (lastRevision, numBuilds) : DevBuildList }
+        self.rows = {}
+        self.subscribe()
+
+    def iterFinishedBuilds(self, builder_status):
+        """Generate (number, DevBuild) pairs for the finished builds of this
+        builder, newest first, loading older builds as they are needed.  The
+        DevBuild is None for builds without a usable revision."""
+        name = builder_status.getName()
+        if name not in self.history:
+            self.history[name] = []
+            build = builder_status.getBuild(-1)
+            # HACK: Work around #601, the head build may be None if it is
+            # locked.
+            if build is None:
+                build = builder_status.getBuild(-2)
+            self.nextOlder[name] = build and build.getNumber()
+        history = self.history[name]
+
+        for entry in history[:]:
+            yield entry
+
+        number = self.nextOlder[name]
+        while number is not None and number >= 0:
+            build = builder_status.getBuild(number)
+            if build is None:
+                older = None
+            else:
+                older = number - 1
+            # only add to the history while it is not full, and nothing has
+            # been skipped
+            caching = (self.nextOlder[name] == number
+                       and len(history) < self.maxBuilds)
+            if caching:
+                self.nextOlder[name] = older
+            # running builds are added by the caller
+            if build is not None and build.isFinished():
+                entry = (number, self.makeDevBuild(name, build))
+                if caching:
+                    history.append(entry)
+                yield entry
+            number = older
+
+    def getRow(self, builderName, key):
+        return self.rows.get(builderName, {}).get(key)
+
+    def setRow(self, builderName, key, builds):
+        rows = self.rows.setdefault(builderName, {})
+        if len(rows) > 10:
+            rows.clear()
+        rows[key] = builds
+
+    # IStatusReceiver methods
+
+    def builderRemoved(self, builderName):
+        self.history.pop(builderName, None)
+        self.nextOlder.pop(builderName, None)
+        self.rows.pop(builderName, None)
+
+    def buildStarted(self, builderName, build):
+        self.rows.pop(builderName, None)
+
+    def buildFinished(self, builderName, build, results):
+        self.rows.pop(builderName, None)
+        if builderName not in self.history:
+            return
+        history = self.history[builderName]
+        number = build.getNumber()
+        # builds can finish out of order, so insert this one in its place
+        i = 0
+        while i < len(history) and history[i][0] > number:
+            i += 1
+        if i == len(history) and self.nextOlder[builderName] is not None \
+                and number <= self.nextOlder[builderName]:
+            # this build will be loaded with the older ones
+            return
+        history.insert(i, (number, self.makeDevBuild(builderName, build)))
+        if len(history) > self.maxBuilds:
+            del history[self.maxBuilds:]
+            self.nextOlder[builderName] = history[-1][0] - 1
+
+    def changeAdded(self, change):
+        # the boxes depend on the revisions shown
+        self.rows.clear()
 
 
 class ConsoleStatusResource(HtmlResource):
@@ -97,6 +215,7 @@ class ConsoleStatusResource(HtmlResource):
         HtmlResource.__init__(self)
 
         self.status = None
+        self.buildCache = None
 
         if orderByTime:
             self.comparator = TimeRevisionComparator()
@@ -114,6 +233,13 @@ class ConsoleStatusResource(HtmlResource):
     def getChangeManager(self, request):
         return request.site.buildbot_service.parent.change_svc
 
+    def getBuildCache(self, request):
+        if self.buildCache is None:
+            self.buildCache = ConsoleBuildCache(self.getStatus(request),
+                                                self.makeDevBuild)
+            request.site.buildbot_service.addStatusCache(self.buildCache)
+        return self.buildCache
+
     ##
     ## Data gathering functions
     ##
@@ -187,8 +313,9 @@ class ConsoleStatusResource(HtmlResource):
 
         defer.returnValue(allChanges)
 
-    def getBuildDetails(self, request, builderName, build):
-        """Returns an HTML list of failures for a given build."""
+    def getBuildDetails(self, builderName, build):
+        """Returns an HTML list of failures for a given build.  The logs are
+        given by their path relative to the console; see linkDetails."""
         details = {}
         if not build.getLogs():
             return details
@@ -199,7 +326,6 @@ class ConsoleStatusResource(HtmlResource):
                 name = step.getName()
 
                 # Remove html tags from the error text.
-                stripHtml = re.compile(r'<.*?>')
                 strippedDetails = stripHtml.sub('', ' '.join(step.getText()))
                 
                 details['buildername'] = builderName
@@ -210,68 +336,104 @@ class ConsoleStatusResource(HtmlResource):
                 if step.getLogs():
                     for log in step.getLogs():
                         logname = log.getName()
-                        logurl = request.childLink(
-                          "../builders/%s/builds/%s/steps/%s/logs/%s" % 
+                        logpath = ("../builders/%s/builds/%s/steps/%s/logs/%s" %
                             (urllib.quote(builderName),
                              build.getNumber(),
                              urllib.quote(name),
                              urllib.quote(logname)))
-                        logs.append(dict(url=logurl, name=logname))
+                        logs.append(dict(path=logpath, name=logname))
         return details
 
+    def linkDetails(self, request, details):
+        """Return a copy of the details from getBuildDetails, with the URL of
+        each log."""
+        details = details.copy()
+        details['logs'] = [ dict(url=request.childLink(l['path']),
+                                 name=l['name'])
+                            for l in details.get('logs', []) ]
+        return details
+
+    def makeDevBuild(self, builderName, build):
+        """Return the DevBuild for a build, or None if it does not have a
+        revision."""
+        # Get the last revision in this build.
+        # We first try "got_revision", but if it does not work, then
+        # we try "revision".
+        got_rev = build.getProperty("got_revision", build.getProperty("revision", -1))
+        if got_rev != -1 and not self.comparator.isValidRevision(got_rev):
+            got_rev = -1
+
+        # We ignore all builds that don't have last revisions.
+        # TODO(nsylvain): If the build is over, maybe it was a problem
+        # with the update source step. We need to find a way to tell the
+        # user that his change might have broken the source update.
+        if got_rev == -1:
+            return None
+        details = self.getBuildDetails(builderName, build)
+        return DevBuild(got_rev, build, details)
+
     def getBuildsForRevision(self, request, builder, builderName, lastRevision,
                              numBuilds, debugInfo):
         """Return the list of all the builds for a given builder that we will
         need to be able to display the console page. We start by the most recent
         build, and we go down until we find a build that was built prior to the
-        last change we are interested in."""
+        last change we are interested in.
+
+        Finished builds come from the build cache, and so are only read from
+        disk once."""
 
-        revision = lastRevision 
+        revision = lastRevision
+        cache = self.getBuildCache(request)
 
-        builds = []
-        build = self.getHeadBuild(builder)
+        # running builds are still changing, so they are not cached
+        running = [ (build.getNumber(), self.makeDevBuild(builderName, build))
+                    for build in builder.getCurrentBuilds() ]
+        running.sort(key=operator.itemgetter(0), reverse=True)
+
+        def allBuilds():
+            for entry in cache.iterFinishedBuilds(builder):
+                while running and running[0][0] > entry[0]:
+                    yield running.pop(0)
+                yield entry
+            for entry in running:
+                yield entry
+
+        builds = DevBuildList()
         number = 0
-        while build and number < numBuilds:
+        for buildNumber, devBuild in allBuilds():
+            if number >= numBuilds:
+                break
             debugInfo["builds_scanned"] += 1
             number += 1
 
-            # Get the last revision in this build.
-            # We first try "got_revision", but if it does not work, then
-            # we try "revision".
-            got_rev = build.getProperty("got_revision", build.getProperty("revision", -1))
-            if got_rev != -1 and not self.comparator.isValidRevision(got_rev):
-                got_rev = -1
-
-            # We ignore all builds that don't have last revisions.
-            # TODO(nsylvain): If the build is over, maybe it was a problem
-            # with the update source step. We need to find a way to tell the
-            # user that his change might have broken the source update.
-            if got_rev != -1:
-                details = self.getBuildDetails(request, builderName, build)
-                devBuild = DevBuild(got_rev, build, details)
+            if devBuild is not None:
                 builds.append(devBuild)
 
                 # Now break if we have enough builds.
-                current_revision = self.getChangeForBuild(
-                    build, revision)
+                current_revision = self.getChangeForDevBuild(
+                    devBuild, revision)
                 if self.comparator.isRevisionEarlier(
                     devBuild, current_revision):
                     break
 
-            build = build.getPreviousBuild()
-
         return builds
 
-    def getChangeForBuild(self, build, revision):
-        if not build or not build.getChanges(): # Forced build
-            return DevBuild(revision, build, None)
-        
-        for change in build.getChanges():
+    def getChangeForDevBuild(self, devBuild, revision):
+        """Returns the change of this DevBuild with the given revision, or its
+        last change if it has none.  Forced builds have no changes, so a copy
+        of the DevBuild with that revision is returned instead."""
+        if not devBuild.changes: # Forced build
+            forced = copy.copy(devBuild)
+            forced.revision = revision
+            forced.details = None
+            return forced
+
+        for change in devBuild.changes:
             if change.revision == revision:
                 return change
 
         # No matching change, return the last change in build.
-        changes = list(build.getChanges())
+        changes = devBuild.changes[:]
         changes.sort(key=self.comparator.getSortingKey())
         return changes[-1]
     
@@ -295,6 +457,7 @@ class ConsoleStatusResource(HtmlResource):
         builderList = dict()
 
         debugInfo["builds_scanned"] = 0
+        cache = self.getBuildCache(request)
         # Get all the builders.
         builderNames = status.getBuilderNames()[:]
         for builderName in builderNames:
@@ -319,13 +482,20 @@ class ConsoleStatusResource(HtmlResource):
 
             # Append this builder to the dictionary of builders.
             builderList[category].append(builderName)
-            # Set the list of builds for this builder.
-            allBuilds[builderName] = self.getBuildsForRevision(request,
-                                                               builder,
-                                                               builderName,
-                                                               lastRevision,
-                                                               numBuilds,
-                                                               debugInfo)
+            # Set the list of builds for this builder.  If it has no running
+            # builds, the list is kept until it starts or finishes one.
+            key = (lastRevision, numBuilds)
+            builds = cache.getRow(builderName, key)
+            if builds is None:
+                builds = self.getBuildsForRevision(request,
+                                                   builder,
+                                                   builderName,
+                                                   lastRevision,
+                                                   numBuilds,
+                                                   debugInfo)
+                if not builder.getCurrentBuilds():
+                    cache.setRow(builderName, key, builds)
+            allBuilds[builderName] = builds
 
         return (builderList, allBuilds)
 
@@ -427,17 +597,25 @@ class ConsoleStatusResource(HtmlResource):
             
             # Display the boxes for each builder in this category.
             for builder in builderList[category]:
-                introducedIn = None
-                firstNotIn = None
+                builds = allBuilds[builder]
+                boxes = getattr(builds, 'boxes', {})
+                key = (revision.revision, revision.when)
+                if key in boxes:
+                    introducedIn, firstNotIn = boxes[key]
+                else:
+                    introducedIn = None
+                    firstNotIn = None
+
+                    # Find the first build that does not include the
+                    # revision.
+                    for build in builds:
+                        if self.comparator.isRevisionEarlier(build, revision):
+                            firstNotIn = build
+                            break
+                        else:
+                            introducedIn = build
+                    boxes[key] = (introducedIn, firstNotIn)
 
-                # Find the first build that does not include the revision.
-                for build in allBuilds[builder]:
-                    if self.comparator.isRevisionEarlier(build, revision):
-                        firstNotIn = build
-                        break
-                    else:
-                        introducedIn = build
-                        
                 # Get the results of the first build with the revision, and the
                 # first build that does not include the revision.
                 results = None
@@ -561,7 +739,7 @@ class ConsoleStatusResource(HtmlResource):
                                             revision,
                                             debugInfo)
             r['builds'] = builds
-            r['details'] = details
+            r['details'] = [ self.linkDetails(request, d) for d in details ]
 
             # Calculate the td span for the comment and the details.
             r["span"] = len(builderList) + 2            
@@ -0,0 +1,422 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""Push status events to web clients, as server-sent events or by long
+polling, so that they need not poll the status pages."""
+
+import collections
+
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+from zope.interface import implements
+from twisted.internet import interfaces, reactor, task
+from twisted.web import resource, server
+
+from buildbot.status import base
+
+
+def RequestArgList(request, name):
+    """Returns the values of a request argument, which may be given several
+    times, or as a comma-separated list."""
+    values = []
+    for arg in request.args.get(name, []):
+        values.extend([ v for v in arg.split(',') if v ])
+    return values
+
+
+class Event(object):
+    """A status event, encoded once for all of the clients it is sent to."""
+
+    def __init__(self, id, name, builderName, payload):
+        self.id = id
+        self.name = name
+        self.builderName = builderName
+        self.data = json.dumps(payload, sort_keys=True, separators=(',',':'))
+
+    def asJson(self):
+        return '{"id":%d,"event":%s,"payload":%s}' % (self.id,
+                json.dumps(self.name), self.data)
+
+
+class EventClient(object):
+    """A web client of an L{EventStream}: its request, and which events it
+    wants.  Events about a builder are only sent if the client asked for
+    that builder, or for no builder in particular."""
+
+    def __init__(self, stream, request, events=[], builders=[], logs=False):
+        self.stream = stream
+        self.request = request
+        self.events = events
+        self.builders = builders
+        self.logs = logs
+
+    def wants(self, event):
+        if event.name == 'logChunk' and not self.logs:
+            return False
+        if self.events and event.name not in self.events:
+            return False
+        if (self.builders and event.builderName is not None
+                and event.builderName not in self.builders):
+            return False
+        return True
+
+    def send(self, event):
+        raise NotImplementedError
+
+    def finish(self):
+        raise NotImplementedError
+
+    def disconnected(self):
+        self.stream.removeClient(self)
+
+
+class StreamClient(EventClient):
+    """Writes events to a C{text/event-stream} response as they happen.
+
+    While the connection is not keeping up, the client's events are kept in a
+    buffer of at most C{maxBuffer} events.  If older events have to be
+    dropped, a C{dropped} event giving their number is sent before the rest,
+    so that the client knows to reload the status it shows."""
+    implements(interfaces.IPushProducer)
+
+    maxBuffer = 100
+
+    def __init__(self, stream, request, **kwargs):
+        EventClient.__init__(self, stream, request, **kwargs)
+        self.paused = False
+        self.buffer = collections.deque()
+        self.dropped = 0
+
+    def start(self):
+        self.request.registerProducer(self, True)
+        # some browsers only fire their first event once they have seen a
+        # little of the response
+        self.request.write(':\n\n')
+
+    def send(self, event):
+        if self.paused or self.buffer:
+            self.buffer.append(event)
+            if len(self.buffer) > self.maxBuffer:
+                self.buffer.popleft()
+                self.dropped += 1
+        else:
+            self.write(event)
+
+    def write(self, event):
+        self.request.write('id: %d\nevent: %s\ndata: %s\n\n'
+                           % (event.id, event.name, event.data))
+
+    def writeDropped(self, count=None):
+        if count is None:
+            data = '{}'
+        else:
+            data = '{"count":%d}' % count
+        self.request.write('event: dropped\ndata: %s\n\n' % data)
+
+    def keepAlive(self):
+        # a comment, so that proxies do not time out an idle stream
+        if not self.paused:
+            self.request.write(':\n\n')
+
+    def finish(self):
+        self.request.unregisterProducer()
+        self.request.finish()
+
+    # IPushProducer methods, called by the connection
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self.dropped:
+            self.writeDropped(self.dropped)
+            self.dropped = 0
+        while self.buffer and not self.paused:
+            self.write(self.buffer.popleft())
+
+    def stopProducing(self):
+        self.stream.removeClient(self)
+
+
+class PollClient(EventClient):
+    """Answers a long poll with the first event it wants, or with no events
+    after C{timeout} seconds.  A client which has fallen behind gets at most
+    C{maxEvents} events at a time."""
+
+    maxEvents = 100
+
+    def __init__(self, stream, request, timeout=30, **kwargs):
+        EventClient.__init__(self, stream, request, **kwargs)
+        self.done = False
+        self.timer = stream._reactor.callLater(timeout, self.finish)
+
+    def send(self, event):
+        self.respond([ event ])
+
+    def finish(self):
+        self.respond([])
+
+    def disconnected(self):
+        EventClient.disconnected(self)
+        self.done = True
+        if self.timer.active():
+            self.timer.cancel()
+
+    def respond(self, events, missed=False):
+        if self.done:
+            return
+        self.disconnected()
+        events = events[:self.maxEvents]
+        if events:
+            last = events[-1].id
+        else:
+            last = self.stream.getLastId()
+        self.request.write('{"events":[%s],"last":%d,"missed":%s}'
+                % (','.join([ e.asJson() for e in events ]), last,
+                   json.dumps(missed)))
+        self.request.finish()
+
+
+class EventStream(base.StatusSubscriber):
+    """Subscribes to the status once for all web clients, and sends each of
+    them the events it wants, encoded as JSON.
+
+    The last C{maxEvents} events are kept, so that clients which reconnect,
+    or poll again, get the events they missed in between.  Log chunks are
+    only sent, and only for steps which start after they were asked for,
+    while some client wants them."""
+
+    _reactor = reactor
+
+    maxEvents = 1000
+    keepAliveInterval = 30
+
+    def __init__(self, status):
+        base.StatusSubscriber.__init__(self, status)
+        self.clients = []
+        self.recent = collections.deque()
+        self.nextId = 1
+        self.keepAlive = task.LoopingCall(self._keepAlive)
+        self.keepAlive.clock = self._reactor
+        self.subscribe()
+
+    def stop(self):
+        base.StatusSubscriber.stop(self)
+        for client in self.clients[:]:
+            client.finish()
+        self.clients = []
+        if self.keepAlive.running:
+            self.keepAlive.stop()
+
+    def getLastId(self):
+        return self.nextId - 1
+
+    def getEventsSince(self, since, client):
+        """Returns the kept events after event C{since} which C{client}
+        wants, and whether events after C{since} have been forgotten."""
+        # the master may have restarted since the client's last event
+        restarted = since > self.getLastId()
+        if restarted:
+            since = 0
+        if self.recent:
+            oldest = self.recent[0].id
+        else:
+            oldest = self.nextId
+        missed = restarted or since < oldest - 1
+        events = [ e for e in self.recent if e.id > since and client.wants(e) ]
+        return events, missed
+
+    def addClient(self, client):
+        self.clients.append(client)
+        if (isinstance(client, StreamClient)
+                and not self.keepAlive.running):
+            self.keepAlive.start(self.keepAliveInterval, now=False)
+
+    def removeClient(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+        if (self.keepAlive.running and not
+                [ c for c in self.clients if isinstance(c, StreamClient) ]):
+            self.keepAlive.stop()
+
+    def wantLogs(self):
+        return [ c for c in self.clients if c.logs ] != []
+
+    def publish(self, name, builderName=None, **payload):
+        if builderName is not None:
+            payload['builderName'] = builderName
+        event = Event(self.nextId, name, builderName, payload)
+        self.nextId += 1
+        self.recent.append(event)
+        if len(self.recent) > self.maxEvents:
+            self.recent.popleft()
+        for client in self.clients[:]:
+            if client.wants(event):
+                client.send(event)
+
+    def _keepAlive(self):
+        for client in self.clients:
+            if isinstance(client, StreamClient):
+                client.keepAlive()
+
+    # IStatusReceiver methods
+
+    def requestSubmitted(self, request):
+        self.publish('requestSubmitted', request.getBuilderName())
+
+    def requestCancelled(self, builder, request):
+        self.publish('requestCancelled', builder.getName())
+
+    def builderAdded(self, builderName, builder):
+        self.publish('builderAdded', builderName)
+        return base.StatusSubscriber.builderAdded(self, builderName, builder)
+
+    def builderRemoved(self, builderName):
+        self.publish('builderRemoved', builderName)
+
+    def builderChangedState(self, builderName, state):
+        self.publish('builderChangedState', builderName, state=state)
+
+    def buildStarted(self, builderName, build):
+        self.publish('buildStarted', builderName, number=build.getNumber())
+        return self
+
+    def buildFinished(self, builderName, build, results):
+        self.publish('buildFinished', builderName, number=build.getNumber(),
+                     results=results, text=build.getText())
+
+    def stepStarted(self, build, step):
+        self.publish('stepStarted', build.getBuilder().getName(),
+                     number=build.getNumber(), step=step.getName())
+        if self.wantLogs():
+            return self
+
+    def stepFinished(self, build, step, results):
+        self.publish('stepFinished', build.getBuilder().getName(),
+                     number=build.getNumber(), step=step.getName(),
+                     results=step.getResults()[0], text=step.getText())
+
+    def logStarted(self, build, step, log):
+        if self.wantLogs():
+            return self
+
+    def logChunk(self, build, step, log, channel, text):
+        if not self.wantLogs():
+            return
+        self.publish('logChunk', build.getBuilder().getName(),
+                     number=build.getNumber(), step=step.getName(),
+                     log=log.getName(), channel=channel, text=text)
+
+    def changeAdded(self, change):
+        self.publish('changeAdded', change=change.asDict())
+
+    def slaveConnected(self, slaveName):
+        self.publish('slaveConnected', slavename=slaveName)
+
+    def slaveDisconnected(self, slaveName):
+        self.publish('slaveDisconnected', slavename=slaveName)
+
+
+class EventResourceMixin:
+
+    def getClientArgs(self, request):
+        return dict(events=RequestArgList(request, 'event'),
+                    builders=RequestArgList(request, 'builder'),
+                    logs=request.args.get('logs', ['0'])[0] == '1')
+
+    def start(self, request, stream, client, since):
+        events, missed = stream.getEventsSince(since, client)
+        stream.addClient(client)
+        request.notifyFinish().addBoth(lambda _ : client.disconnected())
+        return events, missed
+
+
+# /events/poll
+class PollEventsResource(resource.Resource, EventResourceMixin):
+    isLeaf = True
+
+    maxTimeout = 300
+
+    def __init__(self, parent):
+        resource.Resource.__init__(self)
+        self.parent = parent
+
+    def render_GET(self, request):
+        stream = self.parent.getStream(request)
+        timeout = int(request.args.get('timeout', [30])[0])
+        timeout = max(0, min(timeout, self.maxTimeout))
+        since = request.args.get('since', [None])[0]
+        if since is None:
+            since = stream.getLastId()
+        else:
+            since = int(since)
+        request.setHeader('content-type', 'application/json')
+        request.setHeader('cache-control', 'no-cache')
+        request.setHeader('access-control-allow-origin', '*')
+
+        client = PollClient(stream, request, timeout=timeout,
+                            **self.getClientArgs(request))
+        events, missed = self.start(request, stream, client, since)
+        if events or missed:
+            client.respond(events, missed)
+        return server.NOT_DONE_YET
+
+
+# /events
+class EventsResource(resource.Resource, EventResourceMixin):
+    """Status events, as they happen: as server-sent events from /events, and
+    by long polling from /events/poll.  Both take event= and builder=
+    arguments, to choose the events sent, and logs=1 to send log chunks."""
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.stream = None
+        self.putChild('poll', PollEventsResource(self))
+
+    def getChild(self, path, request):
+        if path == '':
+            return self
+        return resource.Resource.getChild(self, path, request)
+
+    def getStream(self, request):
+        if self.stream is None:
+            service = request.site.buildbot_service
+            self.stream = EventStream(service.getStatus())
+            service.addStatusCache(self.stream)
+        return self.stream
+
+    def render_GET(self, request):
+        stream = self.getStream(request)
+        request.setHeader('content-type', 'text/event-stream')
+        request.setHeader('cache-control', 'no-cache')
+        request.setHeader('access-control-allow-origin', '*')
+
+        client = StreamClient(stream, request, **self.getClientArgs(request))
+        client.start()
+        # a reconnecting client gets the events it missed
+        since = request.getHeader('last-event-id')
+        if since is None:
+            since = stream.getLastId()
+        events, missed = self.start(request, stream, client, int(since))
+        if missed:
+            client.writeDropped()
+        for event in events:
+            client.send(event)
+        return server.NOT_DONE_YET
@@ -61,8 +61,7 @@ class GridStatusMixin(object):
         cxt['class'] = build_get_class(build)
         return cxt
 
-    @defer.inlineCallbacks
-    def builder_cxt(self, request, builder):
+    def builder_cxt(self, request, builder, n_pending):
         state, builds = builder.getState()
 
         # look for upcoming builds. We say the state is "waiting" if the
@@ -78,14 +77,10 @@ class GridStatusMixin(object):
         if state == "idle" and upcoming:
             state = "waiting"
 
-        n_pending = len(builder.getPendingBuildRequestStatuses())
-
-        cxt = { 'url': path_to_builder(request, builder),
-                'name': builder.getName(),
-                'state': state,
-                'n_pending': n_pending }
-
-        defer.returnValue(cxt)
+        return { 'url': path_to_builder(request, builder),
+                 'name': builder.getName(),
+                 'state': state,
+                 'n_pending': n_pending }
 
     def getSourceStampKey(self, ss):
         """Given two source stamps, we want to assign them to the same row if
@@ -179,6 +174,8 @@ class GridStatusResource(HtmlResource, GridStatusMixin):
         
         sortedBuilderNames = status.getBuilderNames()[:]
         sortedBuilderNames.sort()
+        brcounts = yield status.getPendingBuildRequestCounts(
+                                                    sortedBuilderNames)
         
         cxt['builders'] = []
 
@@ -196,7 +193,7 @@ class GridStatusResource(HtmlResource, GridStatusMixin):
                     if key == self.getSourceStampKey(stamps[i]) and builds[i] is None:
                         builds[i] = build
 
-            b = self.builder_cxt(request, builder)
+            b = self.builder_cxt(request, builder, brcounts[bn])
 
             b['builds'] = []
             for build in builds:
@@ -243,6 +240,8 @@ class TransposedGridStatusResource(HtmlResource, GridStatusMixin):
 
         sortedBuilderNames = status.getBuilderNames()[:]
         sortedBuilderNames.sort()
+        brcounts = yield status.getPendingBuildRequestCounts(
+                                                    sortedBuilderNames)
         
         cxt['sorted_builder_names'] = sortedBuilderNames
         cxt['builder_builds'] = builder_builds = []
@@ -265,7 +264,7 @@ class TransposedGridStatusResource(HtmlResource, GridStatusMixin):
                     if key == self.getSourceStampKey(stamps[i]) and builds[i] is None:
                         builds[i] = build
 
-            b = yield self.builder_cxt(request, builder)
+            b = self.builder_cxt(request, builder, brcounts[bn])
             builders.append(b)
 
             builder_builds.append(map(lambda b: self.build_cxt(request, b), builds))
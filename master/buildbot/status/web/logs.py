@@ -17,7 +17,7 @@
 from zope.interface import implements
 from twisted.python import components
 from twisted.spread import pb
-from twisted.web import server
+from twisted.web import server, http
 from twisted.web.resource import Resource
 from twisted.web.error import NoResource
 
@@ -92,15 +92,100 @@ class TextLog(Resource):
         else:
             return self.template.module.chunks(html_entries)
 
+    def _getChannels(self):
+        if self.asText:
+            return [logfile.STDOUT, logfile.STDERR]
+        return [logfile.STDOUT, logfile.STDERR, logfile.HEADER]
+
+    def _getPart(self, req):
+        # Return the chunks of the log selected by the request's arguments
+        # or Range header, or None if the whole log was requested.  Offsets
+        # and lengths count the text on the channels this view shows.
+        # Raises ValueError for malformed arguments.
+        channels = self._getChannels()
+        args = req.args
+        if "tail" in args:
+            size = int(args["tail"][0])
+            lines = args.get("unit", ["bytes"])[0] == "lines"
+            if size < 0:
+                raise ValueError("negative tail")
+            return self.original.getTail(size, channels, lines)
+
+        if "offset" in args or "length" in args:
+            offset = int(args.get("offset", [0])[0])
+            if "length" in args:
+                length = int(args["length"][0])
+            else:
+                length = self.original.getTextLength(channels) - offset
+            if offset < 0 or length < 0:
+                raise ValueError("negative offset or length")
+            return self.original.getRange(offset, length, channels)
+
+        # HTTP ranges only make sense for the plain text
+        rangeHeader = req.getHeader("range")
+        if not self.asText or not rangeHeader:
+            return None
+        total = self.original.getTextLength(channels)
+        byterange = parseRange(rangeHeader, total)
+        if byterange is None:
+            return None
+        first, last = byterange
+        if first >= total or first > last:
+            req.setResponseCode(http.REQUESTED_RANGE_NOT_SATISFIABLE)
+            req.setHeader("content-range", "bytes */%d" % total)
+            return []
+        req.setResponseCode(http.PARTIAL_CONTENT)
+        req.setHeader("content-range", "bytes %d-%d/%d" % (first, last, total))
+        return self.original.getRange(first, last - first + 1, channels)
+
+    def _renderPart(self, req):
+        # render the part of the log selected by the request, or return
+        # None if the whole log was requested
+        try:
+            chunks = self._getPart(req)
+        except ValueError:
+            req.setResponseCode(http.BAD_REQUEST)
+            return "invalid log range"
+        if chunks is None:
+            return None
+
+        if self.asText:
+            return self.content(chunks)
+        self.template = req.site.buildbot_service.templates.get_template("logs.html")
+        data = self.template.module.page_header(
+                pageTitle = "Log File contents",
+                texturl = req.childLink("text"),
+                path_to_root = path_to_root(req))
+        data += self.content(chunks)
+        data += self.template.module.page_footer()
+        self.template = None
+        return data.encode('utf-8')
+
     def render_HEAD(self, req):
         self._setContentType(req)
+        if self.asText:
+            req.setHeader("accept-ranges", "bytes")
 
-        # vague approximation, ignores markup
-        req.setHeader("content-length", self.original.length)
+        data = self._renderPart(req)
+        if data is not None:
+            req.setHeader("content-length", len(data))
+        elif self.asText:
+            req.setHeader("content-length",
+                    self.original.getTextLength(self._getChannels()))
+        # the length of the whole log as HTML isn't known without rendering
+        # it, so leave it out
         return ''
 
     def render_GET(self, req):
         self._setContentType(req)
+        if self.asText:
+            req.setHeader("accept-ranges", "bytes")
+
+        data = self._renderPart(req)
+        if data is not None:
+            req.setHeader("content-length", len(data))
+            return data
+
         self.req = req
 
         if not self.asText:
@@ -140,6 +225,34 @@ class TextLog(Resource):
         # release template
         self.template = None
 
+def parseRange(header, total):
+    """
+    Parse the value of an HTTP Range header for an entity C{total} bytes
+    long.  Only a single byte range is supported.
+
+    @returns: (first, last) byte positions, inclusive, with first > last or
+    first >= total if the range cannot be satisfied; or None if the header
+    should be ignored
+    """
+    units, _, spec = header.partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # suffix range: the last N bytes
+            size = int(last)
+            return (max(total - size, 0), total - 1)
+        first = int(first)
+        if last:
+            last = int(last)
+            if last < first:
+                return None
+            return (first, min(last, total - 1))
+        return (first, total - 1)
+    except ValueError:
+        return None
+
 components.registerAdapter(TextLog, interfaces.IStatusLog, IHTMLLog)
 
 
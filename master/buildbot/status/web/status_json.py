@@ -20,9 +20,12 @@ import datetime
 import os
 import re
 
-from twisted.internet import defer
-from twisted.web import html, resource, server
+from twisted.internet import defer, task
+from twisted.python import log
+from twisted.web import html, http, resource, server
 
+from buildbot import util
+from buildbot.status import base
 from buildbot.status.web.base import HtmlResource
 from buildbot.util import json
 
@@ -74,6 +77,9 @@ EXAMPLES = """\
     - Build changes
   - /json/builders/<A_BUILDER>/builds?select=-1&select=-2
     - Two last builds on '<A_BUILDER>' builder.
+  - /json/builders/<A_BUILDER>/history?limit=500&field=results
+    - Results of the last 500 finished builds on '<A_BUILDER>' builder, read
+      from the build summaries rather than the builds.
   - /json/builders/<A_BUILDER>/builds?select=-1/source_stamp/changes&select=-2/source_stamp/changes
     - Changes of the two last builds on '<A_BUILDER>' builder.
   - /json/builders/<A_BUILDER>/slaves
@@ -120,6 +126,172 @@ def FilterOut(data):
         return data
 
 
+def ETagMatches(request, etag):
+    """Returns True if the request's If-None-Match header matches etag."""
+    header = request.getHeader('if-none-match')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or ('W/' + etag) in tags
+
+
+class JsonCache(base.StatusSubscriber):
+    """Keeps generation numbers, which change whenever the status does, and
+    the json bodies rendered for the current generations.
+
+    The pages of a single builder, and of its builds, depend only on that
+    builder, so each builder has a generation of its own, which changes only
+    when the builder does; all other pages share the generation of the whole
+    status, which changes whenever anything does.
+
+    While builds are running, their ETAs change as time passes, so the tag
+    also changes every etaInterval seconds.  Identical requests made while a
+    body is being rendered wait for that body, rather than rendering it
+    again."""
+
+    etaInterval = 10
+    maxBodies = 100
+
+    def __init__(self, status):
+        base.StatusSubscriber.__init__(self, status)
+        self.generation = 0
+        # builderName -> generation of that builder
+        self.builderGenerations = {}
+        # builderName, or None for the whole status -> the current tag, and
+        # { key : body } for that tag
+        self.tags = {}
+        self.bodies = {}
+        # (builderName, tag, key) -> Deferreds waiting for that body
+        self.waiting = {}
+
+    def stop(self):
+        base.StatusSubscriber.stop(self)
+        self.tags = {}
+        self.bodies = {}
+
+    def getTag(self, builderName=None):
+        """Returns the tag for the current state of the given builder, or of
+        the whole status."""
+        self.subscribe()
+        if builderName is None:
+            tag = str(self.generation)
+            names = self.status.getBuilderNames()
+        else:
+            tag = 'b%d' % self.builderGenerations.get(builderName, 0)
+            names = [ n for n in self.status.getBuilderNames()
+                      if n == builderName ]
+        for name in names:
+            if self.status.getBuilder(name).getCurrentBuilds():
+                tag += '-%d' % (util.now() // self.etaInterval)
+                break
+        return tag
+
+    def getBody(self, tag, key, render, builderName=None):
+        """Returns a Deferred firing with the body for key, calling render
+        to make it if it is not already cached or being made."""
+        if self.tags.get(builderName) != tag:
+            self.tags[builderName] = tag
+            self.bodies[builderName] = {}
+        bodies = self.bodies[builderName]
+        if key in bodies:
+            return defer.succeed(bodies[key])
+        k = (builderName, tag, key)
+        if k in self.waiting:
+            d = defer.Deferred()
+            self.waiting[k].append(d)
+            return d
+
+        waiters = self.waiting[k] = []
+        d = defer.maybeDeferred(render)
+        def done(body):
+            del self.waiting[k]
+            if self.tags.get(builderName) == tag:
+                bodies = self.bodies[builderName]
+                if len(bodies) >= self.maxBodies:
+                    bodies.clear()
+                bodies[key] = body
+            for w in waiters:
+                w.callback(body)
+            return body
+        def failed(f):
+            del self.waiting[k]
+            for w in waiters:
+                w.errback(f)
+            return f
+        d.addCallbacks(done, failed)
+        return d
+
+    def changed(self, builderName=None):
+        """Called when the status changes; if only the given builder has
+        changed, the pages of other builders are kept."""
+        self.generation += 1
+        self.bodies.pop(None, None)
+        self.tags.pop(None, None)
+        if builderName is not None:
+            self.builderGenerations[builderName] = \
+                    self.builderGenerations.get(builderName, 0) + 1
+            self.bodies.pop(builderName, None)
+            self.tags.pop(builderName, None)
+
+    def _buildChanged(self, build):
+        self.changed(build.getBuilder().getName())
+
+    # IStatusReceiver methods
+
+    def builderAdded(self, builderName, builder):
+        self.changed(builderName)
+        return base.StatusSubscriber.builderAdded(self, builderName, builder)
+
+    def builderRemoved(self, builderName):
+        self.changed(builderName)
+
+    def builderChangedState(self, builderName, state):
+        self.changed(builderName)
+
+    def requestSubmitted(self, request):
+        self.changed(request.getBuilderName())
+
+    def requestCancelled(self, builder, request):
+        self.changed(builder.getName())
+
+    def buildsetSubmitted(self, buildset):
+        self.changed()
+
+    def buildStarted(self, builderName, build):
+        self.changed(builderName)
+        return self
+
+    def stepStarted(self, build, step):
+        self._buildChanged(build)
+
+    def stepTextChanged(self, build, step, text):
+        self._buildChanged(build)
+
+    def stepText2Changed(self, build, step, text2):
+        self._buildChanged(build)
+
+    def logStarted(self, build, step, log):
+        self._buildChanged(build)
+
+    def logFinished(self, build, step, log):
+        self._buildChanged(build)
+
+    def stepFinished(self, build, step, results):
+        self._buildChanged(build)
+
+    def buildFinished(self, builderName, build, results):
+        self.changed(builderName)
+
+    def changeAdded(self, change):
+        self.changed()
+
+    def slaveConnected(self, slaveName):
+        self.changed()
+
+    def slaveDisconnected(self, slaveName):
+        self.changed()
+
+
 class JsonResource(resource.Resource):
     """Base class for json data."""
 
@@ -128,6 +300,10 @@ class JsonResource(resource.Resource):
     help = None
     pageTitle = None
     level = 0
+    # the JsonCache for the whole tree, set by putChild
+    jsonCache = None
+    # whether responses can be cached until the status changes
+    cacheable = True
 
     def __init__(self, status):
         """Adds transparent lazy-child initialization."""
@@ -155,6 +331,8 @@ class JsonResource(resource.Resource):
 
         def RecurseFix(res, level):
             res.level = level + 1
+            if isinstance(res, JsonResource):
+                res.jsonCache = self.jsonCache
             for c in res.children.itervalues():
                 RecurseFix(c, res.level)
 
@@ -163,24 +341,20 @@ class JsonResource(resource.Resource):
 
     def render_GET(self, request):
         """Renders a HTTP GET at the http request level."""
-        d = defer.maybeDeferred(lambda : self.content(request))
+        tag = self.getTag(request)
+        if tag is not None:
+            if ETagMatches(request, '"%s"' % tag):
+                request.setResponseCode(http.NOT_MODIFIED)
+                return ""
+            d = self.jsonCache.getBody(tag, request.uri,
+                                       lambda : self.content(request),
+                                       self.getCacheBuilderName())
+        else:
+            d = defer.maybeDeferred(lambda : self.content(request))
         def handle(data):
             if isinstance(data, unicode):
                 data = data.encode("utf-8")
-            request.setHeader("Access-Control-Allow-Origin", "*")
-            if RequestArgToBool(request, 'as_text', False):
-                request.setHeader("content-type", 'text/plain')
-            else:
-                request.setHeader("content-type", self.contentType)
-                request.setHeader("content-disposition",
-                                "attachment; filename=\"%s.json\"" % request.path)
-            # Make sure we get fresh pages.
-            if self.cache_seconds:
-                now = datetime.datetime.utcnow()
-                expires = now + datetime.timedelta(seconds=self.cache_seconds)
-                request.setHeader("Expires",
-                                expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
-                request.setHeader("Pragma", "no-cache")
+            self.setHeaders(request)
             return data
         d.addCallback(handle)
         def ok(data):
@@ -192,6 +366,38 @@ class JsonResource(resource.Resource):
         d.addCallbacks(ok, fail)
         return server.NOT_DONE_YET
 
+    def getTag(self, request):
+        """Returns the cache tag for the response, having sent it as the
+        ETag, or None if the response is not cached."""
+        cache = self.jsonCache
+        if cache is None or not self.cacheable:
+            return None
+        tag = cache.getTag(self.getCacheBuilderName())
+        request.setHeader("ETag", '"%s"' % tag)
+        return tag
+
+    def getCacheBuilderName(self):
+        """Returns the name of the builder on which alone the response
+        depends, or None if it may depend on the whole status."""
+        return None
+
+    def setHeaders(self, request):
+        """Sets the headers of a json response."""
+        request.setHeader("Access-Control-Allow-Origin", "*")
+        if RequestArgToBool(request, 'as_text', False):
+            request.setHeader("content-type", 'text/plain')
+        else:
+            request.setHeader("content-type", self.contentType)
+            request.setHeader("content-disposition",
+                            "attachment; filename=\"%s.json\"" % request.path)
+        # Make sure we get fresh pages.
+        if self.cache_seconds:
+            now = datetime.datetime.utcnow()
+            expires = now + datetime.timedelta(seconds=self.cache_seconds)
+            request.setHeader("Expires",
+                            expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+            request.setHeader("Pragma", "no-cache")
+
     @defer.inlineCallbacks
     def content(self, request):
         """Renders the json dictionaries."""
@@ -356,6 +562,9 @@ class BuilderPendingBuildsJsonResource(JsonResource):
         JsonResource.__init__(self, status)
         self.builder_status = builder_status
 
+    def getCacheBuilderName(self):
+        return self.builder_status.getName()
+
     def asDict(self, request):
         # buildbot.status.builder.BuilderStatus
         d = self.builder_status.getPendingBuildRequestStatuses()
@@ -380,6 +589,11 @@ class BuilderJsonResource(JsonResource):
         self.putChild(
                 'pendingBuilds',
                 BuilderPendingBuildsJsonResource(status, builder_status))
+        self.putChild('history',
+                      BuildHistoryJsonResource(status, builder_status))
+
+    def getCacheBuilderName(self):
+        return self.builder_status.getName()
 
     def asDict(self, request):
         # buildbot.status.builder.BuilderStatus
@@ -398,6 +612,18 @@ class BuildersJsonResource(JsonResource):
                           BuilderJsonResource(status,
                                               status.getBuilder(builder_name)))
 
+    def asDict(self, request):
+        # render every builder at once, so that they share the query counting
+        # their pending builds
+        names = [ name for name, child in self.children.iteritems()
+                  if isinstance(child, JsonResource) ]
+        d = defer.gatherResults([
+                defer.maybeDeferred(lambda name=name :
+                    self.getChildWithDefault(name, request).asDict(request))
+                for name in names ])
+        d.addCallback(lambda dicts : dict(zip(names, dicts)))
+        return d
+
 
 class BuilderSlavesJsonResources(JsonResource):
     help = """Describe the slaves attached to a single builder.
@@ -426,6 +652,9 @@ class BuildJsonResource(JsonResource):
                                               build_status.getSourceStamp()))
         self.putChild('steps', BuildStepsJsonResource(status, build_status))
 
+    def getCacheBuilderName(self):
+        return self.build_status.getBuilder().getName()
+
     def asDict(self, request):
         return self.build_status.asDict()
 
@@ -439,6 +668,9 @@ class AllBuildsJsonResource(JsonResource):
         JsonResource.__init__(self, status)
         self.builder_status = builder_status
 
+    def getCacheBuilderName(self):
+        return self.builder_status.getName()
+
     def getChild(self, path, request):
         # Dynamic childs.
         if isinstance(path, int) or _IS_INT.match(path):
@@ -496,6 +728,151 @@ class BuildsJsonResource(AllBuildsJsonResource):
         return builds
 
 
+class BuildHistoryJsonResource(JsonResource):
+    help = """Finished builds of a builder, newest first, a page at a time.
+
+This reads the builder's index of build summaries, rather than the builds
+themselves, so it is much faster than builds/_all for long histories.
+
+Arguments:
+  - limit
+    - The number of builds in the page; 100 by default, and at most 1000.
+  - before
+    - Only list builds numbered below this.  Each page gives the value for the
+      next page as 'next', which is null on the last page.
+  - field
+    - The fields to include for each build, besides its number: any of
+      results, times, revision, slave, branch, reason and text.  It may be
+      given several times, or as a comma-separated list.  All fields are
+      included by default.
+"""
+    pageTitle = 'BuildHistory'
+
+    defaultLimit = 100
+    maxLimit = 1000
+
+    fields = {
+        'results' : lambda s : s.getResults(),
+        'times' : lambda s : list(s.getTimes()),
+        'revision' : lambda s : s.getGotRevision() or s.getRevision(),
+        'slave' : lambda s : s.getSlavename(),
+        'branch' : lambda s : s.getBranch(),
+        'reason' : lambda s : s.getReason(),
+        'text' : lambda s : s.getText(),
+    }
+
+    def __init__(self, status, builder_status):
+        JsonResource.__init__(self, status)
+        self.builder_status = builder_status
+
+    def getCacheBuilderName(self):
+        return self.builder_status.getName()
+
+    def getLimit(self, request):
+        limit = int(RequestArg(request, 'limit', self.defaultLimit))
+        return max(1, min(limit, self.maxLimit))
+
+    def getFields(self, request):
+        fields = []
+        for arg in request.args.get('field', []):
+            fields.extend([ f for f in arg.split(',') if f in self.fields ])
+        return fields or sorted(self.fields)
+
+    def getBefore(self, request):
+        before = RequestArg(request, 'before', None)
+        if before is not None:
+            before = int(before)
+        return before
+
+    def getSummaries(self, request):
+        return self.builder_status.generateBuildSummaryHistory(
+                self.getBefore(request))
+
+    def summaryDict(self, summary, fields):
+        result = { 'number' : summary.getNumber() }
+        for f in fields:
+            result[f] = self.fields[f](summary)
+        return result
+
+    def generatePage(self, request):
+        """Generates the dictionary for each build in the page, then the
+        value of 'next'."""
+        limit = self.getLimit(request)
+        fields = self.getFields(request)
+        count = 0
+        last = None
+        for summary in self.getSummaries(request):
+            if count == limit:
+                # there is at least one more page
+                yield last
+                return
+            yield self.summaryDict(summary, fields)
+            last = summary.getNumber()
+            count += 1
+        yield None
+
+    def asDict(self, request):
+        page = list(self.generatePage(request))
+        return { 'builds' : page[:-1], 'next' : page[-1] }
+
+    def render_GET(self, request):
+        """Streams the page, a build at a time, so that long pages neither
+        hold up the master nor need to be held in memory."""
+        # check the arguments before anything is written
+        try:
+            self.getLimit(request)
+            self.getBefore(request)
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            self.setHeaders(request)
+            return json.dumps({ 'error' : 'limit and before must be integers' })
+        # the flags which change the output are left to JsonResource
+        if (RequestArgToBool(request, 'as_text', False)
+                or RequestArgToBool(request, 'filter', False)
+                or not RequestArgToBool(request, 'compact', True)
+                or 'select' in request.args):
+            return JsonResource.render_GET(self, request)
+        tag = self.getTag(request)
+        if tag is not None and ETagMatches(request, '"%s"' % tag):
+            request.setResponseCode(http.NOT_MODIFIED)
+            return ""
+
+        prefix, suffix = '', ''
+        callback = RequestArg(request, 'callback', None)
+        if callback and re.match(r'^[a-zA-Z$][a-zA-Z$0-9.]*$', callback):
+            prefix, suffix = '%s(' % callback, ');'
+        self.setHeaders(request)
+
+        def produce():
+            request.write(prefix + '{"builds":[')
+            sep = ''
+            for item in self.generatePage(request):
+                if isinstance(item, dict):
+                    request.write(sep + json.dumps(item, sort_keys=True,
+                                                   separators=(',',':')))
+                    sep = ','
+                    yield None
+                else:
+                    request.write('],"next":%s}' % json.dumps(item) + suffix)
+        producing = task.cooperate(produce())
+
+        def stop(f):
+            # the client went away
+            try:
+                producing.stop()
+            except task.TaskDone:
+                pass
+        request.notifyFinish().addErrback(stop)
+        def done(_):
+            request.finish()
+        def failed(f):
+            if not f.check(task.TaskStopped):
+                log.err(f, "while streaming build history")
+                request.finish()
+        producing.whenDone().addCallbacks(done, failed)
+        return server.NOT_DONE_YET
+
+
 class BuildStepJsonResource(JsonResource):
     help = """A single build step.
 """
@@ -507,6 +884,9 @@ class BuildStepJsonResource(JsonResource):
         self.build_step_status = build_step_status
         # TODO self.putChild('logs', LogsJsonResource())
 
+    def getCacheBuilderName(self):
+        return self.build_step_status.getBuild().getBuilder().getName()
+
     def asDict(self, request):
         return self.build_step_status.asDict()
 
@@ -522,6 +902,9 @@ class BuildStepsJsonResource(JsonResource):
         # The build steps are constantly changing until the build is done so
         # keep a reference to build_status instead
 
+    def getCacheBuilderName(self):
+        return self.build_status.getBuilder().getName()
+
     def getChild(self, path, request):
         # Dynamic childs.
         build_step_status = None
@@ -689,6 +1072,8 @@ class MetricsJsonResource(JsonResource):
     help = """Master metrics.
 """
     title = "Metrics"
+    # metrics change without the status changing
+    cacheable = False
 
     def asDict(self, request):
         metrics = self.status.getMetrics()
@@ -714,6 +1099,7 @@ For help on any sub directory, use url /child/help
     def __init__(self, status):
         JsonResource.__init__(self, status)
         self.level = 1
+        self.jsonCache = JsonCache(status)
         self.putChild('builders', BuildersJsonResource(status))
         self.putChild('change_sources', ChangeSourcesJsonResource(status))
         self.putChild('project', ProjectJsonResource(status))
@@ -722,11 +1108,10 @@ For help on any sub directory, use url /child/help
         # This needs to be called before the first HelpResource().body call.
         self.hackExamples()
 
-    def content(self, request):
-        result = JsonResource.content(self, request)
+    def render_GET(self, request):
         # This is done to hook the downloaded filename.
         request.path = 'buildbot'
-        return result
+        return JsonResource.render_GET(self, request)
 
     def hackExamples(self):
         global EXAMPLES
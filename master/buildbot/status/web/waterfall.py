@@ -23,7 +23,8 @@ import time, locale
 import operator
 
 from buildbot import interfaces, util
-from buildbot.status import builder, buildstep, build
+from buildbot.util import lru
+from buildbot.status import base, builder, buildstep, build
 from buildbot.changes import changes
 
 from buildbot.status.web.base import Box, HtmlResource, IBox, ICurrentBox, \
@@ -326,6 +327,195 @@ class ChangeEventSource(object):
                 continue
             yield change
 
+def _eventKey(e):
+    # identifies an event even if its build has been reloaded from disk
+    if isinstance(e, build.BuildStatus):
+        return ('build', e.getNumber())
+    if isinstance(e, buildstep.BuildStepStatus):
+        return ('step', e.getBuild().getNumber(), e.getName())
+    return ('event', id(e))
+
+def _eventBuildNumber(e):
+    # number of the build an event belongs to, or None for builder events
+    if isinstance(e, build.BuildStatus):
+        return e.getNumber()
+    if isinstance(e, buildstep.BuildStepStatus):
+        return e.getBuild().getNumber()
+    return None
+
+def _eventBuildStart(e):
+    # start time of the build an event belongs to, or None for builder events
+    if isinstance(e, build.BuildStatus):
+        return e.getTimes()[0]
+    if isinstance(e, buildstep.BuildStepStatus):
+        return e.getBuild().getTimes()[0]
+    return None
+
+class BuilderEventCache(object):
+    """A cached copy of the events from one builder's eventGenerator, for one
+    set of filters, newest first.
+
+    When the builder has changed, the events down to the newest event of a
+    build older than all the running builds are generated again, and the
+    cached events from there on are kept.  Events beyond the cached ones are generated as they are
+    needed, and the cache is trimmed to the number of events the last
+    render used."""
+
+    def __init__(self, builder_status, branches, categories, committers):
+        self.builder_status = builder_status
+        self.filters = (branches, categories, committers)
+        self.events = []
+        # generates the events after self.events, once it has skipped
+        # self.skip of them
+        self.generator = None
+        self.skip = 0
+        self.generation = None
+        self.signature = None
+        self.used = 0
+
+    def _getSignature(self):
+        # builder events are added without telling status receivers, so
+        # look for them (and new builds) directly
+        return (self.builder_status.nextBuildNumber,
+                id(self.builder_status.getEvent(-1)))
+
+    def _refresh(self, minTime):
+        # if we had every event, and still do, there will be nothing more
+        complete = self.generator is None and self.used >= len(self.events)
+        del self.events[self.used:]
+        gen = self.builder_status.eventGenerator(*(self.filters + (minTime,)))
+        # events of builds older than every running build can no longer
+        # change; newer builds may have finished before an older one
+        running = [ b.getNumber()
+                    for b in self.builder_status.getCurrentBuilds() ]
+        for k in range(len(self.events)):
+            number = _eventBuildNumber(self.events[k])
+            if number is not None and not [ r for r in running
+                                            if r <= number ]:
+                break
+        else:
+            self.events = []
+            self.generator = gen
+            self.skip = 0
+            return
+
+        key = _eventKey(self.events[k])
+        head = []
+        for e in gen:
+            if _eventKey(e) == key:
+                self.events[:k] = head
+                if complete:
+                    self.generator = None
+                else:
+                    self.generator = gen
+                    self.skip = len(self.events) - len(head) - 1
+                return
+            head.append(e)
+        # the old events are gone or too old, so we have all there is
+        self.events = head
+        self.generator = None
+
+    def _extend(self):
+        if self.generator is None:
+            return None
+        try:
+            while self.skip:
+                self.generator.next()
+                self.skip -= 1
+            e = self.generator.next()
+        except StopIteration:
+            self.generator = None
+            return None
+        self.events.append(e)
+        return e
+
+    def update(self, generation):
+        # called with a number that changes whenever the builder does
+        if generation != self.generation:
+            self.generation = generation
+            self.signature = None
+
+    def eventGenerator(self, branches, categories, committers, minTime):
+        # the filters were given to the constructor, and the remaining
+        # arguments are ignored
+        signature = self._getSignature()
+        if signature != self.signature:
+            self._refresh(minTime)
+            self.signature = signature
+        self.used = 0
+        i = 0
+        while True:
+            if i < len(self.events):
+                e = self.events[i]
+            else:
+                e = self._extend()
+                if e is None:
+                    return
+            start = _eventBuildStart(e)
+            if minTime and start is not None and start < minTime:
+                return
+            i += 1
+            self.used = i
+            yield e
+
+class WaterfallEventCache(base.StatusSubscriber):
+    """Keeps a L{BuilderEventCache} for each builder and set of filters the
+    waterfall has been asked for recently, and tells them when their builder
+    has changed."""
+
+    maxSources = 200
+
+    def __init__(self, status):
+        base.StatusSubscriber.__init__(self, status)
+        self.sources = lru.LRUCache(self._makeSource, self.maxSources)
+        self.generations = {}
+        self.subscribe()
+
+    def _makeSource(self, key, builder_status):
+        name, branches, categories, committers = key
+        return BuilderEventCache(builder_status, list(branches),
+                                 list(categories), list(committers))
+
+    def getSource(self, builder_status, branches, categories, committers):
+        name = builder_status.getName()
+        key = (name, tuple(branches), tuple(categories), tuple(committers))
+        source = self.sources.get(key, builder_status=builder_status)
+        if source.builder_status is not builder_status:
+            # the builder has been reconfigured
+            source = self._makeSource(key, builder_status)
+            self.sources.add(key, source)
+        source.update(self.generations.get(name, 0))
+        return source
+
+    def _changed(self, builderName):
+        self.generations[builderName] = \
+                self.generations.get(builderName, 0) + 1
+
+    # IStatusReceiver methods
+
+    def builderAdded(self, builderName, builder):
+        self._changed(builderName)
+        return base.StatusSubscriber.builderAdded(self, builderName, builder)
+
+    def builderRemoved(self, builderName):
+        self._changed(builderName)
+
+    def builderChangedState(self, builderName, state):
+        self._changed(builderName)
+
+    def buildStarted(self, builderName, build):
+        self._changed(builderName)
+        return self
+
+    def stepStarted(self, build, step):
+        self._changed(build.getBuilder().getName())
+
+    def stepFinished(self, build, step, results):
+        self._changed(build.getBuilder().getName())
+
+    def buildFinished(self, builderName, build, results):
+        self._changed(builderName)
+
 class WaterfallStatusResource(HtmlResource):
     """This builds the main status page, with the waterfall display, and
     all child pages."""
@@ -335,6 +525,7 @@ class WaterfallStatusResource(HtmlResource):
         self.categories = categories
         self.num_events=num_events
         self.num_events_max=num_events_max
+        self.eventCache = None
         self.putChild("help", WaterfallHelp(categories))
 
     def getPageTitle(self, request):
@@ -345,6 +536,12 @@ class WaterfallStatusResource(HtmlResource):
         else:
             return "BuildBot"
 
+    def getEventCache(self, request):
+        if self.eventCache is None:
+            self.eventCache = WaterfallEventCache(self.getStatus(request))
+            request.site.buildbot_service.addStatusCache(self.eventCache)
+        return self.eventCache
+
     def getChangeManager(self, request):
         # TODO: this wants to go away, access it through IStatus
         return request.site.buildbot_service.getChangeSvc()
@@ -409,21 +606,16 @@ class WaterfallStatusResource(HtmlResource):
 
         # build request counts for each builder
         allBuilderNames = status.getBuilderNames(categories=self.categories)
-        brstatus_ds = []
-        brcounts = {}
-        def keep_count(statuses, builderName):
-            brcounts[builderName] = len(statuses)
-        for builderName in allBuilderNames:
-            builder_status = status.getBuilder(builderName)
-            d = builder_status.getPendingBuildRequestStatuses()
-            d.addCallback(keep_count, builderName)
-            brstatus_ds.append(d)
+        brcounts_d = status.getPendingBuildRequestCounts(allBuilderNames)
+        def keep_counts(brcounts):
+            results['brcounts'] = brcounts
+        brcounts_d.addCallback(keep_counts)
 
         # wait for it all to finish
-        d = defer.gatherResults([ changes_d ] + brstatus_ds)
+        d = defer.gatherResults([ changes_d, brcounts_d ])
         def call_content(_):
             return self.content_with_db_data(results['changes'],
-                    brcounts, request, ctx)
+                    results['brcounts'], request, ctx)
         d.addCallback(call_content)
         return d
 
@@ -533,7 +725,6 @@ class WaterfallStatusResource(HtmlResource):
     
     def buildGrid(self, request, builders, changes):
         debug = False
-        # TODO: see if we can use a cached copy
 
         showEvents = False
         if request.args.get("show_events", ["false"])[0].lower() == "true":
@@ -565,7 +756,20 @@ class WaterfallStatusResource(HtmlResource):
         commit_source = ChangeEventSource(changes)
 
         lastEventTime = util.now()
-        sources = [commit_source] + builders
+        if ("last_time" in request.args or "show_time" in request.args
+            or "first_time" in request.args):
+            sources = [commit_source] + builders
+        else:
+            # the usual view, of the most recent events: use the cached
+            # events for each builder, rather than walking back through its
+            # builds again.  The rows are still built below on each render,
+            # as the spans are measured back from the newest event, so that a
+            # new event can move every row.
+            cache = self.getEventCache(request)
+            sources = [commit_source] + [
+                cache.getSource(b, filterBranches, filterCategories,
+                                filterCommitters)
+                for b in builders ]
         changeNames = ["changes"]
         builderNames = map(lambda builder: builder.getName(), builders)
         sourceNames = changeNames + builderNames
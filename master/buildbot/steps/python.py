@@ -16,15 +16,10 @@
 
 import re
 from buildbot.status.results import SUCCESS, FAILURE, WARNINGS
+from buildbot.status.logfile import STDOUT, STDERR
 from buildbot.steps.shell import ShellCommand
 from buildbot import config
 
-try:
-    import cStringIO
-    StringIO = cStringIO.StringIO
-except ImportError:
-    from StringIO import StringIO
-
 
 class BuildEPYDoc(ShellCommand):
     name = "epydoc"
@@ -37,7 +32,7 @@ class BuildEPYDoc(ShellCommand):
         warnings = 0
         errors = 0
 
-        for line in StringIO(log.getText()):
+        for line in log.readlines([STDOUT, STDERR]):
             if line.startswith("Error importing "):
                 import_errors += 1
             if line.find("Warning: ") != -1:
@@ -83,7 +78,7 @@ class PyFlakes(ShellCommand):
             summaries[m] = []
 
         first = True
-        for line in StringIO(log.getText()).readlines():
+        for line in log.readlines([STDOUT, STDERR]):
             # the first few lines might contain echoed commands from a 'make
             # pyflakes' step, so don't count these as warnings. Stop ignoring
             # the initial lines as soon as we see one with a colon.
@@ -178,7 +173,7 @@ class PyLint(ShellCommand):
             summaries[m] = []
 
         line_re = None # decide after first match
-        for line in StringIO(log.getText()).readlines():
+        for line in log.readlines([STDOUT, STDERR]):
             if not line_re:
                 # need to test both and then decide on one
                 if self._parseable_line_re.match(line):
@@ -276,7 +271,8 @@ class Sphinx(ShellCommand):
         msgs = ['WARNING', 'ERROR', 'SEVERE']
 
         warnings = []
-        for line in log.getText().split('\n'):
+        for line in log.readlines([STDOUT, STDERR]):
+            line = line.rstrip('\n')
             if (line.startswith('build succeeded') 
                 or line.startswith('no targets are out of date.')):
                 self.success = True
@@ -17,6 +17,7 @@
 from twisted.python import log
 
 from buildbot.status import testresult
+from buildbot.status.logfile import STDOUT, STDERR
 from buildbot.status.results import SUCCESS, FAILURE, WARNINGS, SKIPPED
 from buildbot.process.buildstep import LogLineObserver, OutputProgressObserver
 from buildbot.steps.shell import ShellCommand
@@ -501,14 +502,10 @@ class Trial(ShellCommand):
         self.build.build_status.addTestResult(tr)
 
     def createSummary(self, loog):
-        output = loog.getText()
         problems = ""
-        sio = StringIO.StringIO(output)
+        lines = loog.readlines([STDOUT, STDERR])
         warnings = {}
-        while 1:
-            line = sio.readline()
-            if line == "":
-                break
+        for line in lines:
             if line.find(" exceptions.DeprecationWarning: ") != -1:
                 # no source
                 warning = line # TODO: consider stripping basedir prefix here
@@ -516,7 +513,10 @@ class Trial(ShellCommand):
             elif (line.find(" DeprecationWarning: ") != -1 or
                 line.find(" UserWarning: ") != -1):
                 # next line is the source
-                warning = line + sio.readline()
+                try:
+                    warning = line + lines.next()
+                except StopIteration:
+                    warning = line
                 warnings[warning] = warnings.get(warning, 0) + 1
             elif line.find("Warning: ") != -1:
                 warning = line
@@ -524,7 +524,7 @@ class Trial(ShellCommand):
 
             if line.find("=" * 60) == 0 or line.find("-" * 60) == 0:
                 problems += line
-                problems += sio.read()
+                problems += "".join(lines)
                 break
 
         if problems:
@@ -16,7 +16,7 @@
 from __future__ import with_statement
 
 
-import os.path, tarfile, tempfile
+import os.path, tarfile, tempfile, zlib, copy
 try:
     from cStringIO import StringIO
     assert StringIO
@@ -34,7 +34,8 @@ from buildbot import config
 
 class _FileWriter(pb.Referenceable):
     """
-    Helper class that acts as a file-object with write access
+    Helper class that acts as a file-object with write access.  Slaves may
+    have several writes in flight at once; PB delivers them in order.
     """
 
     def __init__(self, destfile, maxsize, mode):
@@ -94,79 +95,209 @@ class _FileWriter(pb.Referenceable):
                 os.unlink(self.tmpname)
 
 
-def _extractall(self, path=".", members=None):
-    """Fallback extractall method for TarFile, in case it doesn't have its own."""
+class _TarExtractor(object):
+    """
+    Extract a (possibly compressed) tar stream into a directory as the data
+    arrives, rather than waiting for the whole archive.  Call C{feed} with
+    each chunk of the stream, and C{close} at the end.
+
+    Each member's headers are collected in memory and parsed by L{TarFile};
+    the data of regular files is written straight to disk.  As with
+    C{TarFile.extractall}, directories are created with a safe mode and get
+    their proper attributes once the archive is complete.
+    """
+
+    # header types which are followed by data, and then by the header of the
+    # member to which they apply
+    extension_types = (tarfile.GNUTYPE_LONGNAME, tarfile.GNUTYPE_LONGLINK,
+                       tarfile.XHDTYPE, tarfile.XGLTYPE,
+                       tarfile.SOLARIS_XHDTYPE)
 
-    import copy
+    def __init__(self, destroot, compress):
+        self.destroot = destroot
+        if compress == 'bz2':
+            import bz2
+            self.decompressor = bz2.BZ2Decompressor()
+        elif compress == 'gz':
+            # accept a gzip header
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decompressor = None
+
+        self.buffer = ''
+        self.offset = 0         # start of the unprocessed part of the buffer
+        self.header_length = 0  # length of the headers parsed so far
+        self.fp = None          # file being written, and the bytes remaining
+        self.data_remaining = 0
+        self.padding = 0        # bytes of padding to skip
+        self.member = None      # (TarFile, TarInfo) for the current member
+        self.directories = []
+        self.finished = False
+
+    def feed(self, data):
+        if self.decompressor is not None and data:
+            try:
+                data = self.decompressor.decompress(data)
+            except EOFError:
+                # trailing data after the end of a bz2 stream
+                return
+        self.buffer += data
+        while self._process():
+            pass
+        # drop the processed data once per chunk, rather than as each part of
+        # it is processed
+        self.buffer = self.buffer[self.offset:]
+        self.offset = 0
+
+    def close(self):
+        if self.fp is not None or not self.finished:
+            self.cancel()
+            raise tarfile.ReadError("unexpected end of data")
+
+        # set the attributes of directories last, deepest first
+        self.directories.sort(key=lambda m : m[1].name, reverse=True)
+        for tf, tarinfo in self.directories:
+            dirpath = os.path.join(self.destroot, tarinfo.name)
+            try:
+                tf.chown(tarinfo, dirpath)
+                tf.utime(tarinfo, dirpath)
+                tf.chmod(tarinfo, dirpath)
+            except tarfile.ExtractError:
+                pass
+
+    def cancel(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
 
-    directories = []
+    def _process(self):
+        """Process some of the buffer, returning True if progress was made"""
+        if self.finished:
+            self.buffer = ''
+            self.offset = 0
+            return False
 
-    if members is None:
-        members = self
+        if self.fp is not None:
+            if self.offset == len(self.buffer):
+                return False
+            data = self.buffer[self.offset:self.offset + self.data_remaining]
+            self.offset += len(data)
+            self.fp.write(data)
+            self.data_remaining -= len(data)
+            if self.data_remaining == 0:
+                self.fp.close()
+                self.fp = None
+                self._finishMember()
+            return True
+
+        if self.padding:
+            skip = min(self.padding, len(self.buffer) - self.offset)
+            self.offset += skip
+            self.padding -= skip
+            return skip > 0
+
+        # find the end of this member's headers, skipping any extension
+        # headers and their data
+        BLOCKSIZE = tarfile.BLOCKSIZE
+        while len(self.buffer) >= self.offset + self.header_length + BLOCKSIZE:
+            start = self.offset + self.header_length
+            block = self.buffer[start:start + BLOCKSIZE]
+            if block == tarfile.NUL * BLOCKSIZE and self.header_length == 0:
+                # end of archive
+                self.finished = True
+                self.buffer = ''
+                self.offset = 0
+                return False
+            self.header_length += BLOCKSIZE
+            if block[156:157] in self.extension_types:
+                size = tarfile.nti(block[124:136])
+                self.header_length += self._padded(size)
+            else:
+                self._startMember()
+                return True
+        return False
+
+    def _padded(self, size):
+        blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+        if remainder:
+            blocks += 1
+        return blocks * tarfile.BLOCKSIZE
+
+    def _startMember(self):
+        headers = self.buffer[self.offset:self.offset + self.header_length]
+        self.offset += self.header_length
+        self.header_length = 0
+
+        tf = tarfile.open(fileobj=StringIO(headers), mode='r:')
+        tarinfo = tf.firstmember
+        self.member = (tf, tarinfo)
+        path = os.path.join(self.destroot, tarinfo.name)
 
-    for tarinfo in members:
         if tarinfo.isdir():
-            # Extract directories with a safe mode.
-            directories.append(tarinfo)
+            # extract with a safe mode, and set the real mode at the end
+            self.directories.append(self.member)
             tarinfo = copy.copy(tarinfo)
             tarinfo.mode = 0700
-        self.extract(tarinfo, path)
+            tf.extract(tarinfo, self.destroot)
+        elif tarinfo.isreg():
+            upperdirs = os.path.dirname(path)
+            if upperdirs and not os.path.exists(upperdirs):
+                os.makedirs(upperdirs)
+            self.fp = open(path, 'wb')
+            self.data_remaining = tarinfo.size
+            self.padding = self._padded(tarinfo.size) - tarinfo.size
+            if self.data_remaining == 0:
+                self.fp.close()
+                self.fp = None
+                self._finishMember()
+            return
+        else:
+            tf.extract(tarinfo, self.destroot)
 
-    # Reverse sort directories.
-    directories.sort(lambda a, b: cmp(a.name, b.name))
-    directories.reverse()
+        # any data for other members (there should not be any) is skipped
+        self.padding = self._padded(tarinfo.size)
+
+    def _finishMember(self):
+        tf, tarinfo = self.member
+        path = os.path.join(self.destroot, tarinfo.name)
+        tf.chown(tarinfo, path)
+        tf.chmod(tarinfo, path)
+        tf.utime(tarinfo, path)
 
-    # Set correct owner, mtime and filemode on directories.
-    for tarinfo in directories:
-        dirpath = os.path.join(path, tarinfo.name)
-        try:
-            self.chown(tarinfo, dirpath)
-            self.utime(tarinfo, dirpath)
-            self.chmod(tarinfo, dirpath)
-        except tarfile.ExtractError, e:
-            if self.errorlevel > 1:
-                raise
-            else:
-                self._dbg(1, "tarfile: %s" % e)
 
-class _DirectoryWriter(_FileWriter):
+class _DirectoryWriter(pb.Referenceable):
     """
-    A DirectoryWriter is implemented as a FileWriter, with an added post-processing
-    step to unpack the archive, once the transfer has completed.
+    A DirectoryWriter receives a tar stream, as a FileWriter does, and
+    extracts it into a directory as the data arrives.
     """
 
     def __init__(self, destroot, maxsize, compress, mode):
         self.destroot = destroot
-        self.compress = compress
+        self.remaining = maxsize
+        self.extractor = _TarExtractor(destroot, compress)
 
-        self.fd, self.tarname = tempfile.mkstemp()
-        os.close(self.fd)
+    def remote_write(self, data):
+        """
+        Called from remote slave to extract L{data} within boundaries of
+        L{maxsize}
 
-        _FileWriter.__init__(self, self.tarname, maxsize, mode)
+        @type  data: C{string}
+        @param data: String of data to write
+        """
+        if self.remaining is not None:
+            if len(data) > self.remaining:
+                data = data[:self.remaining]
+            self.remaining = self.remaining - len(data)
+        self.extractor.feed(data)
 
     def remote_unpack(self):
         """
         Called by remote slave to state that no more data will be transfered
         """
-        # Make sure remote_close is called, otherwise atomic rename wont happen
-        self.remote_close()
-
-        # Map configured compression to a TarFile setting
-        if self.compress == 'bz2':
-            mode='r|bz2'
-        elif self.compress == 'gz':
-            mode='r|gz'
-        else:
-            mode = 'r'
+        self.extractor.close()
 
-        # Support old python
-        if not hasattr(tarfile.TarFile, 'extractall'):
-            tarfile.TarFile.extractall = _extractall
-
-        # Unpack archive and clean up after self
-        with tarfile.open(name=self.tarname, mode=mode) as archive:
-            archive.extractall(path=self.destroot)
-        os.remove(self.tarname)
+    def cancel(self):
+        self.extractor.cancel()
 
 
 class StatusRemoteCommand(RemoteCommand):
@@ -187,6 +318,17 @@ class _TransferBuildStep(BuildStep):
     haltOnFailure = True
     flunkOnFailure = True
 
+    def _checkWindow(self, window):
+        if not isinstance(window, int) or window < 1:
+            config.error('window must be a positive integer')
+        self.window = window
+
+    def _addWindowArg(self, command, args):
+        # slaves before 2.16 only transfer one block at a time
+        if self.window > 1 and not self.slaveVersionIsOlderThan(command,
+                                                                "2.16"):
+            args['window'] = self.window
+
     def setDefaultWorkdir(self, workdir):
         if self.workdir is None:
             self.workdir = workdir
@@ -224,7 +366,7 @@ class FileUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 keepstamp=False, url=None,
+                 keepstamp=False, url=None, window=4,
                  **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(slavesrc=slavesrc,
@@ -235,6 +377,7 @@ class FileUpload(_TransferBuildStep):
                                  mode=mode,
                                  keepstamp=keepstamp,
                                  url=url,
+                                 window=window,
                                  )
 
         self.slavesrc = slavesrc
@@ -248,6 +391,7 @@ class FileUpload(_TransferBuildStep):
         self.mode = mode
         self.keepstamp = keepstamp
         self.url = url
+        self._checkWindow(window)
 
     def start(self):
         version = self.slaveVersion("uploadFile")
@@ -287,6 +431,7 @@ class FileUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
             }
+        self._addWindowArg('uploadFile', args)
 
         self.cmd = StatusRemoteCommand(self, 'uploadFile', args)
         d = self.runCommand(self.cmd)
@@ -305,7 +450,7 @@ class DirectoryUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16*1024,
-                 compress=None, url=None, **buildstep_kwargs):
+                 compress=None, url=None, window=4, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(slavesrc=slavesrc,
                                  masterdest=masterdest,
@@ -314,6 +459,7 @@ class DirectoryUpload(_TransferBuildStep):
                                  blocksize=blocksize,
                                  compress=compress,
                                  url=url,
+                                 window=window,
                                  )
 
         self.slavesrc = slavesrc
@@ -326,6 +472,7 @@ class DirectoryUpload(_TransferBuildStep):
                 "'compress' must be one of None, 'gz', or 'bz2'")
         self.compress = compress
         self.url = url
+        self._checkWindow(window)
 
     def start(self):
         version = self.slaveVersion("uploadDirectory")
@@ -360,6 +507,7 @@ class DirectoryUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'compress': self.compress
             }
+        self._addWindowArg('uploadDirectory', args)
 
         self.cmd = StatusRemoteCommand(self, 'uploadDirectory', args)
         d = self.runCommand(self.cmd)
@@ -387,7 +535,9 @@ class DirectoryUpload(_TransferBuildStep):
 
 class _FileReader(pb.Referenceable):
     """
-    Helper class that acts as a file-object with read access
+    Helper class that acts as a file-object with read access.  Slaves may have
+    several reads in flight at once; since PB delivers them in order, they are
+    answered from consecutive parts of the file.
     """
 
     def __init__(self, fp):
@@ -426,7 +576,7 @@ class FileDownload(_TransferBuildStep):
 
     def __init__(self, mastersrc, slavedest,
                  workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 **buildstep_kwargs):
+                 window=4, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(mastersrc=mastersrc,
                                  slavedest=slavedest,
@@ -434,6 +584,7 @@ class FileDownload(_TransferBuildStep):
                                  maxsize=maxsize,
                                  blocksize=blocksize,
                                  mode=mode,
+                                 window=window,
                                  )
 
         self.mastersrc = mastersrc
@@ -445,6 +596,7 @@ class FileDownload(_TransferBuildStep):
             config.error(
                 'mode must be an integer or None')
         self.mode = mode
+        self._checkWindow(window)
 
     def start(self):
         version = self.slaveVersion("downloadFile")
@@ -484,6 +636,7 @@ class FileDownload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'mode': self.mode,
             }
+        self._addWindowArg('downloadFile', args)
 
         self.cmd = StatusRemoteCommand(self, 'downloadFile', args)
         d = self.runCommand(self.cmd)
@@ -497,7 +650,7 @@ class StringDownload(_TransferBuildStep):
 
     def __init__(self, s, slavedest,
                  workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 **buildstep_kwargs):
+                 window=4, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
         self.addFactoryArguments(s=s,
                                  slavedest=slavedest,
@@ -505,6 +658,7 @@ class StringDownload(_TransferBuildStep):
                                  maxsize=maxsize,
                                  blocksize=blocksize,
                                  mode=mode,
+                                 window=window,
                                  )
 
         self.s = s
@@ -516,6 +670,7 @@ class StringDownload(_TransferBuildStep):
             config.error(
                 'mode must be an integer or None')
         self.mode = mode
+        self._checkWindow(window)
 
     def start(self):
         version = self.slaveVersion("downloadFile")
@@ -544,6 +699,7 @@ class StringDownload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'mode': self.mode,
             }
+        self._addWindowArg('downloadFile', args)
 
         self.cmd = StatusRemoteCommand(self, 'downloadFile', args)
         d = self.runCommand(self.cmd)
@@ -413,7 +413,18 @@ class FakeChangesComponent(FakeDBComponent):
             ch_uids = []
         return defer.succeed(ch_uids)
 
-    # TODO: getRecentChanges
+    def getChanges(self, changeids):
+        return defer.gatherResults([ self.getChange(changeid)
+                                     for changeid in changeids ])
+
+    def getChangesAfter(self, changeid, count):
+        changeids = sorted([ id for id in self.changes if id > changeid ])
+        return self.getChanges(changeids[:count])
+
+    def getRecentChanges(self, count):
+        changeids = sorted(self.changes.keys())
+        changeids = changeids[max(0, len(changeids) - count):]
+        return self.getChanges(changeids)
 
     # fake methods
 
@@ -881,7 +892,10 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             return defer.succeed(None)
 
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None):
+                         bsid=None, brids=None, after_brid=None,
+                         claimed_since=None):
+        if claimed_since is not None:
+            claimed_since = datetime2epoch(claimed_since)
         rv = []
         for br in self.reqs.itervalues():
             if buildername and br.buildername != buildername:
@@ -905,9 +919,25 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             if bsid is not None:
                 if br.buildsetid != bsid:
                     continue
+            if brids is not None and br.id not in brids:
+                continue
+            if after_brid is not None and br.id <= after_brid:
+                continue
+            if claimed_since is not None:
+                claim_row = self.claims.get(br.id)
+                if not claim_row or claim_row.claimed_at < claimed_since:
+                    continue
             rv.append(self._brdictFromRow(br))
         return defer.succeed(rv)
 
+    def getUnclaimedBuildRequestCounts(self):
+        rv = {}
+        for br in self.reqs.itervalues():
+            if br.complete or br.id in self.claims:
+                continue
+            rv[br.buildername] = rv.get(br.buildername, 0) + 1
+        return defer.succeed(rv)
+
     def claimBuildRequests(self, brids, claimed_at=None):
         for brid in brids:
             if brid not in self.reqs or brid in self.claims:
@@ -936,6 +966,13 @@ class FakeBuildRequestsComponent(FakeDBComponent):
                 objectid=self.MASTER_ID, claimed_at=self._reactor.seconds())
         return defer.succeed(None)
 
+    def unclaimBuildRequests(self, brids):
+        for brid in brids:
+            claim_row = self.claims.get(brid)
+            if claim_row and claim_row.objectid == self.MASTER_ID:
+                del self.claims[brid]
+        return defer.succeed(None)
+
     # Code copied from buildrequests.BuildRequestConnectorComponent
     def _brdictFromRow(self, row):
         claimed = mine = False
@@ -35,6 +35,13 @@ class FakeCache(object):
         d.addCallback(mkref)
         return d
 
+    def add(self, key, value):
+        if value is not None:
+            weakref.ref(value)
+
+    def __contains__(self, key):
+        return False
+
 
 def make_master(master_id=fakedb.FakeBuildRequestsComponent.MASTER_ID):
     """
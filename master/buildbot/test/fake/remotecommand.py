@@ -92,8 +92,11 @@ class FakeLogFile(object):
             for obs in self.step.logobservers[self.name]:
                 obs.errReceived(data)
 
-    def readlines(self): # TODO: remove channel arg from logfile.py
-        return self.stdout.split('\n')
+    def readlines(self, channel=STDOUT):
+        if not isinstance(channel, (list, tuple)):
+            channel = [ channel ]
+        text = ''.join([ data for (ch, data) in self.chunks if ch in channel ])
+        return iter(text.splitlines(True))
 
     def getText(self):
         return self.stdout
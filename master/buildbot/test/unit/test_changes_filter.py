@@ -123,3 +123,55 @@ class ChangeFilter(unittest.TestCase):
         self.yes(Change(project='p', repository='r', branch='b', category='c', ff=True),
                 "all match and fn returns True -> False")
         self.check()
+
+    def test_getIndexKey(self):
+        self.assertEqual(filter.ChangeFilter(branch='b').getIndexKey(),
+                         ('branch', ['b']))
+        self.assertEqual(filter.ChangeFilter(project_re='p.*',
+                                repository=['r1', 'r2']).getIndexKey(),
+                         ('repository', ['r1', 'r2']))
+        self.assertEqual(filter.ChangeFilter(branch_re='b.*').getIndexKey(),
+                         None)
+
+class ChangeSubscriptionPoint(unittest.TestCase):
+
+    def setUp(self):
+        self.subpt = filter.ChangeSubscriptionPoint('changes')
+        self.got = []
+
+    def subscribe(self, name, **kwargs):
+        cf = None
+        if kwargs:
+            cf = filter.ChangeFilter(**kwargs)
+        return self.subpt.subscribe(lambda ch : self.got.append(name),
+                                    change_filter=cf)
+
+    def deliver(self, **kwargs):
+        self.got = []
+        self.subpt.deliver(Change(**kwargs))
+        return sorted(self.got)
+
+    def test_deliver(self):
+        self.subscribe('all')
+        self.subscribe('b1', branch='b1')
+        self.subscribe('b1b2', branch=['b1', 'b2'])
+        self.subscribe('p', project='p', branch_re='b')
+        self.subscribe('re', branch_re='b2')
+        self.assertEqual(self.deliver(branch='b1'), ['all', 'b1', 'b1b2'])
+        self.assertEqual(self.deliver(branch='b2'), ['all', 'b1b2', 're'])
+        self.assertEqual(self.deliver(branch='b2', project='p'),
+                         ['all', 'b1b2', 'p', 're'])
+
+    def test_candidates(self):
+        self.subscribe('b1', branch='b1')
+        self.subscribe('b2', branch='b2')
+        self.subscribe('re', branch_re='b2')
+        self.assertEqual(len(self.subpt.getCandidates(Change(branch='b1'))),
+                         2)
+
+    def test_unsubscribe(self):
+        sub = self.subscribe('b1', branch=['b1', None])
+        self.subscribe('all')
+        sub.unsubscribe()
+        self.assertEqual(self.deliver(branch='b1'), ['all'])
+        self.assertEqual(self.subpt.index, {})
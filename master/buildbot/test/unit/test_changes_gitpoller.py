@@ -16,7 +16,8 @@
 import os
 from twisted.trial import unittest
 from twisted.python import procutils
-from twisted.internet import defer
+from twisted.python import failure
+from twisted.internet import defer, error
 from exceptions import Exception
 from buildbot.changes import gitpoller
 from buildbot.test.util import changesource, gpo
@@ -102,6 +103,31 @@ class GitOutputParsing(gpo.GetProcessOutputMixin, unittest.TestCase):
         return self._perform_git_output_test(self.poller._get_commit_timestamp,
                 stampStr, float(stampStr))
 
+    def test_parse_log_record(self):
+        chdict = self.poller._parse_log_record(
+                '4423cdbc\x001273258009\x00Sammy Jankis <email@example.com>'
+                '\x00subject\nbody\n\x00\n\nfile1\nfile 2\n')
+        self.assertEqual(chdict['revision'], '4423cdbc')
+        self.assertEqual(chdict['when_timestamp'], epoch2datetime(1273258009))
+        self.assertEqual(chdict['author'], 'Sammy Jankis <email@example.com>')
+        self.assertEqual(chdict['comments'], 'subject\nbody')
+        self.assertEqual(chdict['files'], [ 'file1', 'file 2' ])
+        self.assertEqual(chdict['src'], 'git')
+
+    def test_parse_log_record_no_timestamps(self):
+        self.poller.usetimestamps = False
+        chdict = self.poller._parse_log_record(
+                '4423cdbc\x001273258009\x00me\x00subject\x00\n')
+        self.assertEqual(chdict['when_timestamp'], None)
+        self.assertEqual(chdict['files'], [])
+
+    def test_parse_log_record_bad(self):
+        self.assertRaises(EnvironmentError,
+                lambda : self.poller._parse_log_record('4423cdbc\x00garbage'))
+        self.assertRaises(EnvironmentError,
+                lambda : self.poller._parse_log_record(
+                    '4423cdbc\x001273258009\x00\x00subject\x00\n'))
+
     # _get_changes is tested in TestGitPoller, below
 
 class TestGitPoller(gpo.GetProcessOutputMixin,
@@ -191,3 +217,93 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
         d.addCallback(check_changes)
 
         return d
+
+    def patchSpawnProcess(self, chunks, exitCode=0):
+        calls = []
+        def spawnProcess(proto, bin, args, path=None, env=None):
+            calls.append(args)
+            for chunk in chunks:
+                proto.outReceived(chunk)
+            if exitCode:
+                proto.errReceived('fatal: oops')
+                reason = error.ProcessTerminated(exitCode=exitCode)
+            else:
+                reason = error.ProcessDone(0)
+            proto.processEnded(failure.Failure(reason))
+        self.patch(gitpoller.reactor, 'spawnProcess', spawnProcess)
+        return calls
+
+    def test_poll_batched(self):
+        self.poller.batch_log = True
+        self.addGetProcessOutputResult(
+                self.gpoSubcommandPattern('git', 'fetch'),
+                "no interesting output")
+        self.addGetProcessOutputAndValueResult(
+                self.gpoSubcommandPattern('git', 'reset'),
+                ('done', '', 0))
+
+        # records arrive split at arbitrary points
+        output = ('\x1e4423cdbcbb89c14e50dd5f4152415afd686c5241\x00'
+                  '1273258009\x00by:4423cdbc\x00hello!\n\x00\n\n'
+                  '/etc/442\n'
+                  '\x1e64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a\x00'
+                  '1273258010\x00by:64a5dc2a\x00hello again!\n\x00\n\n'
+                  '/etc/64a\n/etc/64b\n')
+        calls = self.patchSpawnProcess([ output[:30], output[30:120],
+                                         output[120:] ])
+
+        d = self.poller.poll()
+
+        def check_changes(_):
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(calls[0][:2], [ '/path/to/git', 'log' ])
+            self.assertIn('master..origin/master', calls[0])
+            self.assertEqual(len(self.changes_added), 2)
+            self.assertEqual(self.changes_added[0]['revision'],
+                    '4423cdbcbb89c14e50dd5f4152415afd686c5241')
+            self.assertEqual(self.changes_added[0]['author'], 'by:4423cdbc')
+            self.assertEqual(self.changes_added[0]['when_timestamp'],
+                                        epoch2datetime(1273258009))
+            self.assertEqual(self.changes_added[0]['comments'], 'hello!')
+            self.assertEqual(self.changes_added[0]['branch'], 'master')
+            self.assertEqual(self.changes_added[0]['files'], [ '/etc/442' ])
+            self.assertEqual(self.changes_added[0]['src'], 'git')
+            self.assertEqual(self.changes_added[1]['author'], 'by:64a5dc2a')
+            self.assertEqual(self.changes_added[1]['when_timestamp'],
+                                        epoch2datetime(1273258010))
+            self.assertEqual(self.changes_added[1]['comments'],
+                                        'hello again!')
+            self.assertEqual(self.changes_added[1]['files'],
+                                        [ '/etc/64a', '/etc/64b' ])
+            self.assertEqual(self.poller.changeCount, 2)
+        d.addCallback(check_changes)
+
+        return d
+
+    def test_poll_batched_no_changes(self):
+        self.poller.batch_log = True
+        self.addGetProcessOutputResult(
+                self.gpoSubcommandPattern('git', 'fetch'),
+                "no interesting output")
+        self.patchSpawnProcess([])
+
+        d = self.poller.poll()
+
+        def check_changes(_):
+            self.assertEqual(self.changes_added, [])
+            self.assertEqual(self.poller.changeCount, 0)
+        d.addCallback(check_changes)
+        return d
+
+    def test_process_changes_batched_git_failure(self):
+        self.poller.batch_log = True
+        self.patchSpawnProcess([], exitCode=128)
+
+        d = self.poller._process_changes_batched(None)
+        def cb(_):
+            self.fail("should have failed")
+        def eb(f):
+            f.trap(EnvironmentError)
+            self.assertSubstring('fatal: oops', str(f.value))
+        d.addCallbacks(cb, eb)
+        return d
@@ -176,7 +176,11 @@ class MasterConfig(ConfigErrorsMixin, dirs.DirsMixin, unittest.TestCase):
             #validation,
             db=dict(
                 db_url='sqlite:///state.sqlite',
-                db_poll_interval=None),
+                db_poll_interval=None,
+                db_full_poll_interval=None,
+                db_thread_pool_size=None,
+                db_pool_size=None,
+                db_max_overflow=None),
             metrics = None,
             caches = dict(Changes=10, Builds=15),
             schedulers = {},
@@ -385,10 +389,14 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         self.do_test_load_global(dict(logCompressionMethod='gz'),
                                  logCompressionMethod='gz')
 
+    def test_load_global_logCompressionMethod_zblocks(self):
+        self.do_test_load_global(dict(logCompressionMethod='zblocks'),
+                                 logCompressionMethod='zblocks')
+
     def test_load_global_logCompressionMethod_invalid(self):
         self.cfg.load_global(self.filename,
                 dict(logCompressionMethod='foo'), self.errors)
-        self.assertConfigError(self.errors, "must be 'bz2' or 'gz'")
+        self.assertConfigError(self.errors, "must be 'bz2', 'gz', or 'zblocks'")
 
     def test_load_global_logMaxSize(self):
         self.do_test_load_global(dict(logMaxSize=123), logMaxSize=123)
@@ -488,22 +496,39 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_db_defaults(self):
         self.cfg.load_db(self.filename, {}, self.errors)
         self.assertResults(
-            db=dict(db_url='sqlite:///state.sqlite', db_poll_interval=None))
+            db=dict(db_url='sqlite:///state.sqlite', db_poll_interval=None,
+                    db_full_poll_interval=None, db_thread_pool_size=None,
+                    db_pool_size=None, db_max_overflow=None))
 
     def test_load_db_db_url(self):
         self.cfg.load_db(self.filename, dict(db_url='abcd'), self.errors)
-        self.assertResults(db=dict(db_url='abcd', db_poll_interval=None))
+        self.assertResults(db=dict(db_url='abcd', db_poll_interval=None,
+                                   db_full_poll_interval=None, db_thread_pool_size=None,
+                    db_pool_size=None, db_max_overflow=None))
 
     def test_load_db_db_poll_interval(self):
         self.cfg.load_db(self.filename, dict(db_poll_interval=2), self.errors)
         self.assertResults(
-            db=dict(db_url='sqlite:///state.sqlite', db_poll_interval=2))
+            db=dict(db_url='sqlite:///state.sqlite', db_poll_interval=2,
+                    db_full_poll_interval=None, db_thread_pool_size=None,
+                    db_pool_size=None, db_max_overflow=None))
 
     def test_load_db_dict(self):
         self.cfg.load_db(self.filename,
             dict(db=dict(db_url='abcd', db_poll_interval=10)),
             self.errors)
-        self.assertResults(db=dict(db_url='abcd', db_poll_interval=10))
+        self.assertResults(db=dict(db_url='abcd', db_poll_interval=10,
+                                   db_full_poll_interval=None, db_thread_pool_size=None,
+                    db_pool_size=None, db_max_overflow=None))
+
+    def test_load_db_full_poll_interval(self):
+        self.cfg.load_db(self.filename,
+            dict(db=dict(db_poll_interval=10, db_full_poll_interval=600)),
+            self.errors)
+        self.assertResults(db=dict(db_url='sqlite:///state.sqlite',
+                    db_poll_interval=10, db_full_poll_interval=600,
+                    db_thread_pool_size=None, db_pool_size=None,
+                    db_max_overflow=None))
 
     def test_load_db_unk_keys(self):
         self.cfg.load_db(self.filename,
@@ -517,6 +542,27 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
             self.errors)
         self.assertConfigError(self.errors, "must be an int")
 
+    def test_load_db_full_poll_interval_not_int(self):
+        self.cfg.load_db(self.filename,
+            dict(db=dict(db_poll_interval=10, db_full_poll_interval='ten')),
+            self.errors)
+        self.assertConfigError(self.errors, "must be an int")
+
+    def test_load_db_pool_sizes(self):
+        self.cfg.load_db(self.filename,
+            dict(db=dict(db_url='abcd', db_thread_pool_size=8,
+                         db_pool_size=6, db_max_overflow=0)),
+            self.errors)
+        self.assertResults(db=dict(db_url='abcd', db_poll_interval=None,
+                    db_full_poll_interval=None, db_thread_pool_size=8,
+                    db_pool_size=6, db_max_overflow=0))
+
+    def test_load_db_pool_size_bad(self):
+        self.cfg.load_db(self.filename,
+            dict(db=dict(db_url='abcd', db_pool_size=0)),
+            self.errors)
+        self.assertConfigError(self.errors, "must be an int of at least 1")
+
 
     def test_load_metrics_defaults(self):
         self.cfg.load_metrics(self.filename, {}, self.errors)
@@ -152,6 +152,30 @@ class TestBuildsetsConnectorComponent(
                 claimed=False,
                 expected=[52])
 
+    def test_getUnclaimedBuildRequestCounts(self):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=50, buildsetid=self.BSID,
+                buildername='bb'),
+            fakedb.BuildRequestClaim(brid=50, objectid=self.MASTER_ID,
+                    claimed_at=self.CLAIMED_AT_EPOCH),
+            fakedb.BuildRequest(id=51, buildsetid=self.BSID,
+                buildername='bb'),
+            fakedb.BuildRequest(id=52, buildsetid=self.BSID,
+                buildername='bb', complete=1),
+            fakedb.BuildRequest(id=53, buildsetid=self.BSID,
+                buildername='cc'),
+            fakedb.BuildRequest(id=54, buildsetid=self.BSID,
+                buildername='cc'),
+            fakedb.BuildRequest(id=55, buildsetid=self.BSID,
+                buildername='dd', complete=1),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getUnclaimedBuildRequestCounts())
+        def check(counts):
+            self.assertEqual(counts, dict(bb=1, cc=2))
+        d.addCallback(check)
+        return d
+
     def do_test_getBuildRequests_buildername_arg(self, **kwargs):
         expected = kwargs.pop('expected')
         d = self.insertTestData([
@@ -245,6 +269,64 @@ class TestBuildsetsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def do_test_getBuildRequests_incremental_args(self, **kwargs):
+        expected = kwargs.pop('expected')
+        d = self.insertTestData([
+            # 60: claimed long ago
+            fakedb.BuildRequest(id=60, buildsetid=self.BSID),
+            fakedb.BuildRequestClaim(brid=60, objectid=self.MASTER_ID,
+                    claimed_at=self.CLAIMED_AT_EPOCH),
+            # 61: claimed recently by another master
+            fakedb.BuildRequest(id=61, buildsetid=self.BSID),
+            fakedb.BuildRequestClaim(brid=61, objectid=self.OTHER_MASTER_ID,
+                    claimed_at=self.COMPLETE_AT_EPOCH),
+            # 62: unclaimed
+            fakedb.BuildRequest(id=62, buildsetid=self.BSID),
+        ] + [
+            # and lots more, to exercise batching of brids
+            fakedb.BuildRequest(id=id, buildsetid=self.BSID)
+            for id in range(1000, 1250)
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequests(**kwargs))
+        def check(brlist):
+            self.assertEqual(sorted([ br['brid'] for br in brlist ]),
+                             sorted(expected))
+        d.addCallback(check)
+        return d
+
+    def test_getBuildRequests_brids(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                brids=[60, 62, 63],
+                expected=[60, 62])
+
+    def test_getBuildRequests_brids_empty(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                brids=[],
+                expected=[])
+
+    def test_getBuildRequests_brids_batched(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                brids=[61] + range(1000, 1250, 2),
+                claimed=True,
+                expected=[61])
+
+    def test_getBuildRequests_brids_many(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                brids=range(1000, 1250),
+                claimed=False,
+                expected=range(1000, 1250))
+
+    def test_getBuildRequests_after_brid(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                after_brid=60, claimed=False,
+                expected=[62] + range(1000, 1250))
+
+    def test_getBuildRequests_claimed_since(self):
+        return self.do_test_getBuildRequests_incremental_args(
+                claimed=True, claimed_since=self.SUBMITTED_AT,
+                expected=[61])
+
     def test_getBuildRequests_combo(self):
         d = self.insertTestData([
             # 44: everything we want
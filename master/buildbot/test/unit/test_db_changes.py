@@ -359,6 +359,92 @@ class TestChangesConnectorComponent(
         d.addCallback(check_change_users)
         return d
 
+    def test_getChanges(self):
+        d = self.insertTestData(self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([14, 99, 13]))
+        def check(chdicts):
+            self.assertEqual(chdicts[0], self.change14_dict)
+            self.assertEqual(chdicts[1], None)
+            self.assertEqual(chdicts[2]['changeid'], 13)
+            self.assertEqual(sorted(chdicts[2]['files']),
+                        sorted(['master/README.txt', 'slave/README.txt']))
+            self.assertEqual(chdicts[2]['properties'],
+                        { 'notest' : ('no', 'Change') })
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_batched(self):
+        self.db.changes.MAX_CHANGEIDS_PER_QUERY = 2
+        d = self.insertTestData([
+            fakedb.Change(changeid=10),
+            fakedb.Change(changeid=11),
+            fakedb.Change(changeid=12),
+        ] + self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([10, 11, 12, 13, 14]))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ],
+                             [10, 11, 12, 13, 14])
+            self.assertEqual(chdicts[4], self.change14_dict)
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_cached(self):
+        cache = self.db.changes.getChange.cache = mock.Mock()
+        cache.__contains__ = lambda self, changeid : changeid == 14
+        cache.get.return_value = defer.succeed(self.change14_dict)
+        d = self.insertTestData(self.change13_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChanges([13, 14]))
+        def check(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ], [13, 14])
+            cache.get.assert_called_once_with(14)
+            self.assertEqual(cache.add.call_args[0][0], 13)
+        d.addCallback(check)
+        return d
+
+    def test_getChanges_all_cached(self):
+        cache = self.db.changes.getChange.cache = mock.Mock()
+        cache.__contains__ = lambda self, changeid : True
+        cache.get.return_value = defer.succeed(self.change14_dict)
+        self.db.pool.do = mock.Mock()
+        d = self.db.changes.getChanges([14])
+        def check(chdicts):
+            self.assertEqual(chdicts, [ self.change14_dict ])
+            self.assertFalse(self.db.pool.do.called)
+        d.addCallback(check)
+        return d
+
+    def test_getChangesAfter(self):
+        d = self.insertTestData([
+            fakedb.Change(changeid=10),
+            fakedb.Change(changeid=12),
+        ] + self.change13_rows + self.change14_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(10, 3))
+        def check(chdicts):
+            # 11 does not exist
+            self.assertEqual([ c['changeid'] for c in chdicts ],
+                             [12, 13, 14])
+            self.assertEqual(chdicts[2], self.change14_dict)
+        d.addCallback(check)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(12, 1))
+        def check_count(chdicts):
+            self.assertEqual([ c['changeid'] for c in chdicts ], [13])
+            self.assertEqual(chdicts[0]['properties'],
+                        { 'notest' : ('no', 'Change') })
+        d.addCallback(check_count)
+        return d
+
+    def test_getChangesAfter_none(self):
+        d = self.insertTestData(self.change13_rows)
+        d.addCallback(lambda _ :
+                self.db.changes.getChangesAfter(13, 10))
+        d.addCallback(self.assertEqual, [])
+        return d
+
     def test_getChangeUids_missing(self):
         d = self.db.changes.getChangeUids(1)
         def check(res):
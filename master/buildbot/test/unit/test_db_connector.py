@@ -90,3 +90,11 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
     def test_setup_check_version_good(self):
         self.db.model.is_current = lambda : defer.succeed(True)
         return self.startService(check_version=True)
+
+    def test_setup_thread_pool_size(self):
+        self.master.config.db['db_thread_pool_size'] = 1
+        d = self.startService()
+        @d.addCallback
+        def check(_):
+            self.assertEqual(self.db.pool.max, 1)
+        return d
@@ -90,6 +90,14 @@ class BuildbotEngineStrategy_special_cases(unittest.TestCase):
                    # note: no poolclass= argument
                    pool_size=1) ]) # extra in-memory args
 
+    def test_sqlite_pool_args_ignored(self):
+        u = url.make_url("sqlite:///x/state.sqlite")
+        kwargs = dict(basedir='/my-base-dir', pool_size=10, max_overflow=0)
+        u, kwargs, max_conns = self.strat.special_case_sqlite(u, kwargs)
+        self.assertEqual([ str(u), max_conns, self.filter_kwargs(kwargs) ],
+            [ "sqlite:////my-base-dir/x/state.sqlite", None,
+              self.sqlite_kwargs ])
+
     def test_mysql_simple(self):
         u = url.make_url("mysql://host/dbname")
         kwargs = dict(basedir='my-base-dir')
@@ -19,6 +19,7 @@ import sqlalchemy as sa
 from twisted.trial import unittest
 from twisted.internet import defer, reactor
 from buildbot.db import pool
+from buildbot.process import metrics
 from buildbot.test.util import db
 
 class Basic(unittest.TestCase):
@@ -105,6 +106,63 @@ class Basic(unittest.TestCase):
         d.addCallback( lambda r : self.pool.do_with_engine(insert_into_table))
         return d
 
+    def patchMetrics(self):
+        events = []
+        self.patch(metrics.MetricHistogramEvent, 'log',
+                classmethod(lambda cls, name, value :
+                                events.append(('hist', name, value))))
+        self.patch(metrics.MetricCountEvent, 'log',
+                classmethod(lambda cls, name, count=1, absolute=False :
+                                events.append(('count', name, count))))
+        return events
+
+    def test_do_metrics(self):
+        events = self.patchMetrics()
+        d = self.pool.do(lambda conn : [ 1, 2, 3 ])
+        def check(_):
+            self.assertEqual(sorted([ (k, n) for k, n, v in events ]), [
+                    ('count', 'db.test_db_pool.test_do_metrics().rows'),
+                    ('hist', 'DBThreadPool.queue-depth'),
+                    ('hist', 'DBThreadPool.queue-wait'),
+                    ('hist', 'db.test_db_pool.test_do_metrics()'),
+                ])
+            self.assertIn(('count',
+                'db.test_db_pool.test_do_metrics().rows', 3), events)
+        d.addCallback(check)
+        return d
+
+    def test_do_metrics_failure(self):
+        events = self.patchMetrics()
+        def fail(conn):
+            raise RuntimeError("oh noes")
+        d = self.pool.do(fail)
+        def check(f):
+            f.trap(RuntimeError)
+            self.assertEqual(sorted([ n for k, n, v in events ]), [
+                    'DBThreadPool.queue-depth', 'DBThreadPool.queue-wait',
+                    'db.test_db_pool.test_do_metrics_failure()' ])
+        d.addCallbacks(lambda _ : self.fail("no exception"), check)
+        return d
+
+
+class PoolSize(unittest.TestCase):
+
+    def makePool(self, optimal, pool_size):
+        engine = sa.create_engine('sqlite://')
+        engine.optimal_thread_pool_size = optimal
+        p = pool.DBThreadPool(engine, pool_size=pool_size)
+        self.addCleanup(p.shutdown)
+        return p
+
+    def test_default(self):
+        self.assertEqual(self.makePool(7, None).max, 7)
+
+    def test_configured(self):
+        self.assertEqual(self.makePool(15, 4).max, 4)
+
+    def test_limited_to_connections(self):
+        self.assertEqual(self.makePool(1, 4).max, 1)
+
 
 class Stress(unittest.TestCase):
 
@@ -499,6 +499,70 @@ class Polling(dirs.DirsMixin, misc.PatcherMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_pollDatabaseChanges_pages(self):
+        self.master.CHANGE_POLL_BATCH = 2
+        self.db.insertTestData([
+            fakedb.Object(id=53, name=self.master_name,
+                          class_name='buildbot.master.BuildMaster'),
+            fakedb.ObjectState(objectid=53, name='last_processed_change',
+                               value_json='10'),
+        ] + [ fakedb.Change(changeid=n) for n in range(10, 16) ])
+        d = self.master.pollDatabaseChanges()
+        def check(_):
+            self.assertEqual([ ch.number for ch in self.gotten_changes],
+                             [ 11, 12, 13, 14, 15 ])
+            self.db.state.assertState(53, last_processed_change=15)
+        d.addCallback(check)
+        return d
+
+    @defer.inlineCallbacks
+    def test_pollDatabaseChanges_gap(self):
+        now = [ 1000 ]
+        self.patch(master.reactor, 'seconds', lambda : now[0])
+        self.db.insertTestData([
+            fakedb.Object(id=53, name=self.master_name,
+                          class_name='buildbot.master.BuildMaster'),
+            fakedb.ObjectState(objectid=53, name='last_processed_change',
+                               value_json='10'),
+            fakedb.Change(changeid=10),
+            fakedb.Change(changeid=11),
+            # 12 and 13 were rolled back
+            fakedb.Change(changeid=14),
+        ])
+        yield self.master.pollDatabaseChanges()
+        # 12 and 13 may still be committed by another master
+        self.assertEqual([ ch.number for ch in self.gotten_changes], [ 11 ])
+        self.db.state.assertState(53, last_processed_change=11)
+        now[0] += self.master.CLAIM_POLL_SLACK / 2
+        yield self.master.pollDatabaseChanges()
+        self.assertEqual([ ch.number for ch in self.gotten_changes], [ 11 ])
+        # until they have been missing for long enough
+        now[0] += self.master.CLAIM_POLL_SLACK
+        yield self.master.pollDatabaseChanges()
+        self.assertEqual([ ch.number for ch in self.gotten_changes],
+                         [ 11, 14 ])
+        self.db.state.assertState(53, last_processed_change=14)
+
+    @defer.inlineCallbacks
+    def test_pollDatabaseChanges_gap_filled(self):
+        self.patch(master.reactor, 'seconds', lambda : 1000)
+        self.db.insertTestData([
+            fakedb.Object(id=53, name=self.master_name,
+                          class_name='buildbot.master.BuildMaster'),
+            fakedb.ObjectState(objectid=53, name='last_processed_change',
+                               value_json='10'),
+            fakedb.Change(changeid=10),
+            fakedb.Change(changeid=12),
+        ])
+        yield self.master.pollDatabaseChanges()
+        self.assertEqual(self.gotten_changes, [])
+        # another master commits change 11 after change 12
+        self.db.insertTestData([ fakedb.Change(changeid=11) ])
+        yield self.master.pollDatabaseChanges()
+        self.assertEqual([ ch.number for ch in self.gotten_changes],
+                         [ 11, 12 ])
+        self.db.state.assertState(53, last_processed_change=12)
+
     def test_pollDatabaseChanges_nothing_new(self):
         self.db.insertTestData([
             fakedb.Object(id=53, name='master',
@@ -577,3 +641,89 @@ class Polling(dirs.DirsMixin, misc.PatcherMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_pollDatabaseBuildRequests_high_water_mark(self):
+        self.master.config.db['db_full_poll_interval'] = 3600
+        queries = []
+        getBuildRequests = self.db.buildrequests.getBuildRequests
+        def logging_getBuildRequests(**kwargs):
+            queries.append(kwargs)
+            return getBuildRequests(**kwargs)
+        self.db.buildrequests.getBuildRequests = logging_getBuildRequests
+
+        d = defer.succeed(None)
+        def insert1(_):
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=11, buildsetid=9,
+                                        buildername='eleventy'),
+                fakedb.BuildRequest(id=12, buildsetid=9,
+                                        buildername='twelvety'),
+            ])
+            self.db.buildrequests.fakeClaimBuildRequest(12)
+        d.addCallback(insert1)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check_full(_):
+            self.assertEqual(self.master._brid_high_water_mark, 12)
+            self.assertEqual(self.master._last_claimed_brids_set, set([12]))
+            del queries[:]
+        d.addCallback(check_full)
+        def insert2_and_claim(_):
+            self.gotten_buildrequest_additions.append('MARK')
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=20, buildsetid=9,
+                                        buildername='twenty'),
+            ])
+            self.db.buildrequests.fakeClaimBuildRequest(11)
+            # 12 finishes
+            self.db.buildrequests.reqs[12].complete = 1
+        d.addCallback(insert2_and_claim)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def unclaim(_):
+            self.assertEqual(self.master._brid_high_water_mark, 20)
+            self.assertEqual(self.master._last_claimed_brids_set, set([11]))
+            self.gotten_buildrequest_additions.append('MARK')
+            self.db.buildrequests.fakeUnclaimBuildRequest(11)
+        d.addCallback(unclaim)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check(_):
+            self.assertEqual(self.gotten_buildrequest_additions, [
+                dict(bsid=9, brid=11, buildername='eleventy'),
+                'MARK',
+                dict(bsid=9, brid=20, buildername='twenty'),
+                'MARK',
+                dict(bsid=9, brid=11, buildername='eleventy'),
+            ])
+            self.assertEqual(self.master._last_unclaimed_brids_set,
+                             set([11, 20]))
+            # no full scans after the first poll
+            self.assertNotIn(dict(claimed=False), queries)
+        d.addCallback(check)
+        return d
+
+    def test_pollDatabaseBuildRequests_full_poll_interval(self):
+        self.master.config.db['db_full_poll_interval'] = 3600
+        self.patch(master, 'reactor', task.Clock())
+        master.reactor.advance(10000)
+        queries = []
+        getBuildRequests = self.db.buildrequests.getBuildRequests
+        def logging_getBuildRequests(**kwargs):
+            queries.append(kwargs)
+            return getBuildRequests(**kwargs)
+        self.db.buildrequests.getBuildRequests = logging_getBuildRequests
+
+        d = self.master.pollDatabaseBuildRequests()
+        def incremental(_):
+            del queries[:]
+            master.reactor.advance(10)
+            return self.master.pollDatabaseBuildRequests()
+        d.addCallback(incremental)
+        def full(_):
+            self.assertNotIn(dict(claimed=False), queries)
+            del queries[:]
+            master.reactor.advance(3600)
+            return self.master.pollDatabaseBuildRequests()
+        d.addCallback(full)
+        def check(_):
+            self.assertIn(dict(claimed=False), queries)
+        d.addCallback(check)
+        return d
+
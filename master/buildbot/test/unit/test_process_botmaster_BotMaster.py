@@ -229,6 +229,24 @@ class TestBotMaster(unittest.TestCase):
         self.assertEqual(self.botmaster.builders, {})
         self.assertEqual(self.botmaster.builderNames, [])
 
+    def test_buildRequestAdded(self):
+        brd = self.botmaster.brd = mock.Mock()
+        bldr = self.botmaster.builders['frank'] = mock.Mock()
+        callback = self.master.subscribeToBuildRequests.call_args[0][0]
+
+        callback(dict(bsid=10, brid=20, buildername='frank'))
+
+        bldr.buildRequestAdded.assert_called_once_with(20)
+        brd.maybeStartBuildsOn.assert_called_once_with(['frank'])
+
+    def test_buildRequestAdded_unknown_builder(self):
+        brd = self.botmaster.brd = mock.Mock()
+        callback = self.master.subscribeToBuildRequests.call_args[0][0]
+
+        callback(dict(bsid=10, brid=20, buildername='frank'))
+
+        brd.maybeStartBuildsOn.assert_called_once_with(['frank'])
+
     def test_maybeStartBuildsForBuilder(self):
         brd = self.botmaster.brd = mock.Mock()
 
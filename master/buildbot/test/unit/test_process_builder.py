@@ -314,6 +314,90 @@ class TestBuilderBuildCreation(unittest.TestCase):
         yield self.do_test_maybeStartBuild(rows=rows,
                 exp_claims=[11], exp_builds=[('test-slave2', [11])])
 
+    def logGetBuildRequests(self):
+        queries = []
+        getBuildRequests = self.db.buildrequests.getBuildRequests
+        def logging_getBuildRequests(**kwargs):
+            queries.append(kwargs)
+            return getBuildRequests(**kwargs)
+        self.db.buildrequests.getBuildRequests = logging_getBuildRequests
+        return queries
+
+    @defer.inlineCallbacks
+    def test_maybeStartBuild_queue_not_refetched(self):
+        yield self.makeBuilder(mergeRequests=False)
+        queries = self.logGetBuildRequests()
+
+        self.setSlaveBuilders({'test-slave1':1})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, buildername="bldr",
+                submitted_at=130000),
+            fakedb.BuildRequest(id=11, buildsetid=11, buildername="bldr",
+                submitted_at=135000),
+        ]
+        yield self.do_test_maybeStartBuild(rows=rows,
+                exp_claims=[10], exp_builds=[('test-slave1', [10])])
+        self.assertEqual(len(queries), 1)
+
+        # a new request arrives, and is older than 11 (weird, but tests the
+        # sort); only that request is fetched from the db
+        yield self.db.insertTestData([
+            fakedb.BuildRequest(id=12, buildsetid=11, buildername="bldr",
+                submitted_at=131000),
+        ])
+        self.bldr.buildRequestAdded(12)
+        self.builds_started = []
+        yield self.do_test_maybeStartBuild(
+                exp_claims=[10, 12], exp_builds=[('test-slave1', [12])])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[1]['brids'], [12])
+
+        self.assertEqual([ brd['brid'] for brd in
+                           self.bldr._unclaimed_requests ], [11])
+
+    @defer.inlineCallbacks
+    def test_maybeStartBuild_queue_reconciled(self):
+        yield self.makeBuilder(mergeRequests=False)
+        queries = self.logGetBuildRequests()
+
+        self.setSlaveBuilders({'test-slave1':0})
+        rows = self.base_rows + [
+            fakedb.BuildRequest(id=10, buildsetid=11, buildername="bldr",
+                submitted_at=130000),
+        ]
+        yield self.do_test_maybeStartBuild(rows=rows,
+                exp_claims=[], exp_builds=[])
+        # no slaves, so no need to look at the requests
+        self.assertEqual(len(queries), 0)
+
+        self.setSlaveBuilders({'test-slave1':1})
+        yield self.bldr.getOldestRequestTime()
+        self.assertEqual(len(queries), 1)
+
+        # another master claims 10 and adds 11, without telling us
+        self.db.buildrequests.fakeClaimBuildRequest(10, objectid=9999)
+        yield self.db.insertTestData([
+            fakedb.BuildRequest(id=11, buildsetid=11, buildername="bldr",
+                submitted_at=135000),
+        ])
+        # .. so it's not until the queue is reconciled that we see 11
+        self.bldr._unclaimed_fetched_at -= \
+                self.bldr.UNCLAIMED_RECONCILE_INTERVAL
+        yield self.do_test_maybeStartBuild(
+                exp_claims=[11], exp_builds=[('test-slave1', [11])])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[1], dict(buildername='bldr', claimed=False))
+
+    @defer.inlineCallbacks
+    def test_resubmit_buildreqs_requeues(self):
+        yield self.makeBuilder()
+        build = mock.Mock()
+        build.requests = [ mock.Mock(id=10), mock.Mock(id=11) ]
+
+        yield self.bldr._resubmit_buildreqs(build)
+
+        self.assertEqual(self.bldr._unclaimed_pending_brids, set([10, 11]))
+
     @defer.inlineCallbacks
     def test_maybeStartBuild_builder_stopped(self):
         yield self.makeBuilder()
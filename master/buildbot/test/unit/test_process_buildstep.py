@@ -190,3 +190,38 @@ class TestLoggingBuildStep(unittest.TestCase):
         lbs = buildstep.LoggingBuildStep(log_eval_func=eval)
         status = lbs.evaluateCommand(cmd)
         self.assertEqual(status, WARNINGS, "evaluateCommand didn't call log_eval_func or overrode its results")
+
+
+class TestRemoteCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.cmd = buildstep.RemoteCommand('shell', {})
+        self.cmd.active = True
+        self.cmd.updates = {}
+        self.cmd.buildslave = mock.Mock()
+        self.stdio = mock.Mock()
+        self.other = mock.Mock()
+        self.cmd.logs = dict(stdio=self.stdio, other=self.other)
+
+    def test_remote_update_batch_in_order(self):
+        calls = []
+        self.stdio.addStdout = lambda d : calls.append(('stdout', d))
+        self.stdio.addStderr = lambda d : calls.append(('stderr', d))
+        self.other.addStdout = lambda d : calls.append(('other', d))
+        self.cmd.remote_update([ [{'stdout' : 'a'}, 0],
+                                 [{'log' : ('other', 'b')}, 0],
+                                 [{'stderr' : 'c'}, 0],
+                                 [{'stdout' : 'd'}, 0] ])
+        self.assertEqual(calls, [ ('stdout', 'a'), ('other', 'b'),
+                                  ('stderr', 'c'), ('stdout', 'd') ])
+        self.assertEqual(self.cmd.buildslave.messageReceivedFromSlave.call_count,
+                         1)
+
+    def test_remote_update_batch_failure(self):
+        self.cmd._finished = mock.Mock(side_effect=lambda f :
+                                            setattr(self.cmd, 'active', False))
+        self.stdio.addStdout.side_effect = RuntimeError('oops')
+        self.cmd.remote_update([ [{'stdout' : 'a'}, 0],
+                                 [{'stderr' : 'b'}, 0] ])
+        self.assertEqual(self.cmd._finished.call_count, 1)
+        self.assertFalse(self.stdio.addStderr.called)
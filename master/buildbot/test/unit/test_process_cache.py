@@ -16,6 +16,7 @@
 import mock
 from twisted.trial import unittest
 from buildbot.process import cache
+from buildbot.util import lru
 
 class CacheManager(unittest.TestCase):
 
@@ -49,5 +50,21 @@ class CacheManager(unittest.TestCase):
         self.caches.get_cache("foo", None)
         self.assertIn('foo', self.caches.get_metrics())
         metric = self.caches.get_metrics()['foo']
-        for k in 'hits', 'refhits', 'misses', 'max_size':
+        for k in 'hits', 'refhits', 'misses', 'evictions', 'size', 'max_size':
             self.assertIn(k, metric)
+
+    def test_get_metrics_registered(self):
+        caches = [ lru.LRUCache(lambda k : set([k]), 2) for i in range(2) ]
+        for c in caches:
+            self.caches.register_cache("bar", c)
+        for k in 'abc':
+            caches[0].get(k)
+        caches[1].get('a')
+        caches[1].get('a')
+        self.assertEqual(self.caches.get_metrics()['bar'],
+                dict(hits=1, refhits=0, misses=4, evictions=1, size=3,
+                     max_size=2))
+
+        # registered caches are weakly referenced
+        del caches, c
+        self.assertNotIn('bar', self.caches.get_metrics())
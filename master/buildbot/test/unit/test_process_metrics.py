@@ -123,6 +123,25 @@ class TestMetricTimeEvent(TestMetricBase):
         report = self.observer.asDict()
         self.assertEquals(report['timers']['foo_time'], sum(data)/float(len(data)))
 
+class TestMetricHistogramEvent(TestMetricBase):
+    def testHistogram(self):
+        for v in 0.0005, 0.003, 0.003, 0.04, 20000:
+            metrics.MetricHistogramEvent.log('foo_hist', v)
+        report = self.observer.asDict()
+        self.assertEquals(report['histograms']['foo_hist'],
+                dict(count=5, total=20000.0465, max=20000,
+                     buckets={'<=0.0005' : 1, '<=0.005' : 2, '<=0.05' : 1,
+                              '>10000' : 1}))
+
+    def testPercentile(self):
+        h = metrics.Histogram()
+        self.assertEquals(h.percentile(50), 0)
+        for v in range(1, 101):
+            h.add(v)
+        self.assertEquals((h.percentile(50), h.percentile(90),
+                           h.percentile(100)), (50, 100, 100))
+        self.assertEquals(h.average(), 50.5)
+
 class TestPeriodicChecks(TestMetricBase):
     def testPeriodicCheck(self):
         # fake out that there's no garbage (since we can't rely on Python
@@ -225,6 +244,16 @@ class TestReports(unittest.TestCase):
         self.assertEquals("Timer time_foo: 1", handler.report())
         self.assertEquals({"timers": {"time_foo": 1}}, handler.asDict())
 
+    def testMetricHistogramReport(self):
+        handler = metrics.MetricHistogramHandler(None)
+        handler.handle({}, metrics.MetricHistogramEvent('hist_foo', 0.3))
+
+        self.assertEquals("Histogram hist_foo: count=1 avg=0.3 p50=0.3 "
+                          "p90=0.3 p99=0.3 max=0.3", handler.report())
+        self.assertEquals({"histograms": {"hist_foo": dict(count=1,
+                            total=0.3, max=0.3, buckets={'<=0.5' : 1})}},
+                          handler.asDict())
+
     def testMetricAlarmReport(self):
         handler = metrics.MetricAlarmHandler(None)
         handler.handle({}, metrics.MetricAlarmEvent('alarm_foo', msg='Uh oh', level=metrics.ALARM_WARN))
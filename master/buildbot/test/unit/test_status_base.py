@@ -0,0 +1,48 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+
+from buildbot.status import base
+
+class StatusSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.sub = base.StatusSubscriber(self.status)
+
+    def test_subscribe_once(self):
+        self.sub.subscribe()
+        self.sub.subscribe()
+        self.assertEqual(self.status.subscribe.call_count, 1)
+        self.assertIdentical(self.sub.builderAdded('bldr', mock.Mock()),
+                             self.sub)
+
+    def test_stop(self):
+        self.sub.subscribe()
+        bs1, bs2 = mock.Mock(), mock.Mock()
+        bs1.unsubscribe.side_effect = ValueError
+        self.sub.builderAdded('bldr1', bs1)
+        self.sub.builderAdded('bldr2', bs2)
+        self.sub.stop()
+        self.status.unsubscribe.assert_called_with(self.sub)
+        bs2.unsubscribe.assert_called_with(self.sub)
+        self.assertEqual(self.sub.builders, [])
+        self.assertFalse(self.sub.subscribed)
+
+    def test_stop_unsubscribed(self):
+        self.sub.stop()
+        self.assertFalse(self.status.unsubscribe.called)
@@ -0,0 +1,63 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+from twisted.trial import unittest
+from buildbot.status import builder, build
+from buildbot.sourcestamp import SourceStamp
+from buildbot.test.fake import fakemaster
+from buildbot.test.util import dirs
+
+class BuildCache(dirs.DirsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        d = self.setUpDirs(self.basedir)
+        master = fakemaster.make_master()
+        master.config.caches = dict(Builds=2)
+        self.bs = builder.BuilderStatus('bldr', None, master)
+        self.bs.basedir = self.basedir
+        self.bs.nextBuildNumber = 5
+        for n in range(5):
+            b = build.BuildStatus(self.bs, master, n)
+            b.source = SourceStamp()
+            b.finished = 100
+            b.saveYourself()
+        return d
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def test_getBuildByNumber_caches(self):
+        b1 = self.bs.getBuildByNumber(1)
+        self.assertIdentical(self.bs.getBuildByNumber(1), b1)
+        self.assertEqual((self.bs.buildCache.hits, self.bs.buildCache.misses),
+                         (1, 1))
+
+    def test_getBuildByNumber_evicts(self):
+        for n in 0, 1, 2, 0, 3:
+            self.bs.getBuildByNumber(n)
+        self.assertEqual(sorted(self.bs.buildCache.cache), [0, 3])
+        self.assertEqual(self.bs.buildCache.evictions, 3)
+
+    def test_getBuildByNumber_missing(self):
+        self.assertRaises(IndexError, lambda : self.bs.getBuildByNumber(7))
+        self.assertEqual(self.bs.getBuild(7), None)
+
+    def test_cache_size_follows_config(self):
+        self.bs.getBuildByNumber(0)
+        self.bs.master.config.caches = dict(Builds=10)
+        self.bs.getBuildByNumber(1)
+        self.assertEqual(self.bs.buildCache.max_size, 10)
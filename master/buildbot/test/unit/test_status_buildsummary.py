@@ -0,0 +1,244 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+import mock
+from twisted.trial import unittest
+from buildbot.status import buildsummary, builder, build
+from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.sourcestamp import SourceStamp
+from buildbot.test.fake import fakemaster
+from buildbot.test.util import dirs
+
+class BuildSummary(unittest.TestCase):
+
+    def test_asDict_fromDict(self):
+        s = buildsummary.BuildSummary(3, started=10, finished=20,
+                results=SUCCESS, text=['build', 'successful'],
+                branch='br', revision='abcd', got_revision='abcd',
+                slavename='sl', reason='because')
+        self.assertEqual(buildsummary.BuildSummary.fromDict(s.asDict()), s)
+
+    def test_fromDict_unicode_keys_extra_fields(self):
+        s = buildsummary.BuildSummary.fromDict({u'number' : 3,
+                                                u'results' : FAILURE,
+                                                u'future' : 'x'})
+        self.assertEqual((s.getNumber(), s.getResults()), (3, FAILURE))
+
+    def test_isFinished(self):
+        self.assertFalse(buildsummary.BuildSummary(1, started=10).isFinished())
+        self.assertTrue(buildsummary.BuildSummary(1, finished=10).isFinished())
+
+
+class BuildSummaryStore(dirs.DirsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        return self.setUpDirs(self.basedir)
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def summary(self, number, **kwargs):
+        return buildsummary.BuildSummary(number, finished=number*10, **kwargs)
+
+    def test_empty(self):
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.get(1), None)
+        self.assertEqual(store.getNumbers(), [])
+
+    def test_add_reload(self):
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        store.add(self.summary(1))
+        store.add(self.summary(2, results=FAILURE))
+        store.add(self.summary(1, results=SUCCESS)) # replaces the first
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.getNumbers(), [1, 2])
+        self.assertEqual(store.get(1), self.summary(1, results=SUCCESS))
+        self.assertEqual(store.get(2), self.summary(2, results=FAILURE))
+
+    def test_truncated_line(self):
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        store.add(self.summary(1))
+        with open(store.path, "ab") as f:
+            f.write('{"number": 2, "fin')
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.getNumbers(), [1])
+
+    def test_prune(self):
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        for n in range(5):
+            store.add(self.summary(n))
+        store.prune(3)
+        self.assertEqual(store.getNumbers(), [3, 4])
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.getNumbers(), [3, 4])
+        with open(store.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+class BuilderStatusMixin(object):
+
+    def makeBuilderStatus(self):
+        master = fakemaster.make_master()
+        master.config.caches = dict(Builds=15)
+        bs = builder.BuilderStatus('bldr', None, master)
+        bs.basedir = self.basedir
+        bs.nextBuildNumber = 0
+        return bs
+
+    def makeBuild(self, bs, branch=None, results=SUCCESS):
+        b = build.BuildStatus(bs, bs.master, bs.nextBuildNumber)
+        bs.nextBuildNumber += 1
+        b.source = SourceStamp(branch=branch, revision='rev%d' % b.number)
+        b.started = 100 + b.number
+        b.finished = 200 + b.number
+        b.results = results
+        b.text = [ 'build', str(b.number) ]
+        b.reason = 'testing'
+        b.slavename = 'slave'
+        b.setProperty('got_revision', 'rev%d' % b.number, 'test')
+        return b
+
+
+class IndexBuilds(BuilderStatusMixin, dirs.DirsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        return self.setUpDirs(self.basedir)
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def test_indexBuilds(self):
+        bs = self.makeBuilderStatus()
+        for i in range(3):
+            self.makeBuild(bs, branch='br%d' % i).saveYourself()
+        # garbage files are ignored
+        with open(os.path.join(self.basedir, "3"), "wb") as f:
+            f.write("not a pickle")
+        with open(os.path.join(self.basedir, "2-log"), "wb") as f:
+            f.write("a log")
+
+        self.assertEqual(buildsummary.indexBuilds(self.basedir), 3)
+        self.assertEqual(len(self.flushLoggedErrors()), 1)
+
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.getNumbers(), [0, 1, 2])
+        self.assertEqual(store.get(1).asDict(),
+                dict(number=1, started=101, finished=201, results=SUCCESS,
+                     text=['build', '1'], branch='br1', revision='rev1',
+                     got_revision='rev1', slavename='slave',
+                     reason='testing'))
+
+
+class BuilderStatusSummaries(BuilderStatusMixin, dirs.DirsMixin,
+                             unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        d = self.setUpDirs(self.basedir)
+        self.bs = self.makeBuilderStatus()
+        self.bs.prune = lambda : None
+        return d
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def finishBuild(self, **kwargs):
+        b = self.makeBuild(self.bs, **kwargs)
+        self.bs.currentBuilds.append(b)
+        self.bs._buildFinished(b)
+        return b
+
+    def test_buildFinished_indexes(self):
+        self.finishBuild(branch='br')
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.get(0).getBranch(), 'br')
+
+    def test_getBuildSummary_does_not_load_builds(self):
+        self.finishBuild()
+        self.bs.getBuildByNumber = mock.Mock()
+        self.assertEqual(self.bs.getBuildSummary(-1).getNumber(), 0)
+        self.assertEqual(self.bs.getBuildSummary(5), None)
+        self.assertFalse(self.bs.getBuildByNumber.called)
+
+    def test_getBuildSummary_current(self):
+        b = self.makeBuild(self.bs)
+        b.finished = None
+        self.bs.currentBuilds.append(b)
+        s = self.bs.getBuildSummary(0)
+        self.assertFalse(s.isFinished())
+        self.assertEqual(self.bs.getSummaryStore().getNumbers(), [])
+
+    def test_getBuildSummary_unindexed(self):
+        # a build from before the index existed is indexed when first seen
+        self.makeBuild(self.bs, branch='old').saveYourself()
+        self.assertEqual(self.bs.getBuildSummary(0).getBranch(), 'old')
+        store = buildsummary.BuildSummaryStore(self.basedir)
+        self.assertEqual(store.getNumbers(), [0])
+
+    def test_generateFinishedBuilds_filters_on_summaries(self):
+        for i in range(6):
+            self.finishBuild(branch=('a', 'b')[i % 2])
+
+        loaded = []
+        getBuildByNumber = self.bs.getBuildByNumber
+        def trackLoads(number):
+            loaded.append(number)
+            return getBuildByNumber(number)
+        self.bs.getBuildByNumber = trackLoads
+
+        builds = list(self.bs.generateFinishedBuilds(branches=['b'],
+                                                     num_builds=2))
+        self.assertEqual([ b.getNumber() for b in builds ], [5, 3])
+        self.assertEqual(loaded, [5, 3])
+
+    def test_generateFinishedBuildSummaries_finished_before(self):
+        for i in range(4):
+            self.finishBuild()
+        summaries = self.bs.generateFinishedBuildSummaries(
+                                finished_before=202, max_buildnum=2)
+        self.assertEqual([ s.getNumber() for s in summaries ], [1, 0])
+
+    def test_generateBuildSummaryHistory(self):
+        for i in range(5):
+            self.finishBuild()
+        running = self.makeBuild(self.bs)
+        running.finished = None
+        self.bs.currentBuilds.append(running)
+        self.assertEqual([ s.getNumber()
+                           for s in self.bs.generateBuildSummaryHistory() ],
+                         [4, 3, 2, 1, 0])
+        self.assertEqual([ s.getNumber() for s in
+                           self.bs.generateBuildSummaryHistory(before=3) ],
+                         [2, 1, 0])
+
+    def test_generateBuildSummaryHistory_horizon(self):
+        for i in range(5):
+            self.finishBuild()
+        self.bs.master.config.buildHorizon = 2
+        self.bs.getBuildByNumber = mock.Mock(side_effect=IndexError)
+        self.assertEqual([ s.getNumber()
+                           for s in self.bs.generateBuildSummaryHistory() ],
+                         [4, 3])
+
+    def test_pickle_excludes_store(self):
+        self.bs.getSummaryStore()
+        self.bs.status = mock.Mock()
+        self.bs.currentBigState = 'idle'
+        self.assertNotIn('_summaries', self.bs.__getstate__())
@@ -0,0 +1,104 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+import zlib
+import cStringIO
+from twisted.trial import unittest
+from buildbot.status import logblocks
+from buildbot.test.util import dirs
+
+class BlockLog(dirs.DirsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('basedir')
+        self.filename = os.path.join(self.basedir, '1-log-stdio')
+        return self.setUpDirs(self.basedir)
+
+    def tearDown(self):
+        return self.tearDownDirs()
+
+    def makeLog(self, chunks, blocksize=logblocks.BLOCKSIZE):
+        raw = "".join([ "%d:%d%s," % (len(t)+1, c, t) for c, t in chunks ])
+        logblocks.writeBlockLog(cStringIO.StringIO(raw),
+                self.filename + ".zblocks", self.filename + ".zblocks.idx",
+                blocksize=blocksize)
+        self.addCleanup(lambda : reader.close())
+        reader = logblocks.openBlockLog(self.filename)
+        return raw, reader
+
+    def chunks(self, n=100):
+        return [ (i % 3, 'line %d\n' % i) for i in range(n) ]
+
+    def test_empty(self):
+        raw, reader = self.makeLog([])
+        self.assertEqual((reader.length, list(reader.iterChunks())), (0, []))
+        self.assertEqual(reader.open().read(), '')
+
+    def test_iterChunks(self):
+        chunks = self.chunks()
+        raw, reader = self.makeLog(chunks, blocksize=100)
+        self.assertEqual(list(reader.iterChunks()), chunks)
+        self.assertEqual(reader.length, sum([ len(t) for c, t in chunks ]))
+
+    def test_iterChunks_channels(self):
+        chunks = self.chunks()
+        raw, reader = self.makeLog(chunks, blocksize=100)
+        self.assertEqual(list(reader.iterChunks([1])),
+                         [ ch for ch in chunks if ch[0] == 1 ])
+
+    def test_iterChunks_offset(self):
+        chunks = self.chunks()
+        raw, reader = self.makeLog(chunks, blocksize=100)
+        offset = sum([ len(t) for c, t in chunks[:57] ]) + 2
+        self.assertEqual(list(reader.iterChunks(offset=offset)), chunks[57:])
+
+    def test_seek_decompresses_one_block(self):
+        chunks = self.chunks(1000)
+        raw, reader = self.makeLog(chunks, blocksize=1000)
+        decompress = []
+        real_decompress = zlib.decompress
+        self.patch(zlib, 'decompress',
+                   lambda data : decompress.append(1) or real_decompress(data))
+        self.assertEqual(reader.getChunk(900), chunks[900])
+        self.assertEqual(len(decompress), 1)
+
+    def test_file_read_seek(self):
+        raw, reader = self.makeLog(self.chunks(), blocksize=100)
+        f = reader.open()
+        self.assertEqual(f.read(), raw)
+        for pos, size in [ (0, 10), (95, 20), (250, 1000), (len(raw)-3, 10) ]:
+            f.seek(pos)
+            self.assertEqual(f.read(size), raw[pos:pos+size])
+            self.assertEqual(f.tell(), min(pos+size, len(raw)))
+        f.seek(-5, 2)
+        self.assertEqual(f.read(), raw[-5:])
+
+    def test_invalid_index(self):
+        with open(self.filename + ".zblocks.idx", "wb") as f:
+            f.write("garbage")
+        with open(self.filename + ".zblocks", "wb") as f:
+            pass
+        self.assertRaises(IOError,
+                lambda : logblocks.openBlockLog(self.filename))
+
+    def test_truncated_index(self):
+        self.makeLog(self.chunks())
+        with open(self.filename + ".zblocks.idx", "r+b") as f:
+            f.truncate(len(logblocks.MAGIC) + logblocks.ENTRY.size)
+        self.assertRaises(IOError,
+                lambda : logblocks.openBlockLog(self.filename))
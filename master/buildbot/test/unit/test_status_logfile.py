@@ -19,7 +19,7 @@ import os
 import cStringIO, cPickle
 import mock
 from twisted.trial import unittest
-from twisted.internet import defer
+from twisted.internet import defer, task, reactor
 from buildbot.status import logfile
 from buildbot.test.util import dirs
 from buildbot import config
@@ -29,24 +29,53 @@ class TestLogFileProducer(unittest.TestCase):
         "make a fake logfile with the given contents"
         lf = mock.Mock()
         lf.getFile = lambda : cStringIO.StringIO(contents)
+        lf.openfile = None
         lf.waitUntilFinished = lambda : defer.succeed(None) # already finished
         lf.runEntries = []
         return lf
 
-    def test_getChunks_static_helloworld(self):
+    def produce(self, lf, pause=False):
+        "produce the chunks of lf, returning a deferred list of chunks"
+        d = defer.Deferred()
+        chunks = []
+        consumer = mock.Mock()
+        def writeChunk(chunk):
+            chunks.append(chunk)
+            if pause:
+                # pause after every chunk, and resume a little later
+                lfp.pauseProducing()
+                lfp.resumeProducing()
+        consumer.writeChunk = writeChunk
+        consumer.finish = lambda : d.callback(chunks)
+        lfp = logfile.LogFileProducer(lf, consumer)
+        lfp.resumeProducing()
+        return d
+
+    def test_produce_static_helloworld(self):
         lf = self.make_static_logfile("13:0hello world!,")
-        lfp = logfile.LogFileProducer(lf, mock.Mock())
-        chunks = list(lfp.getChunks())
-        self.assertEqual(chunks, [ (0, 'hello world!') ])
+        d = self.produce(lf)
+        d.addCallback(self.assertEqual, [ (0, 'hello world!') ])
+        return d
 
-    def test_getChunks_static_multichannel(self):
+    def test_produce_static_multichannel(self):
         lf = self.make_static_logfile("2:0a,3:1xx,2:0c,")
-        lfp = logfile.LogFileProducer(lf, mock.Mock())
-        chunks = list(lfp.getChunks())
-        self.assertEqual(chunks, [ (0, 'a'), (1, 'xx'), (0, 'c') ])
+        d = self.produce(lf)
+        d.addCallback(self.assertEqual, [ (0, 'a'), (1, 'xx'), (0, 'c') ])
+        return d
 
-    # Remainder of LogFileProduer has a wacky interface that's not
-    # well-defined, so it's not tested yet
+    def test_produce_small_reads_paused(self):
+        self.patch(logfile.LogFileProducer, 'BUFFERSIZE', 3)
+        lf = self.make_static_logfile("2:0a,3:1xx,2:0c," * 10)
+        d = self.produce(lf, pause=True)
+        d.addCallback(self.assertEqual, [ (0, 'a'), (1, 'xx'), (0, 'c') ] * 10)
+        return d
+
+    def test_produce_runEntries(self):
+        lf = self.make_static_logfile("2:0a,")
+        lf.runEntries = [ (1, 'b'), (1, 'c') ]
+        d = self.produce(lf)
+        d.addCallback(self.assertEqual, [ (0, 'a'), (1, 'bc') ])
+        return d
 
 class TestLogFile(unittest.TestCase, dirs.DirsMixin):
 
@@ -330,6 +359,129 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.config.logCompressionMethod = 'bz2'
         return self.do_test_compressLog('.bz2')
 
+    def test_compressLog_zblocks_read(self):
+        self.config.logCompressionMethod = 'zblocks'
+        self.logfile.addStdout('hello\n')
+        self.logfile.addStderr('oops\n')
+        self.logfile.addHeader('hdr\n')
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        def check(_):
+            self.assertFalse(os.path.exists(self.logfile.getFilename()))
+            self.assertTrue(self.logfile.hasContents())
+            self.assertEqual(self.logfile.getText(), 'hello\noops\n')
+            self.assertEqual(list(self.logfile.getChunks()),
+                    [(0, 'hello\n'), (1, 'oops\n'), (2, 'hdr\n')])
+            self.assertEqual(self.logfile.getFile().read(),
+                    '7:0hello\n,6:1oops\n,5:2hdr\n,')
+        d.addCallback(check)
+        return d
+
+    def test_readlines(self):
+        self.logfile.addStdout('hello\nwor')
+        self.logfile.addStderr('err')
+        self.logfile.addStdout('ld\n')
+        self.logfile.addHeader('header\n')
+        self.logfile.addStderr('or\npartial')
+        self.logfile.finish()
+        self.assertEqual(list(self.logfile.readlines()),
+                ['hello\n', 'world\n'])
+        self.assertEqual(
+                list(self.logfile.readlines([logfile.STDOUT, logfile.STDERR])),
+                ['hello\n', 'world\n', 'error\n', 'partial'])
+
+    def test_readlines_lazy(self):
+        self.logfile.addStdout('first\n')
+        self.logfile.addStdout('second\n' * 100000)
+        self.logfile.finish()
+        lines = self.logfile.readlines()
+        self.assertEqual(lines.next(), 'first\n')
+        self.assertEqual(lines.next(), 'second\n')
+
+    def test_subscribeConsumer_unfinished(self):
+        self.logfile.addStdout('hello\n')
+        self.logfile.addStderr('oops\n')
+        d = defer.Deferred()
+        chunks = []
+        consumer = mock.Mock()
+        consumer.writeChunk = chunks.append
+        consumer.finish = lambda : d.callback(None)
+        self.logfile.subscribeConsumer(consumer)
+        def more(_):
+            self.logfile.addStdout('more\n')
+            self.logfile.finish()
+            return d
+        d2 = task.deferLater(reactor, 0.1, lambda : None)
+        d2.addCallback(more)
+        d2.addCallback(lambda _ : self.assertEqual(chunks,
+                [(0, 'hello\n'), (1, 'oops\n'), (0, 'more\n')]))
+        return d2
+
+    def test_subscribeConsumer_zblocks(self):
+        self.config.logCompressionMethod = 'zblocks'
+        self.logfile.addStdout('hello\n')
+        self.logfile.addStderr('oops\n')
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        chunks = []
+        def subscribe(_):
+            d = defer.Deferred()
+            consumer = mock.Mock()
+            consumer.writeChunk = chunks.append
+            consumer.finish = lambda : d.callback(None)
+            self.logfile.subscribeConsumer(consumer)
+            return d
+        d.addCallback(subscribe)
+        d.addCallback(lambda _ : self.assertEqual(chunks,
+                [(0, 'hello\n'), (1, 'oops\n')]))
+        return d
+
+    def add_range_entries(self):
+        self.logfile.addHeader('hdr\n')
+        self.logfile.addStdout('one\ntwo\n')
+        self.logfile.addStderr('err\n')
+        self.logfile.addStdout('three\nfour\n')
+
+    def do_test_ranges(self):
+        lf = self.logfile
+        text = [logfile.STDOUT, logfile.STDERR]
+        self.assertEqual(lf.getTextLength(), 27)
+        self.assertEqual(lf.getTextLength(text), 23)
+        self.assertEqual(lf.getRange(2, 8, text),
+                [(0, 'e\ntwo\n'), (1, 'er')])
+        self.assertEqual(lf.getRange(21, 100, text), [(0, 'r\n')])
+        self.assertEqual(lf.getRange(0, 4), [(2, 'hdr\n')])
+        self.assertEqual(lf.getTail(7, text), [(0, 'e\nfour\n')])
+        self.assertEqual(lf.getTail(3, text, lines=True),
+                [(1, 'err\n'), (0, 'three\nfour\n')])
+        self.assertEqual(lf.getTail(100, [logfile.STDERR]), [(1, 'err\n')])
+
+    def test_ranges_unfinished(self):
+        self.add_range_entries()
+        self.do_test_ranges()
+
+    def test_ranges_finished(self):
+        self.add_range_entries()
+        self.logfile.finish()
+        self.pickle_and_restore()
+        self.do_test_ranges()
+
+    def test_ranges_gz(self):
+        self.config.logCompressionMethod = 'gz'
+        self.add_range_entries()
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        d.addCallback(lambda _ : self.do_test_ranges())
+        return d
+
+    def test_ranges_zblocks(self):
+        self.config.logCompressionMethod = 'zblocks'
+        self.add_range_entries()
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        d.addCallback(lambda _ : self.do_test_ranges())
+        return d
+
     def test_compressLog_none(self):
         self.config.logCompressionMethod = None
         return self.do_test_compressLog('', expect_comp=False)
@@ -48,6 +48,37 @@ class TestStatus(unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_getPendingBuildRequestCounts(self):
+        s = self.makeStatus()
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=1, buildsetid=91, buildername='a'),
+            fakedb.BuildRequest(id=2, buildsetid=91, buildername='a'),
+            fakedb.BuildRequest(id=3, buildsetid=91, buildername='b',
+                                complete=1),
+        ])
+        d = s.getPendingBuildRequestCounts(['a', 'b'])
+        d.addCallback(self.assertEqual, dict(a=2, b=0))
+        return d
+
+    def test_getPendingBuildRequestCounts_shared(self):
+        s = self.makeStatus()
+        query = defer.Deferred()
+        self.db.buildrequests.getUnclaimedBuildRequestCounts = \
+                mock.Mock(return_value=query)
+        results = []
+        s.getPendingBuildRequestCounts(['a']).addCallback(results.append)
+        s.getPendingBuildRequestCounts(['b']).addCallback(results.append)
+        query.callback(dict(a=3))
+        self.assertEqual(results, [ dict(a=3), dict(b=0) ])
+        self.assertEqual(
+            self.db.buildrequests.getUnclaimedBuildRequestCounts.call_count, 1)
+        # a later call makes a new query
+        self.db.buildrequests.getUnclaimedBuildRequestCounts.return_value = \
+                defer.Deferred()
+        s.getPendingBuildRequestCounts(['a'])
+        self.assertEqual(
+            self.db.buildrequests.getUnclaimedBuildRequestCounts.call_count, 2)
+
     @defer.inlineCallbacks
     def test_reconfigService(self):
         m = mock.Mock(name='master')
@@ -140,6 +140,61 @@ class test_Queues(dirs.DirsMixin, unittest.TestCase):
     def testDiskQueue(self):
         self._test_helper(DiskQueue('fake_dir', maxItems=8))
 
+    def testDiskQueueSegments(self):
+        self._test_helper(DiskQueue('fake_dir', maxItems=8, segmentSize=20))
+
+    def testDiskQueueRestart(self):
+        q = DiskQueue('fake_dir', 10, pickleFn=str, unpickleFn=str,
+                      segmentSize=10)
+        for i in range(6):
+            q.pushItem('item%d' % i)
+        self.assertEqual(['item0', 'item1'], q.popChunk(2))
+        self.assertEqual(None, q.insertBackChunk(['item1']))
+        # pushed after the index was last written
+        q.pushItem('item6')
+        q._closeWriter()
+        q = DiskQueue('fake_dir', 10, pickleFn=str, unpickleFn=str,
+                      segmentSize=10)
+        self.assertEqual(6, q.nbItems())
+        self.assertEqual(['item%d' % i for i in range(1, 7)], q.items())
+        q.pushItem('item7')
+        self.assertEqual(['item%d' % i for i in range(1, 8)], q.popChunk())
+
+    def testDiskQueueRestartOverflow(self):
+        q = DiskQueue('fake_dir', 5, pickleFn=str, unpickleFn=str)
+        for i in range(5):
+            q.pushItem('item%d' % i)
+        q.save()
+        for i in range(5, 8):
+            self.assertEqual('item%d' % (i - 5), q.pushItem('item%d' % i))
+        q._closeWriter()
+        q = DiskQueue('fake_dir', 5, pickleFn=str, unpickleFn=str)
+        self.assertEqual(['item%d' % i for i in range(3, 8)], q.items())
+        q._closeWriter()
+        # a smaller maxItems drops the oldest items
+        q = DiskQueue('fake_dir', 3, pickleFn=str, unpickleFn=str)
+        self.assertEqual(['item%d' % i for i in range(5, 8)], q.items())
+        q.pushItem('item8')
+        self.assertEqual(['item6', 'item7', 'item8'], q.popChunk())
+
+    def testDiskQueuePartialItem(self):
+        q = DiskQueue('fake_dir', 10, pickleFn=str, unpickleFn=str)
+        q.pushItem('foo')
+        q.save()
+        q.pushItem('bar')
+        q._writer.write('\0\0\0\x10ba')
+        q._closeWriter()
+        q = DiskQueue('fake_dir', 10, pickleFn=str, unpickleFn=str)
+        self.assertEqual(['foo', 'bar'], q.items())
+        q.pushItem('baz')
+        self.assertEqual(['foo', 'bar', 'baz'], q.popChunk())
+
+    def testDiskQueueFsync(self):
+        q = DiskQueue('fake_dir', 8, fsync='always', segmentSize=20)
+        self.assertRaises(ValueError,
+                          lambda : DiskQueue('fake_dir', fsync='sometimes'))
+        self._test_helper(q)
+
     def testPersistentQueue(self):
         self._test_helper(PersistentQueue(MemoryQueue(3),
                                           DiskQueue('fake_dir', 5)))
@@ -0,0 +1,161 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import gzip
+import urllib
+from cStringIO import StringIO
+
+try:
+    import simplejson as json
+    assert json
+except ImportError:
+    import json
+
+from twisted.trial import unittest
+from twisted.internet import defer, reactor
+from twisted.web import resource, server
+
+from buildbot.status import status_push
+
+class StandInServer(resource.Resource):
+    """Records the events POSTed to it, and answers each request once the
+    test tells it to."""
+    isLeaf = True
+
+    def __init__(self):
+        resource.Resource.__init__(self)
+        self.requests = []
+        self.waiting = None
+
+    def render_POST(self, request):
+        body = request.content.read()
+        if request.getHeader('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        packets = json.loads(urllib.unquote_plus(body[len('packets='):]))
+        self.requests.append((request, [ p['id'] for p in packets ]))
+        if self.waiting and len(self.requests) >= self.waiting[0]:
+            d, self.waiting = self.waiting[1], None
+            d.callback(None)
+        return server.NOT_DONE_YET
+
+    def waitForRequests(self, count):
+        if len(self.requests) >= count:
+            return defer.succeed(None)
+        self.waiting = (count, defer.Deferred())
+        return self.waiting[1]
+
+    def answer(self, index, code=200):
+        request = self.requests[index][0]
+        request.setResponseCode(code)
+        request.write('ok')
+        request.finish()
+
+class StandInSite(server.Site):
+    """Keeps track of its connections, so that tests can wait for them to
+    close."""
+
+    def __init__(self, *args, **kwargs):
+        server.Site.__init__(self, *args, **kwargs)
+        self.lost = []
+
+    def buildProtocol(self, addr):
+        p = server.Site.buildProtocol(self, addr)
+        lost = defer.Deferred()
+        self.lost.append(lost)
+        connectionLost = p.connectionLost
+        def wrapped(reason):
+            connectionLost(reason)
+            lost.callback(None)
+        p.connectionLost = wrapped
+        return p
+
+class HttpStatusPush(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.site = StandInSite(self.server)
+        self.port = reactor.listenTCP(0, self.site, interface='127.0.0.1')
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        if self.sp.task and self.sp.task.active():
+            self.sp.task.cancel()
+        if self.sp.pool is not None:
+            yield self.sp.pool.closeCachedConnections()
+        yield defer.DeferredList(self.site.lost)
+        yield self.port.stopListening()
+
+    def makePush(self, **kwargs):
+        url = 'http://127.0.0.1:%d/' % self.port.getHost().port
+        self.sp = status_push.HttpStatusPush(url, maxDiskItems=0, **kwargs)
+        return self.sp
+
+    def queueEvents(self, sp, count):
+        for i in range(count):
+            sp.queue.pushItem({'id' : i, 'timestamp' : '2012-01-01 00:00:00',
+                               'event' : 'ev'})
+
+    @defer.inlineCallbacks
+    def test_compressed_batches(self):
+        sp = self.makePush(chunkSize=3, compress=True)
+        self.queueEvents(sp, 5)
+        d = sp.pushHttp()
+        yield self.server.waitForRequests(1)
+        self.assertEqual(self.server.requests[0][1], [0, 1, 2])
+        self.server.answer(0)
+        yield d
+        self.assertEqual(sp.queue.nbItems(), 2)
+        self.assertTrue(sp.wasLastPushSuccessful())
+
+    @defer.inlineCallbacks
+    def test_in_flight(self):
+        sp = self.makePush(chunkSize=2, maxInFlight=2)
+        self.queueEvents(sp, 5)
+        d = sp.pushHttp()
+        yield self.server.waitForRequests(2)
+        self.assertEqual([ ids for r, ids in self.server.requests ],
+                         [ [0, 1], [2, 3] ])
+        # acknowledged in order
+        self.server.answer(1)
+        self.assertEqual(len(sp.inFlight), 2)
+        self.server.answer(0)
+        yield d
+        self.assertEqual(len(sp.inFlight), 0)
+        self.assertEqual(sp.queue.items()[0]['id'], 4)
+
+    @defer.inlineCallbacks
+    def test_failure_requeues_later_batches(self):
+        sp = self.makePush(chunkSize=2, maxInFlight=2)
+        self.queueEvents(sp, 5)
+        d = sp.pushHttp()
+        yield self.server.waitForRequests(2)
+        self.server.answer(0, code=500)
+        self.server.answer(1)
+        yield d
+        self.assertFalse(sp.wasLastPushSuccessful())
+        self.assertEqual(len(sp.inFlight), 0)
+        self.assertEqual([ i['id'] for i in sp.queue.items() ],
+                         [0, 1, 2, 3, 4])
+
+    def test_popChunk_size_bounded(self):
+        sp = self.makePush(chunkSize=10)
+        self.queueEvents(sp, 5)
+        size = len(sp.popChunk()[0])
+        self.queueEvents(sp, 5)
+        sp.maxHttpRequestSize = size * 3 / 5
+        data, items = sp.popChunk()
+        self.assertTrue(len(data) < sp.maxHttpRequestSize)
+        self.assertEqual([ i['id'] for i in items ], [0, 1])
+        self.assertEqual(sp.queue.nbItems(), 3)
@@ -0,0 +1,149 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+
+from buildbot.status.web import console
+
+def makeBuild(number, revision, finished=True):
+    build = mock.Mock(name='build%d' % number)
+    build.getNumber.return_value = number
+    build.isFinished.return_value = finished
+    props = { 'got_revision' : revision }
+    build.getProperty = lambda name, default=None : props.get(name, default)
+    build.getLogs.return_value = []
+    build.getChanges.return_value = []
+    build.getTimes.return_value = (number, None)
+    build.getText.return_value = []
+    build.getETA.return_value = None
+    build.getResults.return_value = 0
+    return build
+
+class FakeBuilderStatus(object):
+
+    def __init__(self, name='bldr'):
+        self.name = name
+        self.builds = []
+        self.loaded = 0
+
+    def getName(self):
+        return self.name
+
+    def addBuild(self, revision, finished=True):
+        build = makeBuild(len(self.builds), revision, finished)
+        self.builds.append(build)
+        return build
+
+    def getBuild(self, number):
+        if number < 0:
+            number += len(self.builds)
+        if not 0 <= number < len(self.builds):
+            return None
+        self.loaded += 1
+        return self.builds[number]
+
+    def getCurrentBuilds(self):
+        return [ b for b in self.builds if not b.isFinished() ]
+
+class ConsoleBuildCache(unittest.TestCase):
+
+    def setUp(self):
+        self.bs = FakeBuilderStatus()
+        self.rsrc = console.ConsoleStatusResource()
+        self.cache = console.ConsoleBuildCache(mock.Mock(),
+                                               self.rsrc.makeDevBuild)
+
+    def numbers(self):
+        return [ n for n, devBuild in self.cache.iterFinishedBuilds(self.bs) ]
+
+    def test_loaded_once(self):
+        for rev in range(5):
+            self.bs.addBuild(str(rev))
+        self.assertEqual(self.numbers(), [4, 3, 2, 1, 0])
+        loaded = self.bs.loaded
+        self.assertEqual(self.numbers(), [4, 3, 2, 1, 0])
+        self.assertEqual(self.bs.loaded, loaded)
+
+    def test_no_revision(self):
+        self.bs.addBuild('1')
+        self.bs.addBuild(None)
+        entries = list(self.cache.iterFinishedBuilds(self.bs))
+        self.assertEqual(entries[0], (1, None))
+        self.assertEqual(entries[1][1].revision, '1')
+
+    def test_buildFinished(self):
+        self.bs.addBuild('1')
+        running = self.bs.addBuild('2', finished=False)
+        self.assertEqual(self.numbers(), [0])
+        running.isFinished.return_value = True
+        self.cache.buildFinished('bldr', running, 0)
+        loaded = self.bs.loaded
+        self.assertEqual(self.numbers(), [1, 0])
+        self.assertEqual(self.bs.loaded, loaded)
+
+    def test_bounded(self):
+        self.cache.maxBuilds = 3
+        for rev in range(5):
+            self.bs.addBuild(str(rev))
+        self.assertEqual(self.numbers(), [4, 3, 2, 1, 0])
+        self.assertEqual(len(self.cache.history['bldr']), 3)
+        new = self.bs.addBuild('5')
+        self.cache.buildFinished('bldr', new, 0)
+        self.assertEqual(len(self.cache.history['bldr']), 3)
+        self.assertEqual(self.numbers(), [5, 4, 3, 2, 1, 0])
+
+    def test_rows(self):
+        self.cache.setRow('bldr', ('10', 40), [])
+        self.assertEqual(self.cache.getRow('bldr', ('10', 40)), [])
+        self.cache.buildStarted('bldr', mock.Mock())
+        self.assertEqual(self.cache.getRow('bldr', ('10', 40)), None)
+        self.cache.setRow('bldr', ('10', 40), [])
+        self.cache.changeAdded(mock.Mock())
+        self.assertEqual(self.cache.getRow('bldr', ('10', 40)), None)
+
+class ConsoleStatusResource(unittest.TestCase):
+
+    def setUp(self):
+        self.bs = FakeBuilderStatus()
+        self.rsrc = console.ConsoleStatusResource()
+        self.rsrc.buildCache = console.ConsoleBuildCache(mock.Mock(),
+                                                    self.rsrc.makeDevBuild)
+
+    def getBuilds(self, lastRevision, numBuilds=40):
+        debugInfo = { 'builds_scanned' : 0 }
+        return self.rsrc.getBuildsForRevision(None, self.bs, 'bldr',
+                lastRevision, numBuilds, debugInfo)
+
+    def test_getBuildsForRevision(self):
+        for rev in range(10):
+            self.bs.addBuild(str(rev * 10))
+        builds = self.getBuilds('75')
+        # down to the first build earlier than revision 75
+        self.assertEqual([ b.number for b in builds ], [9, 8, 7])
+
+    def test_getBuildsForRevision_running(self):
+        self.bs.addBuild('10')
+        self.bs.addBuild('20', finished=False)
+        self.bs.addBuild('30')
+        builds = self.getBuilds('15')
+        self.assertEqual([ (b.number, b.isFinished) for b in builds ],
+                         [ (2, True), (1, False), (0, True) ])
+
+    def test_getBuildsForRevision_numBuilds(self):
+        for rev in range(10):
+            self.bs.addBuild(str(rev * 10))
+        builds = self.getBuilds('5', numBuilds=4)
+        self.assertEqual([ b.number for b in builds ], [9, 8, 7, 6])
@@ -0,0 +1,204 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer, task
+
+from buildbot.status.web import events
+from buildbot.test.fake.web import FakeRequest
+
+class EventsMixin(object):
+
+    def setUpEvents(self):
+        self.clock = task.Clock()
+        self.status = mock.Mock()
+        self.rsrc = events.EventsResource()
+        self.rsrc.stream = events.EventStream(self.status)
+        self.stream = self.rsrc.stream
+        self.stream._reactor = self.clock
+        self.stream.keepAlive.clock = self.clock
+
+    def makeRequest(self, lastEventId=None, **args):
+        req = FakeRequest(dict((k, [v]) for k, v in args.items()))
+        req.method = 'GET'
+        req.getHeader = lambda name : (name == 'last-event-id'
+                                       and lastEventId or None)
+        req.finishedDeferred = defer.Deferred()
+        req.notifyFinish.return_value = req.finishedDeferred
+        return req
+
+    def buildFinished(self, builderName='bldr', number=1):
+        build = mock.Mock()
+        build.getNumber.return_value = number
+        build.getText.return_value = [ 'build', 'successful' ]
+        self.stream.buildFinished(builderName, build, 0)
+
+class EventStream(EventsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpEvents()
+
+    def test_subscribes(self):
+        self.status.subscribe.assert_called_with(self.stream)
+        self.assertIdentical(self.stream.builderAdded('bldr', mock.Mock()),
+                             self.stream)
+
+    def test_stop(self):
+        bs = mock.Mock()
+        self.stream.builderAdded('bldr', bs)
+        req = self.makeRequest()
+        self.rsrc.render_GET(req)
+        self.stream.stop()
+        self.status.unsubscribe.assert_called_with(self.stream)
+        bs.unsubscribe.assert_called_with(self.stream)
+        self.assertTrue(req.finished)
+
+    def test_recent_bounded(self):
+        self.stream.maxEvents = 3
+        for i in range(5):
+            self.buildFinished(number=i)
+        self.assertEqual([ e.id for e in self.stream.recent ], [3, 4, 5])
+        client = events.EventClient(self.stream, None)
+        evs, missed = self.stream.getEventsSince(1, client)
+        self.assertEqual(([ e.id for e in evs ], missed), ([3, 4, 5], True))
+        evs, missed = self.stream.getEventsSince(3, client)
+        self.assertEqual(([ e.id for e in evs ], missed), ([4, 5], False))
+
+    def test_restarted(self):
+        self.buildFinished()
+        client = events.EventClient(self.stream, None)
+        evs, missed = self.stream.getEventsSince(20, client)
+        self.assertEqual(([ e.id for e in evs ], missed), ([1], True))
+
+    def makeStep(self):
+        build = mock.Mock()
+        build.getBuilder.return_value.getName.return_value = 'bldr'
+        build.getNumber.return_value = 1
+        step = mock.Mock()
+        step.getName.return_value = 'compile'
+        return build, step
+
+    def test_logs_only_when_wanted(self):
+        self.assertEqual(self.stream.stepStarted(*self.makeStep()), None)
+        self.rsrc.render_GET(self.makeRequest(logs='1'))
+        self.assertIdentical(self.stream.stepStarted(*self.makeStep()),
+                             self.stream)
+
+class EventClient(unittest.TestCase):
+
+    def event(self, name, builderName=None):
+        return events.Event(1, name, builderName, {})
+
+    def test_wants(self):
+        client = events.EventClient(None, None, events=['buildFinished'],
+                                    builders=['a'])
+        self.assertTrue(client.wants(self.event('buildFinished', 'a')))
+        self.assertFalse(client.wants(self.event('buildFinished', 'b')))
+        self.assertFalse(client.wants(self.event('buildStarted', 'a')))
+
+    def test_wants_events_without_builder(self):
+        client = events.EventClient(None, None, builders=['a'])
+        self.assertTrue(client.wants(self.event('changeAdded')))
+
+    def test_wants_logs(self):
+        self.assertFalse(events.EventClient(None, None).wants(
+                            self.event('logChunk', 'a')))
+        self.assertTrue(events.EventClient(None, None, logs=True).wants(
+                            self.event('logChunk', 'a')))
+
+class EventsResource(EventsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpEvents()
+
+    def test_stream(self):
+        req = self.makeRequest(builder='bldr')
+        self.rsrc.render_GET(req)
+        self.buildFinished()
+        self.buildFinished(builderName='other')
+        self.assertEqual(req.written, ':\n\n'
+            'id: 1\nevent: buildFinished\ndata: {"builderName":"bldr",'
+            '"number":1,"results":0,"text":["build","successful"]}\n\n')
+
+    def test_stream_buffer_bounded(self):
+        req = self.makeRequest(event='buildFinished')
+        self.rsrc.render_GET(req)
+        client = self.stream.clients[0]
+        client.maxBuffer = 2
+        client.pauseProducing()
+        for i in range(4):
+            self.buildFinished(number=i)
+        self.assertEqual(req.written, ':\n\n')
+        client.resumeProducing()
+        written = req.written.split('\n\n')
+        self.assertEqual(written[1], 'event: dropped\ndata: {"count":2}')
+        self.assertEqual([ w.split('\n')[0] for w in written[2:-1] ],
+                         [ 'id: 3', 'id: 4' ])
+
+    def test_stream_reconnect(self):
+        for i in range(3):
+            self.buildFinished(number=i)
+        req = self.makeRequest(lastEventId='2', event='buildFinished')
+        self.rsrc.render_GET(req)
+        self.assertEqual(req.written.count('event: buildFinished'), 1)
+        self.assertIn('id: 3\n', req.written)
+
+    def test_stream_disconnect(self):
+        req = self.makeRequest()
+        self.rsrc.render_GET(req)
+        req.finishedDeferred.errback(Exception('connection lost'))
+        self.assertEqual(self.stream.clients, [])
+
+    def test_keepalive(self):
+        req = self.makeRequest()
+        self.rsrc.render_GET(req)
+        self.clock.advance(self.stream.keepAliveInterval)
+        self.assertEqual(req.written, ':\n\n:\n\n')
+
+    def test_poll_waits(self):
+        req = self.makeRequest()
+        self.rsrc.children['poll'].render_GET(req)
+        self.assertFalse(req.finished)
+        self.buildFinished()
+        self.assertTrue(req.finished)
+        self.assertEqual(req.written, '{"events":[{"id":1,'
+            '"event":"buildFinished","payload":{"builderName":"bldr",'
+            '"number":1,"results":0,"text":["build","successful"]}}],'
+            '"last":1,"missed":false}')
+        self.assertEqual(self.stream.clients, [])
+
+    def test_poll_since(self):
+        for i in range(3):
+            self.buildFinished(number=i)
+        req = self.makeRequest(since='1')
+        self.rsrc.children['poll'].render_GET(req)
+        self.assertTrue(req.finished)
+        self.assertIn('"last":3,"missed":false', req.written)
+        self.assertEqual(req.written.count('"event":"buildFinished"'), 2)
+
+    def test_poll_timeout(self):
+        req = self.makeRequest(timeout='10')
+        self.rsrc.children['poll'].render_GET(req)
+        self.clock.advance(10)
+        self.assertEqual(req.written, '{"events":[],"last":0,"missed":false}')
+        self.assertEqual(self.stream.clients, [])
+
+    def test_poll_disconnect(self):
+        req = self.makeRequest(timeout='10')
+        self.rsrc.children['poll'].render_GET(req)
+        req.finishedDeferred.errback(Exception('connection lost'))
+        self.assertEqual(self.stream.clients, [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
@@ -0,0 +1,126 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+from twisted.web import http
+
+from buildbot.status import logfile
+from buildbot.status.web import logs
+from buildbot.test.fake.web import FakeRequest
+
+class ParseRange(unittest.TestCase):
+
+    def test_simple(self):
+        self.assertEqual(logs.parseRange('bytes=10-19', 100), (10, 19))
+
+    def test_open_ended(self):
+        self.assertEqual(logs.parseRange('bytes=10-', 100), (10, 99))
+
+    def test_past_end(self):
+        self.assertEqual(logs.parseRange('bytes=10-1000', 100), (10, 99))
+
+    def test_suffix(self):
+        self.assertEqual(logs.parseRange('bytes=-10', 100), (90, 99))
+
+    def test_suffix_too_long(self):
+        self.assertEqual(logs.parseRange('bytes=-1000', 100), (0, 99))
+
+    def test_unsatisfiable(self):
+        first, last = logs.parseRange('bytes=100-', 100)
+        self.assertTrue(first >= 100)
+
+    def test_ignored(self):
+        for header in [ 'lines=1-2', 'bytes=1-2,5-6', 'bytes=5-2',
+                        'bytes=x-' ]:
+            self.assertEqual(logs.parseRange(header, 100), None)
+
+class TextLog(unittest.TestCase):
+
+    def makeRequest(self, args={}, range=None):
+        req = FakeRequest(args)
+        req.getHeader = lambda name : name == 'range' and range or None
+        req.setHeader = mock.Mock()
+        req.setResponseCode = mock.Mock()
+        return req
+
+    def makeTextLog(self):
+        original = mock.Mock()
+        original.getTextLength.return_value = 100
+        original.getRange.return_value = [ (0, 'abc'), (1, 'de') ]
+        original.getTail.return_value = [ (0, 'tail') ]
+        rsrc = logs.TextLog(original)
+        rsrc.asText = True
+        return rsrc
+
+    def test_tail_bytes(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(args={'tail' : ['4']})
+        self.assertEqual(rsrc.render_GET(req), 'tail')
+        rsrc.original.getTail.assert_called_with(4,
+                [logfile.STDOUT, logfile.STDERR], False)
+        req.setHeader.assert_called_with('content-length', 4)
+
+    def test_tail_lines(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(args={'tail' : ['10'], 'unit' : ['lines']})
+        self.assertEqual(rsrc.render_GET(req), 'tail')
+        rsrc.original.getTail.assert_called_with(10,
+                [logfile.STDOUT, logfile.STDERR], True)
+
+    def test_offset_length(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(args={'offset' : ['10'], 'length' : ['5']})
+        self.assertEqual(rsrc.render_GET(req), 'abcde')
+        rsrc.original.getRange.assert_called_with(10, 5,
+                [logfile.STDOUT, logfile.STDERR])
+
+    def test_offset_to_end(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(args={'offset' : ['10']})
+        rsrc.render_GET(req)
+        rsrc.original.getRange.assert_called_with(10, 90,
+                [logfile.STDOUT, logfile.STDERR])
+
+    def test_bad_args(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(args={'tail' : ['-3']})
+        rsrc.render_GET(req)
+        req.setResponseCode.assert_called_with(http.BAD_REQUEST)
+
+    def test_range(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(range='bytes=95-')
+        self.assertEqual(rsrc.render_GET(req), 'abcde')
+        req.setResponseCode.assert_called_with(http.PARTIAL_CONTENT)
+        req.setHeader.assert_any_call('content-range', 'bytes 95-99/100')
+        req.setHeader.assert_any_call('content-length', 5)
+        rsrc.original.getRange.assert_called_with(95, 5,
+                [logfile.STDOUT, logfile.STDERR])
+
+    def test_range_unsatisfiable(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest(range='bytes=200-')
+        self.assertEqual(rsrc.render_GET(req), '')
+        req.setResponseCode.assert_called_with(
+                http.REQUESTED_RANGE_NOT_SATISFIABLE)
+        req.setHeader.assert_any_call('content-range', 'bytes */100')
+
+    def test_HEAD_text(self):
+        rsrc = self.makeTextLog()
+        req = self.makeRequest()
+        self.assertEqual(rsrc.render_HEAD(req), '')
+        req.setHeader.assert_any_call('accept-ranges', 'bytes')
+        req.setHeader.assert_any_call('content-length', 100)
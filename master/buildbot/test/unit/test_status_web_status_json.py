@@ -0,0 +1,259 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer
+from twisted.web import http
+
+from buildbot.status import buildsummary
+from buildbot.util import json
+from buildbot.status.web import status_json
+from buildbot.test.fake.web import FakeRequest
+
+def makeStatus(running=False):
+    status = mock.Mock()
+    status.getBuilderNames.return_value = [ 'bldr' ]
+    status.getBuilder.return_value.getCurrentBuilds.return_value = \
+            running and [ mock.Mock() ] or []
+    return status
+
+class ETagMatches(unittest.TestCase):
+
+    def check(self, header, expected):
+        req = mock.Mock()
+        req.getHeader.return_value = header
+        self.assertEqual(status_json.ETagMatches(req, '"3"'), expected)
+
+    def test_none(self):
+        self.check(None, False)
+
+    def test_match(self):
+        self.check('"3"', True)
+
+    def test_list(self):
+        self.check('"1", "3"', True)
+
+    def test_weak(self):
+        self.check('W/"3"', True)
+
+    def test_star(self):
+        self.check('*', True)
+
+    def test_mismatch(self):
+        self.check('"2"', False)
+
+class JsonCache(unittest.TestCase):
+
+    def test_tag_changes(self):
+        cache = status_json.JsonCache(makeStatus())
+        tag = cache.getTag()
+        self.assertEqual(cache.getTag(), tag)
+        cache.stepFinished(mock.Mock(), mock.Mock(), 0)
+        self.assertNotEqual(cache.getTag(), tag)
+
+    def test_tag_per_builder(self):
+        cache = status_json.JsonCache(makeStatus())
+        tags = [ cache.getTag(), cache.getTag('bldr'), cache.getTag('other') ]
+        build = mock.Mock()
+        build.getBuilder.return_value.getName.return_value = 'bldr'
+        cache.stepFinished(build, mock.Mock(), 0)
+        self.assertNotEqual(cache.getTag(), tags[0])
+        self.assertNotEqual(cache.getTag('bldr'), tags[1])
+        self.assertEqual(cache.getTag('other'), tags[2])
+        # changes are not part of the builder pages
+        tags = [ cache.getTag(), cache.getTag('bldr') ]
+        cache.changeAdded(mock.Mock())
+        self.assertNotEqual(cache.getTag(), tags[0])
+        self.assertEqual(cache.getTag('bldr'), tags[1])
+
+    def test_tag_running(self):
+        cache = status_json.JsonCache(makeStatus(running=True))
+        with mock.patch('buildbot.util.now', lambda : 100):
+            tag = cache.getTag()
+        with mock.patch('buildbot.util.now', lambda : 100 + cache.etaInterval):
+            self.assertNotEqual(cache.getTag(), tag)
+
+    def test_subscribes(self):
+        status = makeStatus()
+        cache = status_json.JsonCache(status)
+        cache.getTag()
+        status.subscribe.assert_called_with(cache)
+        self.assertIdentical(cache.builderAdded('bldr', mock.Mock()), cache)
+        self.assertIdentical(cache.buildStarted('bldr', mock.Mock()), cache)
+
+    @defer.inlineCallbacks
+    def test_getBody_cached(self):
+        cache = status_json.JsonCache(makeStatus())
+        render = mock.Mock(return_value='body')
+        tag = cache.getTag()
+        body = yield cache.getBody(tag, '/json', render)
+        self.assertEqual(body, 'body')
+        body = yield cache.getBody(tag, '/json', render)
+        self.assertEqual(body, 'body')
+        self.assertEqual(render.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_getBody_changed(self):
+        cache = status_json.JsonCache(makeStatus())
+        render = mock.Mock(return_value='body')
+        yield cache.getBody(cache.getTag(), '/json', render)
+        cache.changeAdded(mock.Mock())
+        yield cache.getBody(cache.getTag(), '/json', render)
+        self.assertEqual(render.call_count, 2)
+
+    @defer.inlineCallbacks
+    def test_getBody_other_builder(self):
+        cache = status_json.JsonCache(makeStatus())
+        render = mock.Mock(return_value='body')
+        yield cache.getBody(cache.getTag('other'), '/json/builders/other',
+                            render, 'other')
+        cache.buildFinished('bldr', mock.Mock(), 0)
+        yield cache.getBody(cache.getTag('other'), '/json/builders/other',
+                            render, 'other')
+        self.assertEqual(render.call_count, 1)
+        cache.buildFinished('other', mock.Mock(), 0)
+        yield cache.getBody(cache.getTag('other'), '/json/builders/other',
+                            render, 'other')
+        self.assertEqual(render.call_count, 2)
+
+    def test_getBody_shared(self):
+        cache = status_json.JsonCache(makeStatus())
+        rendering = defer.Deferred()
+        render = mock.Mock(return_value=rendering)
+        tag = cache.getTag()
+        results = []
+        cache.getBody(tag, '/json', render).addCallback(results.append)
+        cache.getBody(tag, '/json', render).addCallback(results.append)
+        self.assertEqual(results, [])
+        rendering.callback('body')
+        self.assertEqual(results, [ 'body', 'body' ])
+        self.assertEqual(render.call_count, 1)
+
+class JsonResource(unittest.TestCase):
+
+    def makeResource(self):
+        rsrc = status_json.JsonResource(makeStatus())
+        rsrc.asDict = mock.Mock(return_value={ 'a' : 1 })
+        rsrc.jsonCache = status_json.JsonCache(rsrc.status)
+        return rsrc
+
+    def makeRequest(self, etag=None):
+        req = FakeRequest({})
+        req.method = 'GET'
+        req.uri = '/json/x'
+        req.prepath = [ 'json', 'x' ]
+        req.getHeader = lambda name : name == 'if-none-match' and etag or None
+        return req
+
+    @defer.inlineCallbacks
+    def test_render_twice(self):
+        rsrc = self.makeResource()
+        req = self.makeRequest()
+        yield req.test_render(rsrc)
+        self.assertEqual(req.written, '{"a":1}')
+        req = self.makeRequest()
+        yield req.test_render(rsrc)
+        self.assertEqual(req.written, '{"a":1}')
+        self.assertEqual(rsrc.asDict.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_not_modified(self):
+        rsrc = self.makeResource()
+        req = self.makeRequest()
+        yield req.test_render(rsrc)
+        etag = [ c[0][1] for c in req.setHeader.call_args_list
+                 if c[0][0] == 'ETag' ][0]
+        req = self.makeRequest(etag=etag)
+        yield req.test_render(rsrc)
+        req.setResponseCode.assert_called_with(http.NOT_MODIFIED)
+        self.assertEqual(req.written, '')
+
+    @defer.inlineCallbacks
+    def test_uncacheable(self):
+        rsrc = self.makeResource()
+        rsrc.cacheable = False
+        yield self.makeRequest().test_render(rsrc)
+        yield self.makeRequest().test_render(rsrc)
+        self.assertEqual(rsrc.asDict.call_count, 2)
+
+class BuildHistoryJsonResource(unittest.TestCase):
+
+    def setUp(self):
+        self.builder_status = mock.Mock()
+        def generateBuildSummaryHistory(before=None):
+            if before is None:
+                before = 10
+            for n in range(before - 1, -1, -1):
+                yield buildsummary.BuildSummary(n, started=n, finished=n + 1,
+                        results=n % 2, revision='r%d' % n, slavename='sl')
+        self.builder_status.generateBuildSummaryHistory = \
+                generateBuildSummaryHistory
+        self.rsrc = status_json.BuildHistoryJsonResource(makeStatus(),
+                                                         self.builder_status)
+
+    def makeRequest(self, **args):
+        req = FakeRequest(dict((k, [v]) for k, v in args.items()))
+        req.method = 'GET'
+        req.uri = '/json/builders/bldr/history'
+        req.getHeader = lambda name : None
+        req.notifyFinish.return_value = defer.Deferred()
+        return req
+
+    def test_asDict(self):
+        d = self.rsrc.asDict(self.makeRequest(limit='3', before='5',
+                                              field='results,slave'))
+        self.assertEqual(d, { 'builds' : [
+                { 'number' : 4, 'results' : 0, 'slave' : 'sl' },
+                { 'number' : 3, 'results' : 1, 'slave' : 'sl' },
+                { 'number' : 2, 'results' : 0, 'slave' : 'sl' } ],
+            'next' : 2 })
+
+    def test_asDict_last_page(self):
+        d = self.rsrc.asDict(self.makeRequest(before='2', field='times'))
+        self.assertEqual(d, { 'builds' : [
+                { 'number' : 1, 'times' : [1, 2] },
+                { 'number' : 0, 'times' : [0, 1] } ],
+            'next' : None })
+
+    def test_limit_bounded(self):
+        self.rsrc.maxLimit = 4
+        d = self.rsrc.asDict(self.makeRequest(limit='100', field='results'))
+        self.assertEqual(len(d['builds']), 4)
+
+    @defer.inlineCallbacks
+    def test_render_streams(self):
+        req = self.makeRequest(limit='2', field='revision')
+        yield req.test_render(self.rsrc)
+        self.assertEqual(req.written,
+                '{"builds":[{"number":9,"revision":"r9"},'
+                '{"number":8,"revision":"r8"}],"next":8}')
+
+    @defer.inlineCallbacks
+    def test_render_callback(self):
+        req = self.makeRequest(before='1', field='slave', callback='cb')
+        yield req.test_render(self.rsrc)
+        self.assertEqual(req.written,
+                'cb({"builds":[{"number":0,"slave":"sl"}],"next":null});')
+
+    def test_render_bad_args(self):
+        for args in (dict(limit='ten'), dict(before='x')):
+            req = self.makeRequest(**args)
+            body = self.rsrc.render_GET(req)
+            req.setResponseCode.assert_called_with(http.BAD_REQUEST)
+            self.assertEqual(json.loads(body),
+                    { 'error' : 'limit and before must be integers' })
@@ -0,0 +1,186 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+
+from buildbot.status import build, buildstep
+from buildbot.status.web import waterfall
+
+class FakeBuilderStatus(object):
+    """A builder whose eventGenerator yields C{self.stream}, and counts the
+    events it has generated."""
+
+    def __init__(self, name='bldr'):
+        self.name = name
+        self.stream = []
+        self.nextBuildNumber = 0
+        self.generated = 0
+        self.builds = []
+
+    def getName(self):
+        return self.name
+
+    def getEvent(self, number):
+        return None
+
+    def getCurrentBuilds(self):
+        return [ b for b in self.builds if not b.isFinished() ]
+
+    def eventGenerator(self, branches, categories, committers, minTime):
+        for e in self.stream:
+            self.generated += 1
+            yield e
+
+    def addBuild(self, started, finished=True, steps=2):
+        b = mock.Mock(spec=build.BuildStatus)
+        b.getNumber.return_value = self.nextBuildNumber
+        b.isFinished.return_value = finished
+        b.getTimes.return_value = (started, None)
+        self.nextBuildNumber += 1
+        events = []
+        for i in range(steps):
+            s = mock.Mock(spec=buildstep.BuildStepStatus)
+            s.getBuild.return_value = b
+            s.getName.return_value = 'step%d' % i
+            events.insert(0, s)
+        self.stream[:0] = events + [ b ]
+        self.builds.append(b)
+        return b
+
+class BuilderEventCache(unittest.TestCase):
+
+    def setUp(self):
+        self.bs = FakeBuilderStatus()
+        self.cache = waterfall.BuilderEventCache(self.bs, [], [], [])
+
+    def render(self, count=None, minTime=0):
+        gen = self.cache.eventGenerator([], [], [], minTime)
+        events = []
+        for e in gen:
+            events.append(e)
+            if len(events) == count:
+                break
+        return events
+
+    def test_first_render(self):
+        for t in range(3):
+            self.bs.addBuild(100 + t)
+        self.assertEqual(self.render(), self.bs.stream)
+
+    def test_unchanged(self):
+        for t in range(3):
+            self.bs.addBuild(100 + t)
+        self.render()
+        generated = self.bs.generated
+        self.assertEqual(self.render(), self.bs.stream)
+        self.assertEqual(self.bs.generated, generated)
+
+    def test_new_build(self):
+        for t in range(3):
+            self.bs.addBuild(100 + t)
+        self.render()
+        generated = self.bs.generated
+        self.bs.addBuild(200, finished=False)
+        self.assertEqual(self.render(), self.bs.stream)
+        # only the new build and its steps, plus the event which matched the
+        # cache, were generated
+        self.assertEqual(self.bs.generated - generated, 4)
+
+    def test_running_build(self):
+        self.bs.addBuild(100)
+        running = self.bs.addBuild(200, finished=False, steps=1)
+        self.render()
+        # another step starts, which the cache hears about
+        s = mock.Mock(spec=buildstep.BuildStepStatus)
+        s.getBuild.return_value = running
+        s.getName.return_value = 'late'
+        self.bs.stream.insert(0, s)
+        self.cache.update(1)
+        self.assertEqual(self.render(), self.bs.stream)
+
+    def test_older_build_running(self):
+        self.bs.addBuild(100)
+        running = self.bs.addBuild(200, finished=False, steps=1)
+        self.bs.addBuild(300)
+        self.render()
+        # the older build starts another step after the newer one finished
+        s = mock.Mock(spec=buildstep.BuildStepStatus)
+        s.getBuild.return_value = running
+        s.getName.return_value = 'late'
+        self.bs.stream.insert(3, s)
+        self.cache.update(1)
+        self.assertEqual(self.render(), self.bs.stream)
+        # and then finishes
+        running.isFinished.return_value = True
+        self.bs.stream.insert(0, mock.Mock(name='builder event'))
+        self.cache.update(2)
+        self.assertEqual(self.render(), self.bs.stream)
+
+    def test_trimmed(self):
+        for t in range(5):
+            self.bs.addBuild(100 + t)
+        self.render()
+        self.render(count=2)
+        self.bs.addBuild(200)
+        self.render(count=1)
+        # the new events, and the two used by the last render
+        self.assertEqual(len(self.cache.events), 5)
+        # the events beyond the cached ones are generated when needed
+        self.assertEqual(self.render(), self.bs.stream)
+
+    def test_minTime(self):
+        for t in range(3):
+            self.bs.addBuild(100 + t)
+        self.assertEqual(self.render(minTime=101), self.bs.stream[:6])
+
+class WaterfallEventCache(unittest.TestCase):
+
+    def setUp(self):
+        self.status = mock.Mock()
+        self.cache = waterfall.WaterfallEventCache(self.status)
+
+    def test_subscribes(self):
+        self.status.subscribe.assert_called_with(self.cache)
+        bs = FakeBuilderStatus()
+        self.assertIdentical(self.cache.builderAdded('bldr', bs), self.cache)
+
+    def test_getSource(self):
+        bs = FakeBuilderStatus()
+        source = self.cache.getSource(bs, ['br'], [], [])
+        self.assertIdentical(self.cache.getSource(bs, ['br'], [], []),
+                             source)
+        self.assertNotIdentical(self.cache.getSource(bs, [], [], []),
+                                source)
+
+    def test_changed(self):
+        bs = FakeBuilderStatus()
+        bs.addBuild(100)
+        source = self.cache.getSource(bs, [], [], [])
+        list(source.eventGenerator([], [], [], 0))
+        generated = bs.generated
+        b = mock.Mock(name='build')
+        b.getBuilder.return_value = bs
+        self.cache.stepStarted(b, mock.Mock(name='step'))
+        source = self.cache.getSource(bs, [], [], [])
+        list(source.eventGenerator([], [], [], 0))
+        self.assertNotEqual(bs.generated, generated)
+
+    def test_stop(self):
+        bs = mock.Mock()
+        self.cache.builderAdded('bldr', bs)
+        self.cache.stop()
+        self.status.unsubscribe.assert_called_with(self.cache)
+        bs.unsubscribe.assert_called_with(self.cache)
@@ -15,8 +15,10 @@
 
 from __future__ import with_statement
 
-import tempfile, os
+import tempfile, os, shutil, tarfile
+from cStringIO import StringIO
 from twisted.trial import unittest
+from twisted.python import runtime
 
 from mock import Mock
 
@@ -24,6 +26,7 @@ from buildbot.process.properties import Properties
 from buildbot.util import json
 from buildbot.steps.transfer import StringDownload, JSONStringDownload
 from buildbot.steps.transfer import JSONPropertiesDownload, FileUpload
+from buildbot.steps.transfer import _DirectoryWriter
 from buildbot import config
 
 class TestFileUpload(unittest.TestCase):
@@ -135,6 +138,118 @@ class TestFileUpload(unittest.TestCase):
         s.step_status.addURL.assert_called_once_with(
             os.path.basename(self.destfile), "http://server/file")
 
+    def test_constructor_window(self):
+        self.assertRaises(config.ConfigErrors, lambda :
+                FileUpload(slavesrc=__file__, masterdest='xyz', window=0))
+
+    def startWithSlaveVersion(self, version, **kwargs):
+        s = FileUpload(slavesrc=__file__, masterdest=self.destfile, **kwargs)
+        s.build = Mock()
+        s.build.getProperties.return_value = Properties()
+        s.build.getSlaveCommandVersion.return_value = version
+
+        s.step_status = Mock()
+        s.buildslave = Mock()
+        s.remote = Mock()
+        s.start()
+
+        for c in s.remote.method_calls:
+            name, command, args = c
+            if command[3] == 'uploadFile':
+                return command[-1]
+        self.fail("No uploadFile command found")
+
+    def testWindow(self):
+        kwargs = self.startWithSlaveVersion("2.16", window=8)
+        self.assertEqual(kwargs['window'], 8)
+
+    def testWindowOldSlave(self):
+        kwargs = self.startWithSlaveVersion("2.15", window=8)
+        self.assertNotIn('window', kwargs)
+
+    def testWindowOne(self):
+        kwargs = self.startWithSlaveVersion("2.16", window=1)
+        self.assertNotIn('window', kwargs)
+
+class TestDirectoryWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.srcdir = tempfile.mkdtemp()
+        self.destdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.srcdir, 'sub', 'subsub'))
+        self.files = {
+            'empty' : '',
+            os.path.join('sub', 'small') : 'small',
+            os.path.join('sub', 'subsub', 'big') : '0123456789' * 10000,
+            os.path.join('sub', 'x' * 120) : 'long name',
+        }
+        for name, contents in self.files.iteritems():
+            with open(os.path.join(self.srcdir, name), "wb") as f:
+                f.write(contents)
+        os.chmod(os.path.join(self.srcdir, 'sub', 'small'), 0751)
+
+    def tearDown(self):
+        shutil.rmtree(self.srcdir)
+        shutil.rmtree(self.destdir)
+
+    def makeTar(self, compress=None):
+        buf = StringIO()
+        mode = 'w|' + (compress or '')
+        archive = tarfile.open(mode=mode, fileobj=buf)
+        archive.add(self.srcdir, '')
+        archive.close()
+        return buf.getvalue()
+
+    def feed(self, writer, data, chunksize=7):
+        for i in xrange(0, len(data), chunksize):
+            writer.remote_write(data[i:i+chunksize])
+
+    def checkExtracted(self):
+        for name, contents in self.files.iteritems():
+            with open(os.path.join(self.destdir, name), "rb") as f:
+                self.assertEqual(f.read(), contents)
+        if runtime.platformType != 'win32':
+            mode = os.stat(os.path.join(self.destdir, 'sub', 'small')).st_mode
+            self.assertEqual(mode & 0777, 0751)
+
+    def test_uncompressed(self, compress=None):
+        writer = _DirectoryWriter(self.destdir, None, compress, 0600)
+        self.feed(writer, self.makeTar(compress))
+        writer.remote_unpack()
+        self.checkExtracted()
+
+    def test_gz(self):
+        self.test_uncompressed('gz')
+
+    def test_bz2(self):
+        self.test_uncompressed('bz2')
+
+    def test_large_chunks(self):
+        writer = _DirectoryWriter(self.destdir, None, 'gz', 0600)
+        self.feed(writer, self.makeTar('gz'), chunksize=16*1024)
+        writer.remote_unpack()
+        self.checkExtracted()
+
+    def test_one_chunk(self):
+        writer = _DirectoryWriter(self.destdir, None, None, 0600)
+        writer.remote_write(self.makeTar())
+        self.assertEqual(writer.extractor.buffer, '')
+        writer.remote_unpack()
+        self.checkExtracted()
+
+    def test_incremental(self):
+        data = self.makeTar()
+        writer = _DirectoryWriter(self.destdir, None, None, 0600)
+        # feed everything up to the end of 'empty', which is the first file
+        self.feed(writer, data[:data.index('small')])
+        self.assertTrue(os.path.exists(os.path.join(self.destdir, 'empty')))
+
+    def test_truncated(self):
+        data = self.makeTar()
+        writer = _DirectoryWriter(self.destdir, len(data) / 2, None, 0600)
+        self.feed(writer, data)
+        self.assertRaises(tarfile.ReadError, writer.remote_unpack)
+
 class TestStringDownload(unittest.TestCase):
     def testBasic(self):
         s = StringDownload("Hello World", "hello.txt")
@@ -161,6 +276,30 @@ class TestStringDownload(unittest.TestCase):
         else:
             self.assert_(False, "No downloadFile command found")
 
+    def testWindow(self):
+        s = StringDownload("Hello World", "hello.txt", window=2)
+        s.build = Mock()
+        s.build.getProperties.return_value = Properties()
+        s.build.getSlaveCommandVersion.return_value = "2.16"
+
+        s.step_status = Mock()
+        s.buildslave = Mock()
+        s.remote = Mock()
+
+        s.start()
+
+        for c in s.remote.method_calls:
+            name, command, args = c
+            if command[3] == 'downloadFile':
+                self.assertEquals(command[-1]['window'], 2)
+                reader = command[-1]['reader']
+                # reads in flight are answered from consecutive parts
+                self.assertEquals([ reader.remote_read(6) for i in range(3) ],
+                                  [ "Hello ", "World", "" ])
+                break
+        else:
+            self.assert_(False, "No downloadFile command found")
+
 class TestJSONStringDownload(unittest.TestCase):
     def testBasic(self):
         msg = dict(message="Hello World")
@@ -359,3 +359,108 @@ class LRUCache(unittest.TestCase):
         self.assertEqual((yield self.lru.get('p')), short('p'))
         self.lru.put('p', set(['P2P2']))
         self.assertEqual((yield self.lru.get('p')), set(['P2P2']))
+
+    def test_evictions(self):
+        d = defer.succeed(None)
+        for c in 'abcde':
+            d.addCallback(lambda _, c=c : self.lru.get(c))
+        d.addCallback(lambda _ :
+            self.assertEqual(self.lru.evictions, 2))
+        return d
+
+    @defer.inlineCallbacks
+    def test_add(self):
+        self.assertFalse('p' in self.lru)
+        self.lru.add('p', set(['P2P2']))
+        self.lru.add('q', None) # not cached
+        self.assertTrue('p' in self.lru)
+        self.assertFalse('q' in self.lru)
+        self.assertEqual((yield self.lru.get('p')), set(['P2P2']))
+        self.assertEqual((self.lru.hits, self.lru.misses), (1, 0))
+
+    def test_add_evicts(self):
+        for c in 'abcd':
+            self.lru.add(c, short(c))
+        self.assertEqual(sorted(self.lru.cache), ['b', 'c', 'd'])
+
+    def test_contains_concurrent(self):
+        d = defer.Deferred()
+        self.lru.miss_fn = lambda key : d
+        self.lru.get('x')
+        self.assertTrue('x' in self.lru)
+        d.callback(short('x'))
+
+
+class SyncLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.lru = lru.LRUCache(short, 3)
+
+    def check_counts(self, hits, refhits, misses, evictions):
+        self.assertEqual((self.lru.hits, self.lru.refhits, self.lru.misses,
+                          self.lru.evictions),
+                         (hits, refhits, misses, evictions))
+
+    def test_single_key(self):
+        self.assertEqual(self.lru.get('a'), short('a'))
+        self.lru.miss_fn = long
+        self.assertEqual(self.lru.get('a'), short('a'))
+        self.check_counts(1, 0, 1, 0)
+
+    def test_lru_expulsion(self):
+        for c in 'abca':
+            self.lru.get(c)
+        # 'b' is least recently used, so this expels it
+        self.lru.get('d')
+        self.assertEqual(sorted(self.lru.cache), ['a', 'c', 'd'])
+        self.check_counts(1, 0, 4, 1)
+
+    def test_weakrefs(self):
+        res_a = self.lru.get('a')
+        self.lru.get('b')
+        self.lru.miss_fn = long
+        for c in string.lowercase[2:] * 5:
+            self.lru.get(c)
+        self.assertEqual(len(self.lru), 3)
+        self.assertTrue('a' in self.lru)
+        self.assertIdentical(self.lru.get('a'), res_a)
+        self.assertEqual(self.lru.refhits, 1)
+        self.assertEqual(self.lru.get('b'), long('b'))
+
+    def test_add(self):
+        self.lru.get('a')
+        value = set(['A2'])
+        self.lru.add('a', value)
+        self.lru.add('x', set(['X']))
+        self.assertIdentical(self.lru.get('a'), value)
+        self.assertEqual(self.lru.get('x'), set(['X']))
+        self.check_counts(2, 0, 1, 0)
+
+    def test_miss_fn_returns_none(self):
+        calls = []
+        def none_miss_fn(k):
+            calls.append(k)
+        self.lru.miss_fn = none_miss_fn
+        self.assertEqual(self.lru.get('a'), None)
+        self.assertEqual(self.lru.get('a'), None)
+        self.assertEqual(calls, ['a', 'a'])
+
+    def test_miss_fn_exception(self):
+        def fail_miss_fn(k):
+            raise IndexError("no %s" % k)
+        self.lru.miss_fn = fail_miss_fn
+        self.assertRaises(IndexError, lambda : self.lru.get('a'))
+        self.assertFalse('a' in self.lru)
+
+    def test_set_max_size(self):
+        for c in 'abcd':
+            self.lru.add(c, short(c))
+        self.lru.set_max_size(1)
+        self.assertEqual(self.lru.cache.keys(), ['d'])
+        self.assertEqual(self.lru.evictions, 3)
+
+    def test_queue_collapsing(self):
+        for i in xrange(100):
+            self.lru.get('a')
+        self.assertTrue(len(self.lru.queue) <= self.lru.max_queue)
+        self.assertEqual(self.lru.refcount['a'], len(self.lru.queue))
@@ -41,9 +41,13 @@ class FakeMaster(object):
         sub.unsubscribe = unsub
         return sub
 
-    def subscribeToChanges(self, callback):
+    def subscribeToChanges(self, callback, change_filter=None):
         assert not self.changes_subscr_cb
-        self.changes_subscr_cb = callback
+        def filtered(change):
+            if change_filter and not change_filter.filter_change(change):
+                return
+            return callback(change)
+        self.changes_subscr_cb = filtered
         return self._makeSubscription('changes_subscr_cb')
 
     def subscribeToBuildsets(self, callback):
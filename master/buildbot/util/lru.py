@@ -20,7 +20,82 @@ from twisted.internet import defer
 from collections import deque
 from buildbot.util.bbcollections import defaultdict
 
-class AsyncLRUCache(object):
+class BaseLRUCache(object):
+    """
+    The bookkeeping shared by L{AsyncLRUCache} and L{LRUCache}: the cached
+    values, a weak valued dictionary of all values, and a queue of recently
+    used keys, with a count of each key's entries in the queue.  Hits,
+    insertions and evictions all take amortized constant time.
+
+    This is based on Raymond Hettinger's implementation in
+    U{http://code.activestate.com/recipes/498245-lru-and-lfu-cache-decorators/}
+    licensed under the PSF license, which is GPL-compatiblie.
+    """
+
+    __slots__ = ('max_size max_queue miss_fn queue cache weakrefs refcount '
+                 'hits refhits misses evictions'.split())
+    sentinel = object()
+    QUEUE_SIZE_FACTOR = 10
+
+    def __init__(self, miss_fn, max_size=50):
+        self.miss_fn = miss_fn
+        self.max_size = max_size
+        self.max_queue = max_size * self.QUEUE_SIZE_FACTOR
+        self.queue = deque()
+        self.cache = {}
+        self.weakrefs = WeakValueDictionary()
+        self.hits = self.misses = self.refhits = self.evictions = 0
+        self.refcount = defaultdict(lambda : 0)
+
+    def set_max_size(self, max_size):
+        if self.max_size == max_size:
+            return
+
+        self.max_size = max_size
+        self.max_queue = max_size * self.QUEUE_SIZE_FACTOR
+        self._purge()
+
+    def _ref_key(self, key):
+        # record recent use of this key
+        queue = self.queue
+        refcount = self.refcount
+
+        queue.append(key)
+        refcount[key] = refcount[key] + 1
+
+        # periodically compact the queue by eliminating duplicate keys while
+        # preserving order of most recent access.  Note that this is only
+        # required when the cache does not exceed its maximum size
+        if len(queue) > self.max_queue:
+            refcount.clear()
+            queue_appendleft = queue.appendleft
+            queue_appendleft(self.sentinel)
+            for k in ifilterfalse(refcount.__contains__,
+                                    iter(queue.pop, self.sentinel)):
+                queue_appendleft(k)
+                refcount[k] = 1
+
+    def _purge(self):
+        if len(self.cache) <= self.max_size:
+            return
+
+        cache = self.cache
+        refcount = self.refcount
+        queue = self.queue
+        max_size = self.max_size
+
+        # purge least recently used entries, using refcount to count entries
+        # that appear multiple times in the queue
+        while len(cache) > max_size:
+            refc = 1
+            while refc:
+                k = queue.popleft()
+                refc = refcount[k] = refcount[k] - 1
+            del cache[k]
+            del refcount[k]
+            self.evictions += 1
+
+class AsyncLRUCache(BaseLRUCache):
     """
 
     A least-recently-used cache, with a fixed maximum size.  This cache is
@@ -40,21 +115,15 @@ class AsyncLRUCache(object):
     If the result of the C{miss_fn} is C{None}, then the value is not cached;
     this is intended to avoid caching negative results.
 
-    This is based on Raymond Hettinger's implementation in
-    U{http://code.activestate.com/recipes/498245-lru-and-lfu-cache-decorators/}
-    licensed under the PSF license, which is GPL-compatiblie.
-
     @ivar hits: cache hits so far
     @ivar refhits: cache misses found in the weak ref dictionary, so far
     @ivar misses: cache misses leading to re-fetches, so far
+    @ivar evictions: entries purged from the cache to keep it below
+    C{max_size}, so far
     @ivar max_size: maximum allowed size of the cache
     """
 
-    __slots__ = ('max_size max_queue miss_fn '
-                 'queue cache weakrefs refcount concurrent '
-                 'hits refhits misses'.split())
-    sentinel = object()
-    QUEUE_SIZE_FACTOR = 10
+    __slots__ = ('concurrent',)
 
     def __init__(self, miss_fn, max_size=50):
         """
@@ -65,15 +134,8 @@ class AsyncLRUCache(object):
 
         @param max_size: maximum number of objects in the cache
         """
-        self.miss_fn = miss_fn
-        self.max_size = max_size
-        self.max_queue = max_size * self.QUEUE_SIZE_FACTOR
-        self.queue = deque()
-        self.cache = {}
-        self.weakrefs = WeakValueDictionary()
+        BaseLRUCache.__init__(self, miss_fn, max_size)
         self.concurrent = {}
-        self.hits = self.misses = self.refhits = 0
-        self.refcount = defaultdict(lambda : 0)
 
     def get(self, key, **miss_fn_kwargs):
         """
@@ -93,39 +155,19 @@ class AsyncLRUCache(object):
         """
         cache = self.cache
         weakrefs = self.weakrefs
-        refcount = self.refcount
         concurrent = self.concurrent
-        queue = self.queue
-
-        # utility function to record recent use of this key
-        def ref_key():
-            queue.append(key)
-            refcount[key] = refcount[key] + 1
-
-            # periodically compact the queue by eliminating duplicate keys
-            # while preserving order of most recent access.  Note that this
-            # is only required when the cache does not exceed its maximum
-            # size
-            if len(queue) > self.max_queue:
-                refcount.clear()
-                queue_appendleft = queue.appendleft
-                queue_appendleft(self.sentinel)
-                for k in ifilterfalse(refcount.__contains__,
-                                        iter(queue.pop, self.sentinel)):
-                    queue_appendleft(k)
-                    refcount[k] = 1
 
         try:
             result = cache[key]
             self.hits += 1
-            ref_key()
+            self._ref_key(key)
             return defer.succeed(result)
         except KeyError:
             try:
                 result = weakrefs[key]
                 self.refhits += 1
                 cache[key] = result
-                ref_key()
+                self._ref_key(key)
                 return defer.succeed(result)
             except KeyError:
                 # if there's already a fetch going on, add
@@ -154,7 +196,7 @@ class AsyncLRUCache(object):
 
                 # reference the key once, possibly standing in for multiple
                 # concurrent accesses
-                ref_key()
+                self._ref_key(key)
 
             self.inv()
             self._purge()
@@ -175,24 +217,30 @@ class AsyncLRUCache(object):
 
         return d
 
-    def _purge(self):
-        if len(self.cache) <= self.max_size:
+    def add(self, key, value):
+        """
+        Add the given value to the cache, replacing any existing value for
+        the key, and record a reference to the key.  This is used when the
+        value has been fetched without the help of the cache, for example
+        along with several others in a single query.  A value of C{None} is
+        not cached.
+
+        @param key: key to add
+        @param value: the value
+        @returns: nothing
+        """
+        if value is None:
             return
+        self.cache[key] = value
+        self.weakrefs[key] = value
+        self._ref_key(key)
+        self._purge()
 
-        cache = self.cache
-        refcount = self.refcount
-        queue = self.queue
-        max_size = self.max_size
-
-        # purge least recently used entries, using refcount to count entries
-        # that appear multiple times in the queue
-        while len(cache) > max_size:
-            refc = 1
-            while refc:
-                k = queue.popleft()
-                refc = refcount[k] = refcount[k] - 1
-            del cache[k]
-            del refcount[k]
+    def __contains__(self, key):
+        """True if the value for C{key} is available without invoking the
+        C{miss_fn}, either because it is cached or because a fetch is already
+        in progress"""
+        return key in self.weakrefs or key in self.concurrent
 
     def put(self, key, value):
         """
@@ -211,14 +259,6 @@ class AsyncLRUCache(object):
         elif key in self.weakrefs:
             self.weakrefs[key] = value
 
-    def set_max_size(self, max_size):
-        if self.max_size == max_size:
-            return
-
-        self.max_size = max_size
-        self.max_queue = max_size * self.QUEUE_SIZE_FACTOR
-        self._purge()
-
     def inv(self):
         """Check invariants and log if they are not met; used for debugging"""
         global inv_failed
@@ -244,5 +284,90 @@ class AsyncLRUCache(object):
             log.msg("      got:", sorted(self.refcount.items()))
             inv_failed = True
 
+class LRUCache(BaseLRUCache):
+    """
+    A synchronous least-recently-used cache, with a fixed maximum size.  This
+    shares the reference-counted queue of L{AsyncLRUCache}, so hits,
+    insertions and evictions all take amortized constant time, and like that
+    class it keeps all values in a weak valued dictionary, so values that are
+    still in use elsewhere can be found even after they are evicted.
+
+    The C{miss_fn} is called synchronously, and returns the value directly.
+    As for L{AsyncLRUCache}, a C{None} result is not cached; exceptions
+    raised by C{miss_fn} are passed to the caller.
+
+    Membership tests, C{keys()} and C{values()} consider every value that is
+    still alive, whether or not it is in the LRU portion of the cache.
+
+    @ivar hits: cache hits so far
+    @ivar refhits: cache misses found in the weak ref dictionary, so far
+    @ivar misses: cache misses leading to calls to C{miss_fn}, so far
+    @ivar evictions: entries purged from the cache to keep it below
+    C{max_size}, so far
+    @ivar max_size: maximum allowed size of the cache
+    """
+
+    __slots__ = ('__weakref__',)
+
+    def get(self, key, **miss_fn_kwargs):
+        """
+        Fetch a value from the cache by key, invoking C{self.miss_fn(key)} if
+        the key is not in the cache.  Keyword arguments are handled as for
+        L{AsyncLRUCache.get}.
+
+        @param key: cache key
+        @param **miss_fn_kwargs: keyword arguments to  the miss_fn
+        @returns: value, or None if the miss_fn returned None
+        """
+        try:
+            result = self.cache[key]
+            self.hits += 1
+            self._ref_key(key)
+            return result
+        except KeyError:
+            pass
+
+        try:
+            result = self.weakrefs[key]
+            self.refhits += 1
+        except KeyError:
+            self.misses += 1
+            result = self.miss_fn(key, **miss_fn_kwargs)
+            if result is None:
+                return None
+            self.weakrefs[key] = result
+
+        self.cache[key] = result
+        self._ref_key(key)
+        self._purge()
+        return result
+
+    def add(self, key, value):
+        """
+        Add the given value to the cache, replacing any existing value for
+        the key, and record a reference to the key.  This is used when the
+        value has been obtained without the help of the cache.
+
+        @param key: key to add
+        @param value: the value
+        @returns: nothing
+        """
+        self.cache[key] = value
+        self.weakrefs[key] = value
+        self._ref_key(key)
+        self._purge()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, key):
+        return key in self.weakrefs
+
+    def keys(self):
+        return self.weakrefs.keys()
+
+    def values(self):
+        return self.weakrefs.values()
+
 # for tests
 inv_failed = False
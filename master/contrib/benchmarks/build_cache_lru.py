@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# Compare the time taken by 10,000 build cache lookups using the list-based LRU
+# that BuilderStatus used to keep, and buildbot.util.lru.LRUCache, at cache
+# sizes of 50, 500 and 5000.
+#
+# usage: python contrib/benchmarks/build_cache_lru.py [sizes..]
+#
+# Lookups are drawn at random from twice as many build numbers as fit in the
+# cache, so roughly half of them hit.  Run it from the master directory of a
+# buildbot source tree (or with buildbot installed).
+
+import sys
+import time
+import random
+import weakref
+
+from buildbot.util import lru
+
+LOOKUPS = 10000
+
+class Build(object):
+    def __init__(self, number):
+        self.number = number
+
+class ListLRU(object):
+    # the algorithm formerly used by BuilderStatus.touchBuildCache
+    def __init__(self, size):
+        self.size = size
+        self.buildCache = weakref.WeakValueDictionary()
+        self.buildCache_LRU = []
+
+    def get(self, number):
+        try:
+            build = self.buildCache[number]
+        except KeyError:
+            build = Build(number)
+        self.buildCache[build.number] = build
+        if build in self.buildCache_LRU:
+            self.buildCache_LRU.remove(build)
+        self.buildCache_LRU = self.buildCache_LRU[-(self.size-1):] + [ build ]
+        return build
+
+def run(cache, keys):
+    start = time.time()
+    get = cache.get
+    for k in keys:
+        get(k)
+    return time.time() - start
+
+def main(sizes):
+    print "%8s %12s %12s %8s" % ('size', 'list (s)', 'LRUCache (s)', 'ratio')
+    for size in sizes:
+        rng = random.Random(size)
+        keys = [ rng.randrange(size * 2) for i in xrange(LOOKUPS) ]
+        old = run(ListLRU(size), keys)
+        new = run(lru.LRUCache(Build, size), keys)
+        print "%8d %12.4f %12.4f %8.1f" % (size, old, new, old / new)
+
+if __name__ == '__main__':
+    main([ int(a) for a in sys.argv[1:] ] or [ 50, 500, 5000 ])
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# Time the console's revision x builder matrix, for 200 builders and 50
+# revisions by default: the first page load, which reads every builder's
+# builds as the console always used to, and later loads, which use the
+# builds and boxes kept by ConsoleBuildCache.
+#
+# usage: python contrib/benchmarks/console_matrix.py [builders [revisions]]
+#
+# The builds are kept in memory, so this measures only the console's own
+# work; on a real master each build loaded is also unpickled from disk, so the
+# number of builds loaded is shown as well.  A tenth of the builders have a
+# build running.  Run it from the master directory of a buildbot source tree
+# (or with buildbot installed).
+
+import sys
+import time
+
+from buildbot.status import builder
+from buildbot.status.web import console
+
+STEPS = 10
+LOADS = 5
+
+class Stub(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class Log(object):
+    def __init__(self, name):
+        self.name = name
+    def getName(self):
+        return self.name
+
+class Step(object):
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+    def getName(self):
+        return self.name
+    def getResults(self):
+        return (self.results, [])
+    def getText(self):
+        return [ '<b>%s</b>' % self.name, 'failed' ]
+    def getLogs(self):
+        return [ Log('stdio') ]
+
+class Build(object):
+    def __init__(self, number, change, finished):
+        self.number = number
+        self.change = change
+        self.finished = finished
+        self.properties = { 'got_revision' : change.revision }
+        failed = number % 5 == 0 and 3 or None
+        self.steps = [ Step('step%d' % i,
+                            i == failed and builder.FAILURE or builder.SUCCESS)
+                       for i in range(STEPS) ]
+    def getNumber(self):
+        return self.number
+    def isFinished(self):
+        return self.finished
+    def getProperty(self, name, default=None):
+        return self.properties.get(name, default)
+    def getLogs(self):
+        return [ log for step in self.steps for log in step.getLogs() ]
+    def getSteps(self):
+        return self.steps
+    def getChanges(self):
+        return [ self.change ]
+    def getResults(self):
+        return builder.SUCCESS
+    def getText(self):
+        return [ 'build', 'successful' ]
+    def getETA(self):
+        return None
+    def getTimes(self):
+        return (self.change.when, None)
+    def getSourceStamp(self):
+        return None
+
+class BuilderStatus(object):
+    def __init__(self, name, changes, running):
+        self.name = name
+        self.category = None
+        self.builds = [ Build(i, c, True) for i, c in enumerate(changes) ]
+        if running:
+            self.builds[-1].finished = False
+        self.loaded = 0
+    def getName(self):
+        return self.name
+    def getBuild(self, number):
+        if number < 0:
+            number += len(self.builds)
+        if not 0 <= number < len(self.builds):
+            return None
+        self.loaded += 1
+        return self.builds[number]
+    def getCurrentBuilds(self):
+        return [ b for b in self.builds[-1:] if not b.finished ]
+
+class Status(object):
+    def __init__(self, builders):
+        self.builders = builders
+    def subscribe(self, receiver):
+        pass
+    def getBuilderNames(self):
+        return [ b.name for b in self.builders ]
+    def getBuilder(self, name):
+        return self.byName[name]
+
+class Request(object):
+    def childLink(self, path):
+        return path
+
+def load_page(rsrc, status, revisions):
+    debugInfo = {}
+    builderList, allBuilds = rsrc.getAllBuildsForRevision(status, None,
+            revisions[-1].revision, len(revisions), [], [], debugInfo)
+    for revision in revisions:
+        builds, details = rsrc.displayStatusLine(builderList, allBuilds,
+                                                 revision, debugInfo)
+        [ rsrc.linkDetails(Request(), d) for d in details ]
+
+def main(numBuilders, numRevisions):
+    # one build per revision, with a few older builds before the first
+    # revision shown
+    changes = [ Stub(revision=str(i), when=i, comments='', who='dev',
+                     getTime=lambda : '', revlink=None, repository='',
+                     project='')
+                for i in range(numRevisions + 10) ]
+    builders = [ BuilderStatus('builder%d' % i, changes, i % 10 == 0)
+                 for i in range(numBuilders) ]
+    status = Status(builders)
+    status.byName = dict((b.name, b) for b in builders)
+    revisions = [ console.DevRevision(c) for c in changes[:9:-1] ]
+
+    rsrc = console.ConsoleStatusResource()
+    rsrc.buildCache = console.ConsoleBuildCache(status, rsrc.makeDevBuild)
+
+    def timed():
+        loaded = sum([ b.loaded for b in builders ])
+        start = time.time()
+        load_page(rsrc, status, revisions)
+        return (time.time() - start,
+                sum([ b.loaded for b in builders ]) - loaded)
+
+    print "%d builders x %d revisions" % (numBuilders, numRevisions)
+    print "%12s %12s %14s" % ('page load', 'time (ms)', 'builds loaded')
+    elapsed, loaded = timed()
+    print "%12s %12.1f %14d" % ('first', elapsed * 1000, loaded)
+    total = 0
+    for i in range(LOADS):
+        elapsed, loaded = timed()
+        total += elapsed
+    print "%12s %12.1f %14d" % ('later', total / LOADS * 1000, loaded)
+
+if __name__ == '__main__':
+    args = [ int(a) for a in sys.argv[1:] ]
+    main(*(args + [ 200, 50 ][len(args):]))
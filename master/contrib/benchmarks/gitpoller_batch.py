@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# Compare the number of processes forked and the wall time taken by GitPoller
+# to process a push of 10, 100 and 1000 commits, with and without batch_log.
+#
+# usage: python contrib/benchmarks/gitpoller_batch.py [counts..]
+#
+# This builds a throw-away fixture repository in a temporary directory, so git
+# must be on the PATH.  Run it from the master directory of a buildbot source
+# tree (or with buildbot installed).
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from twisted.internet import reactor, defer
+from buildbot.changes import gitpoller
+
+def git(cwd, *args, **kwargs):
+    p = subprocess.Popen(('git',) + args, cwd=cwd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out = p.communicate(kwargs.get('input'))[0]
+    if p.returncode != 0:
+        raise RuntimeError('git %s failed' % (args,))
+    return out.strip()
+
+def add_commits(repo, count, start):
+    # use fast-import so that generating the fixture does not dominate
+    stream = []
+    for i in range(start, start + count):
+        msg = 'commit %d\n\nwith a body\n' % i
+        if i == start and start > 0:
+            parent = 'from refs/heads/master^0\n'
+        else:
+            parent = ''
+        stream.append('commit refs/heads/master\n'
+                'committer Bench Mark <bench@example.com> %d +0000\n'
+                'data %d\n%s%s'
+                'M 644 inline file%d\ndata 2\n%d\n'
+                'M 644 inline dir/other%d\ndata 2\n%d\n\n'
+                % (1300000000 + i, len(msg), msg, parent, i % 50, i % 10,
+                   i % 7, i % 10))
+    git(repo, 'fast-import', '--quiet', input=''.join(stream))
+
+class FakeMaster(object):
+    def __init__(self):
+        self.changes = 0
+    def addChange(self, **kwargs):
+        self.changes += 1
+        return defer.succeed(None)
+
+@defer.inlineCallbacks
+def run_one(upstream, workdir, base, count, batch_log):
+    git(workdir, 'reset', '--quiet', '--hard', base)
+
+    poller = gitpoller.GitPoller(upstream, workdir=workdir,
+                                 batch_log=batch_log)
+    poller.master = FakeMaster()
+
+    forks = [0]
+    real_spawnProcess = reactor.spawnProcess
+    def spawnProcess(*args, **kwargs):
+        forks[0] += 1
+        return real_spawnProcess(*args, **kwargs)
+    reactor.spawnProcess = spawnProcess
+    try:
+        start = time.time()
+        yield poller.poll()
+        elapsed = time.time() - start
+    finally:
+        reactor.spawnProcess = real_spawnProcess
+
+    assert poller.master.changes == count, \
+            "expected %d changes, got %d" % (count, poller.master.changes)
+    defer.returnValue((forks[0], elapsed))
+
+@defer.inlineCallbacks
+def main(counts):
+    tmp = tempfile.mkdtemp()
+    try:
+        print "%8s | %-22s | %-22s" % ('commits', 'per-revision',
+                                       'batch_log=True')
+        print "%8s | %8s %12s  | %8s %12s" % ('', 'forks', 'wall (s)',
+                                              'forks', 'wall (s)')
+        for count in counts:
+            upstream = os.path.join(tmp, 'upstream-%d' % count)
+            workdir = os.path.join(tmp, 'workdir-%d' % count)
+            git(tmp, 'init', '--quiet', upstream)
+            add_commits(upstream, 1, 0)
+            git(tmp, 'clone', '--quiet', upstream, workdir)
+            base = git(workdir, 'rev-parse', 'HEAD')
+            add_commits(upstream, count, 1)
+
+            row = []
+            for batch_log in (False, True):
+                forks, elapsed = yield run_one(upstream, workdir, base,
+                                               count, batch_log)
+                row.extend([forks, elapsed])
+            print "%8d | %8d %12.3f  | %8d %12.3f" % tuple([count] + row)
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    counts = [ int(a) for a in sys.argv[1:] ] or [ 10, 100, 1000 ]
+    def run():
+        d = main(counts)
+        d.addErrback(lambda f : f.printTraceback())
+        d.addBoth(lambda _ : reactor.stop())
+    reactor.callWhenRunning(run)
+    reactor.run()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Compare the peak memory use and time taken to read every line of a large
+# log, by joining the whole log into one string and splitting it (as
+# LogFile.readlines and most summary parsers used to), and by iterating over
+# LogFile.readlines.
+#
+# usage: python contrib/benchmarks/logfile_readlines.py [size-in-MB]
+#
+# This writes a synthetic log of compiler-like output (1024 MB by default) to
+# a temporary directory, then reads it in a fresh process for each method, so
+# that each peak resident set size is measured separately.  Run it from the
+# master directory of a buildbot source tree (or with buildbot installed).
+
+import os
+import sys
+import time
+import cPickle
+import shutil
+import resource
+import tempfile
+import subprocess
+
+from buildbot.status import logfile
+
+MB = 1024 * 1024
+CHUNK = 10 * 1000
+
+class Stub(object):
+    pass
+
+def make_step(basedir):
+    step = Stub()
+    step.build = Stub()
+    step.build.builder = Stub()
+    step.build.builder.basedir = basedir
+    step.build.builder.master = None
+    return step
+
+def write_log(basedir, size):
+    lf = logfile.LogFile(make_step(basedir), 'stdio', 'bench-stdio')
+    f = lf.openfile
+    lines = []
+    for i in range(2000):
+        if i % 20 == 0:
+            lines.append('src/file%d.c:%d: warning: unused variable\n' % (i, i))
+        else:
+            lines.append('gcc -O2 -Wall -c src/file%d.c -o obj/file%d.o\n'
+                         % (i, i))
+    text = ''.join(lines)
+    written = 0
+    n = 0
+    while written < size:
+        # mostly stdout, with a stderr chunk now and then
+        channel = n % 10 == 9 and logfile.STDERR or logfile.STDOUT
+        start = (n * 997) % (len(text) - CHUNK)
+        chunk = text[start:start+CHUNK]
+        f.write('%d:%d%s,' % (len(chunk) + 1, channel, chunk))
+        written += len(chunk)
+        n += 1
+    lf.finish()
+    # save it the way a build would, so the reader can load it
+    f = open(os.path.join(basedir, 'bench-stdio.pickle'), 'wb')
+    cPickle.dump(lf, f)
+    f.close()
+
+def read_log(basedir, method):
+    f = open(os.path.join(basedir, 'bench-stdio.pickle'), 'rb')
+    lf = cPickle.load(f)
+    f.close()
+    lf.step = make_step(basedir)
+    channels = [ logfile.STDOUT, logfile.STDERR ]
+    start = time.time()
+    count = 0
+    if method == 'joined':
+        for line in lf.getText().split('\n'):
+            count += 1
+    else:
+        for line in lf.readlines(channels):
+            count += 1
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024 # kilobytes on linux
+    print "%d %f %d" % (count, elapsed, peak)
+
+def main(size):
+    basedir = tempfile.mkdtemp()
+    try:
+        write_log(basedir, size * MB)
+        print "%10s %10s %10s %14s" % ('method', 'lines', 'time (s)',
+                                       'peak RSS (MB)')
+        for method in ('joined', 'readlines'):
+            out = subprocess.Popen([sys.executable, __file__, '--read',
+                                    basedir, method],
+                                   stdout=subprocess.PIPE).communicate()[0]
+            count, elapsed, peak = out.split()
+            print "%10s %10d %10.1f %14.1f" % (method, int(count),
+                    float(elapsed), float(peak) / MB)
+    finally:
+        shutil.rmtree(basedir)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--read']:
+        read_log(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Measure how long a slave takes to notice data appended to watched logfiles
+# (the logfiles= argument of ShellCommand), and the CPU time it uses while
+# watching them, for 50 logfiles by default.  Each mode runs for a fixed
+# period, while lines are appended to the files in turn.
+#
+# usage: PYTHONPATH=../slave python contrib/benchmarks/logfile_watchers.py \
+#           [files [seconds]]
+#
+# "polling" checks each logfile every POLL_INTERVAL seconds, as the slave
+# always used to; "inotify" reads each logfile as soon as it changes, and is
+# only run where inotify is available (Linux, with a recent enough Twisted).
+# This needs the buildslave package on the python path; the logfiles are
+# written in a temporary directory.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from twisted.internet import reactor, task
+from buildslave import runprocess
+
+WRITES_PER_SECOND = 100
+
+class Command(object):
+    def __init__(self):
+        self.written = {}
+        self.latencies = []
+        self.bytes = 0
+
+    def addLogfile(self, name, data):
+        now = time.time()
+        for line in data.splitlines():
+            self.latencies.append(now - self.written.pop((name, line)))
+        self.bytes += len(data)
+
+def run(numFiles, seconds, mode):
+    if mode == 'polling':
+        # as if inotify were not available
+        runprocess._notifier = False
+    else:
+        runprocess._notifier = None
+        if runprocess.getLogFileNotifier() is None:
+            return None
+    dir = tempfile.mkdtemp()
+    command = Command()
+    watchers = [ runprocess.LogFileWatcher(command, 'log%d' % i,
+                                           os.path.join(dir, 'log%d' % i))
+                 for i in range(numFiles) ]
+    for w in watchers:
+        w.start()
+
+    state = { 'count' : 0 }
+    def write():
+        i = state['count']
+        state['count'] += 1
+        name = 'log%d' % (i % numFiles)
+        line = 'line %d' % i
+        command.written[(name, line)] = time.time()
+        f = open(os.path.join(dir, name), 'ab')
+        f.write(line + '\n')
+        f.close()
+    writer = task.LoopingCall(write)
+
+    def finish():
+        writer.stop()
+        # give the slowest watchers time to catch up
+        reactor.callLater(runprocess.LogFileWatcher.POLL_INTERVAL + 0.5,
+                          reactor.stop)
+
+    start = os.times()
+    writer.start(1.0 / WRITES_PER_SECOND)
+    reactor.callLater(seconds, finish)
+    reactor.run()
+    end = os.times()
+    for w in watchers:
+        w.stop()
+    shutil.rmtree(dir)
+
+    latencies = sorted(command.latencies)
+    cpu = (end[0] - start[0]) + (end[1] - start[1])
+    return (len(latencies), latencies[len(latencies) / 2] * 1000,
+            latencies[-1] * 1000, cpu)
+
+def main(numFiles=50, seconds=10):
+    # reactor.run can only be called once, so each mode runs in its own
+    # process
+    if len(sys.argv) > 3:
+        result = run(numFiles, seconds, sys.argv[3])
+        if result:
+            print "%10s %10d %14.1f %12.1f %10.2f" % ((sys.argv[3],) + result)
+        return
+    print "%d logfiles, %d writes/s for %d seconds" % (numFiles,
+            WRITES_PER_SECOND, seconds)
+    print "%10s %10s %14s %12s %10s" % ('mode', 'lines',
+            'median (ms)', 'max (ms)', 'cpu (s)')
+    sys.stdout.flush()
+    for mode in ('polling', 'inotify'):
+        os.spawnv(os.P_WAIT, sys.executable, [ sys.executable, sys.argv[0],
+                  str(numFiles), str(seconds), mode ])
+
+if __name__ == '__main__':
+    args = [ int(a) for a in sys.argv[1:3] ]
+    main(*args)
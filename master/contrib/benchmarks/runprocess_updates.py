@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Count the status-update messages a slave sends to the master per megabyte
+# of command output, for a command that interleaves short lines on stdout and
+# stderr (as compilers and test runners tend to do) at a few output rates.
+#
+# usage: PYTHONPATH=../slave python contrib/benchmarks/runprocess_updates.py
+#
+# "unbatched" is the old behaviour: a fixed 64k buffer, and one message for
+# each run of output to the same log.  "batched" sends everything buffered
+# in one message, and grows the buffer while output is arriving quickly.
+# This needs the buildslave package on the python path, but does not run any
+# processes; the output is simulated against a fake clock.
+
+import sys
+
+from twisted.internet import task
+from buildslave import runprocess
+
+MB = 1024 * 1024
+
+class CountingBuilder(object):
+    usePTY = False
+    unicode_encoding = 'utf-8'
+
+    def __init__(self, batched):
+        self.batched = batched
+        self.messages = 0
+        self.bytes = 0
+
+    def sendUpdate(self, data):
+        self.messages += 1
+
+    def sendUpdates(self, datas):
+        if self.batched:
+            self.messages += 1
+        else:
+            self.messages += len(datas)
+
+def run(rate, batched, total=4*MB, linelen=80):
+    builder = CountingBuilder(batched)
+    rp = runprocess.RunProcess(builder, ['true'], '.')
+    if not batched:
+        rp.MAX_BUFFER_SIZE = rp.BUFFER_SIZE
+    rp._reactor = clock = task.Clock()
+    line = 'x' * (linelen - 1) + '\n'
+    # deliver output in 4k reads, as a process pipe would
+    per_read = 4096 / linelen
+    interval = float(per_read * linelen) / rate
+    sent = 0
+    i = 0
+    while sent < total:
+        for j in range(per_read):
+            rp._addToBuffers(('stdout', 'stderr')[i % 2], line)
+            i += 1
+        sent += per_read * linelen
+        clock.advance(interval)
+    rp._sendBuffers()
+    return builder.messages * MB / float(sent)
+
+def main():
+    rates = [ 1024, 16*1024, 256*1024, 16*MB ]
+    print "%12s %14s %14s" % ("bytes/s", "unbatched", "batched")
+    for rate in rates:
+        print "%12d %14.1f %14.1f" % (rate, run(rate, False), run(rate, True))
+    print "(messages per MB of output)"
+
+if __name__ == '__main__':
+    sys.exit(main())
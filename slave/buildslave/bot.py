@@ -173,6 +173,11 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         number in the process. It adds the update to a queue, and asks the
         master to acknowledge the update so it can be removed from that
         queue."""
+        self.sendUpdates([data])
+
+    def sendUpdates(self, datas):
+        """Like L{sendUpdate}, but send several status updates to the master
+        in a single message.  The master handles them in order."""
 
         if not self.running:
             # .running comes from service.Service, and says whether the
@@ -183,8 +188,7 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         # master still expects to receive. Provide it to avoid significant
         # interoperability issues between new slaves and old masters.
         if self.remoteStep:
-            update = [data, 0]
-            updates = [update]
+            updates = [ [data, 0] for data in datas ]
             d = self.remoteStep.callRemote("update", updates)
             d.addCallback(self.ackUpdate)
             d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
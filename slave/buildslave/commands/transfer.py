@@ -13,13 +13,84 @@
 #
 # Copyright Buildbot Team Members
 
-import os, tarfile, tempfile
+import os, tarfile
 
-from twisted.python import log
+from twisted.python import log, failure
 from twisted.internet import defer
 
 from buildslave.commands.base import Command
 
+class _BlockPipeline(object):
+    """
+    Call C{block_fn} repeatedly, keeping up to C{window} of the transfers it
+    starts in flight at once.  C{block_fn} returns True if there is nothing
+    more to transfer, or a Deferred that fires with True when the end of the
+    transfer has been reached and False otherwise.
+
+    Once the end has been reached, or a block has failed, no more blocks are
+    started, and the Deferred returned from C{run} fires (with the first
+    failure, if any) as soon as the blocks already in flight are complete.
+    """
+
+    def __init__(self, block_fn, window):
+        self.block_fn = block_fn
+        self.window = max(window, 1)
+        self.in_flight = 0
+        self.ended = False
+        self.failure = None
+        self.filling = False
+        self.refill = False
+        self.deferred = None
+
+    def run(self):
+        d = self.deferred = defer.Deferred()
+        self._fill()
+        return d
+
+    def _fill(self):
+        # blocks may complete synchronously, re-entering this method; in
+        # that case, just make the outermost invocation loop again
+        if self.filling:
+            self.refill = True
+            return
+        self.filling = True
+        self.refill = True
+        while self.refill:
+            self.refill = False
+            while (not self.ended and self.failure is None
+                   and self.in_flight < self.window):
+                try:
+                    res = self.block_fn()
+                except:
+                    self.failure = failure.Failure()
+                    break
+                if res is True:
+                    self.ended = True
+                    break
+                self.in_flight += 1
+                res.addCallbacks(self._blockDone, self._blockFailed)
+        self.filling = False
+
+        if self.in_flight == 0 and self.deferred is not None:
+            d, self.deferred = self.deferred, None
+            if self.failure is not None:
+                d.errback(self.failure)
+            else:
+                d.callback(None)
+
+    def _blockDone(self, ended):
+        self.in_flight -= 1
+        if ended:
+            self.ended = True
+        self._fill()
+
+    def _blockFailed(self, why):
+        self.in_flight -= 1
+        if self.failure is None:
+            self.failure = why
+        self._fill()
+
+
 class TransferCommand(Command):
 
     def finished(self, res):
@@ -44,6 +115,11 @@ class TransferCommand(Command):
         # now we wait for the next trip around the loop.  It abandon the file
         # when it sees self.interrupted set.
 
+    def _loop(self, fire_when_done):
+        p = _BlockPipeline(self._transferBlock, self.window)
+        p.run().chainDeferred(fire_when_done)
+        return None
+
 
 class SlaveFileUploadCommand(TransferCommand):
     """
@@ -56,6 +132,8 @@ class SlaveFileUploadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['keepstamp']: whether to preserve file modified and accessed times
+        - ['window']:    number of blocks to have in flight at once
+                         (default 1)
     """
     debug = False
 
@@ -66,6 +144,7 @@ class SlaveFileUploadCommand(TransferCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.keepstamp = args.get('keepstamp', False)
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -121,19 +200,7 @@ class SlaveFileUploadCommand(TransferCommand):
         d.addBoth(self.finished)
         return d
 
-    def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._writeBlock)
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
-            else:
-                self._loop(fire_when_done)
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
-
-    def _writeBlock(self):
+    def _transferBlock(self):
         """Write a block of data to the remote writer"""
 
         if self.interrupted or self.fp is None:
@@ -169,6 +236,97 @@ class SlaveFileUploadCommand(TransferCommand):
         return d
 
 
+class _TarStream(object):
+    """
+    A read-only file-like object that produces a tar archive of a directory
+    as it is read, so that the archive never needs to be stored anywhere.
+    Regular files are archived C{blocksize} bytes at a time.
+    """
+
+    def __init__(self, path, compress, blocksize):
+        self.path = path
+        self.blocksize = blocksize
+        if compress == 'bz2':
+            self.mode = 'w|bz2'
+        elif compress == 'gz':
+            self.mode = 'w|gz'
+        else:
+            self.mode = 'w|'
+        self.chunks = []
+        self.buffered = 0
+        self.generator = self._generate()
+
+    # the output side, used by TarFile
+
+    def write(self, data):
+        if data:
+            self.chunks.append(data)
+            self.buffered += len(data)
+
+    # the input side, used by SlaveFileUploadCommand
+
+    def read(self, length):
+        while self.buffered < length and self.generator is not None:
+            try:
+                self.generator.next()
+            except StopIteration:
+                self.generator = None
+        data = ''.join(self.chunks)
+        data, rest = data[:length], data[length:]
+        self.chunks = rest and [ rest ] or []
+        self.buffered = len(rest)
+        return data
+
+    def close(self):
+        self.generator = None
+        self.chunks = []
+        self.buffered = 0
+
+    def _generate(self):
+        archive = tarfile.open(mode=self.mode, fileobj=self)
+        for _ in self._addPath(archive, self.path, ''):
+            yield
+        archive.close()
+
+    def _addPath(self, archive, path, arcname):
+        tarinfo = archive.gettarinfo(path, arcname)
+        if tarinfo is None:
+            # sockets and such cannot be archived
+            return
+
+        if not tarinfo.isreg():
+            archive.addfile(tarinfo)
+            yield
+            if tarinfo.isdir():
+                for f in sorted(os.listdir(path)):
+                    for _ in self._addPath(archive, os.path.join(path, f),
+                                           os.path.join(arcname, f)):
+                        yield
+            return
+
+        # TarFile.addfile would copy the whole file at once, so write the
+        # header with addfile, then the data and padding ourselves, just as
+        # addfile does
+        archive.addfile(tarinfo)
+        remaining = tarinfo.size
+        f = open(path, 'rb')
+        try:
+            while remaining > 0:
+                data = f.read(min(self.blocksize, remaining))
+                if not data:
+                    raise IOError("unexpected end of file in %s" % path)
+                archive.fileobj.write(data)
+                remaining -= len(data)
+                yield
+        finally:
+            f.close()
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+        if remainder > 0:
+            archive.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        archive.offset += blocks * tarfile.BLOCKSIZE
+
+
 class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
     debug = False
 
@@ -179,6 +337,7 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.compress = args['compress']
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
@@ -192,22 +351,8 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         if self.debug:
             log.msg("path: %r" % self.path)
 
-        # Create temporary archive
-        fd, self.tarname = tempfile.mkstemp()
-        fileobj = os.fdopen(fd, 'w')
-        if self.compress == 'bz2':
-            mode='w|bz2'
-        elif self.compress == 'gz':
-            mode='w|gz'
-        else:
-            mode = 'w'
-        archive = tarfile.open(name=self.tarname, mode=mode, fileobj=fileobj)
-        archive.add(self.path, '')
-        archive.close()
-        fileobj.close()
-
-        # Transfer it
-        self.fp = open(self.tarname, 'rb')
+        # the archive is created as it is sent
+        self.fp = _TarStream(self.path, self.compress, self.blocksize)
 
         self.sendStatus({'header': "sending %s" % self.path})
 
@@ -221,13 +366,16 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
             d1.addErrback(unpack_err)
             d1.addCallback(lambda ignored: res)
             return d1
-        d.addCallback(unpack)
+        def archive_err(f):
+            # e.g., a file in the directory could not be read
+            self.rc = 1
+            return f
+        d.addCallbacks(unpack, archive_err)
         d.addBoth(self.finished)
         return d
 
     def finished(self, res):
         self.fp.close()
-        os.remove(self.tarname)
         return TransferCommand.finished(self, res)
 
 
@@ -242,6 +390,8 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of blocks to have in flight at once
+                         (default 1)
     """
     debug = False
 
@@ -252,9 +402,21 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.bytes_remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.mode = args['mode']
+        self.window = args.get('window', 1)
         self.stderr = None
         self.rc = 0
 
+        # several reads may be in flight at once, so the data they return is
+        # written in the order the reads were sent.  An empty read marks the
+        # end of the file; with more than one read in flight, so does a short
+        # read, as the master reads from a file.
+        self.reads_sent = 0
+        self.reads_written = 0
+        self.read_results = {}
+        self.end_seen = False
+        self.eof = False
+        self.maxsize_reached = False
+
     def start(self):
         if self.debug:
             log.msg('SlaveFileDownloadCommand starting')
@@ -291,6 +453,13 @@ class SlaveFileDownloadCommand(TransferCommand):
 
         d = defer.Deferred()
         self._reactor.callLater(0, self._loop, d)
+        def _check_maxsize(res):
+            if self.maxsize_reached and not self.eof and self.stderr is None:
+                self.stderr = "Maximum filesize reached, truncating file '%s'" \
+                                % self.path
+                self.rc = 1
+            return res
+        d.addCallback(_check_maxsize)
         def _close(res):
             # close the file, but pass through any errors from _loop
             d1 = self.reader.callRemote('close')
@@ -301,24 +470,12 @@ class SlaveFileDownloadCommand(TransferCommand):
         d.addBoth(self.finished)
         return d
 
-    def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._readBlock)
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
-            else:
-                self._loop(fire_when_done)
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
-
-    def _readBlock(self):
+    def _transferBlock(self):
         """Read a block of data from the remote reader."""
 
-        if self.interrupted or self.fp is None:
+        if self.interrupted or self.fp is None or self.end_seen:
             if self.debug:
-                log.msg('SlaveFileDownloadCommand._readBlock(): end')
+                log.msg('SlaveFileDownloadCommand._transferBlock(): end')
             return True
 
         length = self.blocksize
@@ -326,28 +483,38 @@ class SlaveFileDownloadCommand(TransferCommand):
             length = self.bytes_remaining
 
         if length <= 0:
-            if self.stderr is None:
-                self.stderr = "Maximum filesize reached, truncating file '%s'" \
-                                % self.path
-                self.rc = 1
+            self.maxsize_reached = True
             return True
-        else:
-            d = self.reader.callRemote('read', length)
-            d.addCallback(self._writeData)
-            return d
 
-    def _writeData(self, data):
+        if self.bytes_remaining is not None:
+            self.bytes_remaining = self.bytes_remaining - length
+        seq = self.reads_sent
+        self.reads_sent += 1
+        d = self.reader.callRemote('read', length)
+        d.addCallback(self._writeData, seq, length)
+        return d
+
+    def _writeData(self, data, seq, length):
         if self.debug:
-            log.msg('SlaveFileDownloadCommand._readBlock(): readlen=%d' %
+            log.msg('SlaveFileDownloadCommand._writeData(): readlen=%d' %
                     len(data))
-        if len(data) == 0:
-            return True
-
-        if self.bytes_remaining is not None:
-            self.bytes_remaining = self.bytes_remaining - len(data)
-            assert self.bytes_remaining >= 0
-        self.fp.write(data)
-        return False
+        at_end = not data or (len(data) < length and self.window > 1)
+        if at_end:
+            # stop sending reads, even if earlier reads are still in flight
+            self.end_seen = True
+        self.read_results[seq] = (data, length, at_end)
+        while self.reads_written in self.read_results:
+            data, length, at_end = self.read_results.pop(self.reads_written)
+            self.reads_written += 1
+            if self.eof:
+                continue
+            if data:
+                self.fp.write(data)
+            if self.bytes_remaining is not None:
+                # give back the part of the read we did not get
+                self.bytes_remaining += length - len(data)
+            self.eof = at_end
+        return self.end_seen
 
     def finished(self, res):
         if self.fp is not None:
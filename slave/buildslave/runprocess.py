@@ -28,10 +28,16 @@ import stat
 from collections import deque
 from tempfile import NamedTemporaryFile
 
-from twisted.python import runtime, log
+from twisted.python import runtime, log, filepath
 from twisted.python.win32 import quoteArguments
 from twisted.internet import reactor, defer, protocol, task, error
 
+try:
+    from twisted.internet import inotify
+except ImportError:
+    # not Linux, or an older Twisted; logfiles are polled
+    inotify = None
+
 from buildslave import util
 from buildslave.exceptions import AbandonChain
 
@@ -60,8 +66,110 @@ def shell_quote(cmd_list):
             return pipes.quote(e)
         return " ".join([ quote(e) for e in cmd_list ])
 
+class LogFileNotifier:
+    """
+    Tells L{LogFileWatcher}s as soon as their logfiles change, using a single
+    inotify instance, with one watch for each directory holding logfiles.
+    """
+
+    # changes to the files in a directory, and to the directory itself
+    MASK = 0
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+        # directory -> list of watchers
+        self.watchers = {}
+        self.closed = False
+
+    def addWatcher(self, watcher):
+        """Start telling watcher about changes to its logfile; raises an
+        exception if its directory cannot be watched."""
+        dir = os.path.dirname(os.path.abspath(watcher.logfile))
+        if dir not in self.watchers:
+            try:
+                self.notifier.watch(filepath.FilePath(dir), mask=self.MASK,
+                                    callbacks=[self._notify])
+            except:
+                self._closeIfUnused()
+                raise
+            self.watchers[dir] = []
+        self.watchers[dir].append(watcher)
+
+    def removeWatcher(self, watcher):
+        dir = os.path.dirname(os.path.abspath(watcher.logfile))
+        watchers = self.watchers.get(dir, [])
+        if watcher in watchers:
+            watchers.remove(watcher)
+        if dir in self.watchers and not watchers:
+            del self.watchers[dir]
+            self._ignore(dir)
+        self._closeIfUnused()
+
+    def _closeIfUnused(self):
+        # a new instance is made for the next watcher
+        if not self.watchers and not self.closed:
+            self.closed = True
+            self.notifier.loseConnection()
+
+    def _ignore(self, dir):
+        try:
+            self.notifier.ignore(filepath.FilePath(dir))
+        except KeyError:
+            pass # the watch is already gone
+
+    def _notify(self, ignored, path, mask):
+        if path.path in self.watchers:
+            if mask & (inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF |
+                       inotify.IN_IGNORED):
+                # the directory itself has gone, so go back to polling
+                watchers = self.watchers.pop(path.path)
+                self._ignore(path.path)
+                for watcher in watchers:
+                    watcher.directoryGone()
+                self._closeIfUnused()
+            return
+        name = path.basename()
+        for watcher in self.watchers.get(path.dirname(), [])[:]:
+            if os.path.basename(watcher.logfile) == name:
+                watcher.fileChanged()
+
+if inotify is not None:
+    LogFileNotifier.MASK = (inotify.IN_MODIFY | inotify.IN_ATTRIB |
+            inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_TO |
+            inotify.IN_MOVED_FROM | inotify.IN_DELETE_SELF |
+            inotify.IN_MOVE_SELF)
+
+_notifier = None
+def getLogFileNotifier():
+    """Returns the LogFileNotifier shared by all watchers, or None if inotify
+    is not available here."""
+    global _notifier
+    if _notifier is None or (_notifier and _notifier.closed):
+        _notifier = False
+        if inotify is not None:
+            try:
+                notifier = inotify.INotify()
+                notifier.startReading()
+                _notifier = LogFileNotifier(notifier)
+            except Exception:
+                log.msg("inotify is not available; polling logfiles")
+    return _notifier or None
+
+
 class LogFileWatcher:
+    """
+    Sends the data written to a logfile while the command runs.  Where inotify
+    is available, the logfile is read as soon as it changes; otherwise, or
+    while its directory does not exist yet, it is checked every
+    POLL_INTERVAL seconds.  Each read is of up to read_size bytes, which is
+    doubled, up to MAX_READ_SIZE, while the file keeps filling it, and halved
+    again once it does not.
+    """
     POLL_INTERVAL = 2
+    READ_SIZE = 16*1024
+    MAX_READ_SIZE = 256*1024
+
+    _reactor = reactor
 
     def __init__(self, command, name, logfile, follow=False):
         self.command = command
@@ -79,19 +187,72 @@ class LogFileWatcher:
         # added since we started watching
         self.follow = follow
 
-        # every 2 seconds we check on the file again
+        self.read_size = self.READ_SIZE
+        self.notifier = None
+        self.read_pending = None
+        self.stopped = False
+
+        # every 2 seconds we check on the file again, unless we are told of
+        # changes as they happen
         self.poller = task.LoopingCall(self.poll)
+        self.poller.clock = self._reactor
 
     def start(self):
-        self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
+        if not self._startNotifying():
+            self._startPolling()
+
+    def _startPolling(self):
+        if self.poller is not None and not self.poller.running:
+            self.poller.start(self.POLL_INTERVAL).addErrback(self._cleanupPoll)
 
     def _cleanupPoll(self, err):
         log.err(err, msg="Polling error")
         self.poller = None
 
+    def _startNotifying(self):
+        notifier = getLogFileNotifier()
+        if notifier is None:
+            return False
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.logfile))):
+            return False
+        try:
+            notifier.addWatcher(self)
+        except Exception:
+            log.msg("cannot watch %s for changes; polling it" % self.logfile)
+            return False
+        self.notifier = notifier
+        # catch up with anything written before the watch was added
+        self.poll()
+        return True
+
+    def directoryGone(self):
+        self.notifier = None
+        self._startPolling()
+
+    def fileChanged(self):
+        # read once for all the changes the notifier has to tell us about
+        if not self.read_pending:
+            self.read_pending = self._reactor.callLater(0, self._readChanges)
+
+    def _readChanges(self):
+        self.read_pending = None
+        self.poll()
+
     def stop(self):
+        if self.stopped:
+            return
         self.poll()
-        if self.poller is not None:
+        # addLogfile may have stopped us from within that poll
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.notifier is not None:
+            self.notifier.removeWatcher(self)
+            self.notifier = None
+        if self.read_pending:
+            self.read_pending.cancel()
+            self.read_pending = None
+        if self.poller is not None and self.poller.running:
             self.poller.stop()
         if self.started:
             self.f.close()
@@ -103,6 +264,13 @@ class LogFileWatcher:
         return None
 
     def poll(self):
+        if self.stopped:
+            return
+        if self.notifier is None and self.poller is not None \
+                and self.poller.running and self._startNotifying():
+            # the directory exists now, so stop polling
+            self.poller.stop()
+            return
         if not self.started:
             s = self.statFile()
             if s == self.old_logfile_stats:
@@ -122,10 +290,17 @@ class LogFileWatcher:
             self.started = True
         self.f.seek(self.f.tell(), 0)
         while True:
-            data = self.f.read(10000)
+            data = self.f.read(self.read_size)
             if not data:
                 return
             self.command.addLogfile(self.name, data)
+            # addLogfile may stop us, closing the file
+            if self.stopped or self.f.closed:
+                return
+            if len(data) == self.read_size:
+                self.read_size = min(self.MAX_READ_SIZE, self.read_size * 2)
+            elif len(data) < self.read_size / 2:
+                self.read_size = max(self.READ_SIZE, self.read_size / 2)
 
 
 if runtime.platformType == 'posix':
@@ -215,8 +390,11 @@ class RunProcess:
     CHUNK_LIMIT = 128*1024
 
     # Don't send any data until at least BUFFER_SIZE bytes have been collected
-    # or BUFFER_TIMEOUT elapsed
+    # or BUFFER_TIMEOUT elapsed.  While the command keeps filling the buffer
+    # faster than that, the threshold is doubled, up to MAX_BUFFER_SIZE, so
+    # that chatty commands send fewer, larger messages.
     BUFFER_SIZE = 64*1024
+    MAX_BUFFER_SIZE = 256*1024
     BUFFER_TIMEOUT = 5
 
     # For sending elapsed time:
@@ -329,6 +507,7 @@ class RunProcess:
         self.buffered = deque()
         self.buflen = 0
         self.buftimer = None
+        self.buffer_size = self.BUFFER_SIZE
 
         if usePTY == "slave-config":
             self.usePTY = self.builder.usePTY
@@ -374,6 +553,9 @@ class RunProcess:
     def sendStatus(self, status):
         self.builder.sendUpdate(status)
 
+    def sendStatuses(self, statuses):
+        self.builder.sendUpdates(statuses)
+
     def start(self):
         # return a Deferred which fires (with the exit code) when the command
         # completes
@@ -593,43 +775,48 @@ class RunProcess:
                 retval[log] = data
         return retval
 
-    def _sendMessage(self, msg):
+    def _sendMessages(self, msgs):
         """
-        Collapse and send msg to the master
+        Collapse the messages in msgs and send them to the master, in order,
+        in a single update call
         """
-        if not msg:
-            return
-        msg = self._collapseMsg(msg)
-        self.sendStatus(msg)
+        msgs = [ self._collapseMsg(msg) for msg in msgs if msg ]
+        if msgs:
+            self.sendStatuses(msgs)
 
     def _bufferTimeout(self):
         self.buftimer = None
+        # output is arriving more slowly than buffer_size per BUFFER_TIMEOUT,
+        # so fall back toward the smaller buffer size
+        if self.buflen < self.buffer_size / 2:
+            self.buffer_size = max(self.BUFFER_SIZE, self.buffer_size / 2)
         self._sendBuffers()
 
     def _sendBuffers(self):
         """
         Send all the content in our buffers.
         """
+        msgs = []
         msg = {}
         msg_size = 0
+        batch_size = 0
         lastlog = None
         logdata = []
         while self.buffered:
             # Grab the next bits from the buffer
             logname, data = self.buffered.popleft()
 
-            # If this log is different than the last one, then we have to send
-            # out the message so far.  This is because the message is
-            # transferred as a dictionary, which makes the ordering of keys
-            # unspecified, and makes it impossible to interleave data from
-            # different logs.  A future enhancement could be to change the
-            # master to support a list of (logname, data) tuples instead of a
-            # dictionary.
+            # If this log is different than the last one, then we have to
+            # start a new message.  Each message is a dictionary, which makes
+            # the ordering of keys unspecified, so data from different logs
+            # cannot be interleaved within one message.  The master handles
+            # the updates in a single call in order, though, so the messages
+            # are batched together below.
             # On our first pass through this loop lastlog is None
             if lastlog is None:
                 lastlog = logname
             elif logname != lastlog:
-                self._sendMessage(msg)
+                msgs.append(msg)
                 msg = {}
                 msg_size = 0
             lastlog = logname
@@ -642,17 +829,25 @@ class RunProcess:
                 if len(chunk) == 0: continue
                 logdata.append(chunk)
                 msg_size += len(chunk)
+                batch_size += len(chunk)
                 if msg_size >= self.CHUNK_LIMIT:
-                    # We've gone beyond the chunk limit, so send out our
+                    # We've gone beyond the chunk limit, so finish this
                     # message.  At worst this results in a message slightly
                     # larger than (2*CHUNK_LIMIT)-1
-                    self._sendMessage(msg)
+                    msgs.append(msg)
                     msg = {}
                     logdata = msg.setdefault(logname, [])
                     msg_size = 0
+                if batch_size >= 2 * self.MAX_BUFFER_SIZE:
+                    # and keep each update call to a reasonable size, too,
+                    # leaving room for the read that filled the buffer
+                    self._sendMessages(msgs)
+                    msgs = []
+                    batch_size = 0
         self.buflen = 0
         if logdata:
-            self._sendMessage(msg)
+            msgs.append(msg)
+        self._sendMessages(msgs)
         if self.buftimer:
             if self.buftimer.active():
                 self.buftimer.cancel()
@@ -662,14 +857,18 @@ class RunProcess:
         """
         Add data to the buffer for logname
         Start a timer to send the buffers if BUFFER_TIMEOUT elapses.
-        If adding data causes the buffer size to grow beyond BUFFER_SIZE, then
-        the buffers will be sent.
+        If adding data causes the buffer size to grow beyond buffer_size, then
+        the buffers will be sent, and if that happened before the timer
+        expired, buffer_size is doubled (up to MAX_BUFFER_SIZE).
         """
         n = len(data)
 
         self.buflen += n
         self.buffered.append((logname, data))
-        if self.buflen > self.BUFFER_SIZE:
+        if self.buflen > self.buffer_size:
+            if self.buftimer:
+                self.buffer_size = min(self.MAX_BUFFER_SIZE,
+                                       self.buffer_size * 2)
             self._sendBuffers()
         elif not self.buftimer:
             self.buftimer = self._reactor.callLater(self.BUFFER_TIMEOUT, self._bufferTimeout)
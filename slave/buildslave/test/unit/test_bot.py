@@ -264,6 +264,15 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_sendUpdates(self):
+        st = FakeStep()
+        sb = self.bot.builders['sb']
+        sb.remoteStep = FakeRemote(st)
+        sb.sendUpdates([ {'stdout' : 'a'}, {'stderr' : 'b'} ])
+        self.assertEqual(st.actions, [
+                     ['update', [[{'stdout': 'a'}, 0], [{'stderr': 'b'}, 0]]],
+                ])
+
     def test_startCommand_interruptCommand(self):
         # set up a fake step to receive updates
         st = FakeStep()
@@ -49,6 +49,20 @@ class FakeMasterMethods(object):
         self.read = False
         self.data = ''
 
+        # number of delayed writes or reads in progress, and the maximum
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _delay(self, result):
+        self.in_flight += 1
+        self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        d = defer.Deferred()
+        def fire():
+            self.in_flight -= 1
+            d.callback(result)
+        reactor.callLater(0.01, fire)
+        return d
+
     def remote_write(self, data):
         if self.write_out_of_space_at is not None:
             self.write_out_of_space_at -= len(data)
@@ -65,9 +79,7 @@ class FakeMasterMethods(object):
             self.data += data
 
         if self.delay_write:
-            d = defer.Deferred()
-            reactor.callLater(0.01, d.callback, None)
-            return d
+            return self._delay(None)
 
     def remote_read(self, length):
         if self.count_reads:
@@ -81,9 +93,7 @@ class FakeMasterMethods(object):
 
         slice, self.data = self.data[:length], self.data[length:]
         if self.delay_read:
-            d = defer.Deferred()
-            reactor.callLater(0.01, d.callback, slice)
-            return d
+            return self._delay(slice)
         else:
             return slice
 
@@ -278,6 +288,92 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_windowed(self):
+        self.fakemaster.delay_write = True
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=16,
+            keepstamp=False,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write(s)', 'close',
+                    {'rc': 0}
+                ])
+            self.assertEqual(self.fakemaster.data,
+                             open(self.datafile, "rb").read())
+            self.assertEqual(self.fakemaster.max_in_flight, 4)
+        d.addCallback(check)
+        return d
+
+    def test_windowed_truncated(self):
+        self.fakemaster.delay_write = True
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=100,
+            blocksize=16,
+            keepstamp=False,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write(s)', 'close',
+                    {'rc': 1,
+                     'stderr': "Maximum filesize reached, truncating file '%s'" % self.datafile}
+                ])
+            self.assertEqual(self.fakemaster.data,
+                             open(self.datafile, "rb").read()[:100])
+        d.addCallback(check)
+        return d
+
+    def test_windowed_out_of_space(self):
+        self.fakemaster.write_out_of_space_at = 70
+        self.fakemaster.count_writes = True    # get actual byte counts
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=4,
+        ))
+
+        d = self.run_command()
+        def cb(_):
+            self.fail("shouldn't get here")
+        def eb(f):
+            f.trap(RuntimeError) # expected
+        d.addCallbacks(cb, eb)
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write 64', 'close',
+                    {'rc': 1}
+                ])
+        d.addCallback(check)
+        return d
+
 class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
     def setUp(self):
@@ -374,9 +470,97 @@ class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
         return d
 
+    def test_contents(self, compress=None):
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=64,
+            compress=compress,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check_tarfile(_):
+            f = StringIO.StringIO(self.fakemaster.data)
+            a = tarfile.open(fileobj=f, name='check.tar')
+            self.assertEqual(a.extractfile('aa').read(), "lots of a" * 100)
+            self.assertEqual(a.extractfile('bb').read(), "and a little b" * 17)
+            a.close()
+        d.addCallback(check_tarfile)
+        return d
+
+    def test_contents_gz(self):
+        return self.test_contents('gz')
+
+    def test_missing(self):
+        self.make_command(transfer.SlaveDirectoryUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data-nosuch',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=512,
+            compress=None
+        ))
+
+        d = self.run_command()
+        def cb(_):
+            self.fail("shouldn't get here")
+        def eb(f):
+            f.trap(OSError) # expected
+        d.addCallbacks(cb, eb)
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % (self.datadir + '-nosuch')},
+                    {'rc': 1}
+                ])
+        d.addCallback(check)
+        return d
+
     # this is just a subclass of SlaveUpload, so the remaining permutations
     # are already tested
 
+class TestTarStream(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = os.path.abspath('tarstream')
+        if os.path.exists(self.datadir):
+            shutil.rmtree(self.datadir)
+        os.makedirs(os.path.join(self.datadir, 'sub'))
+        open(os.path.join(self.datadir, 'sub', 'big'), "wb").write(
+                                                        "0123456789" * 10000)
+
+    def tearDown(self):
+        if os.path.exists(self.datadir):
+            shutil.rmtree(self.datadir)
+
+    def test_incremental(self):
+        stream = transfer._TarStream(self.datadir, None, 1024)
+        first = stream.read(2048)
+        self.assertEqual(len(first), 2048)
+        # only a little of the big file has been archived so far (TarFile
+        # writes in 10k records)
+        self.assertTrue(stream.buffered < 20000, stream.buffered)
+
+        chunks = [ first ]
+        while True:
+            data = stream.read(3000)
+            if not data:
+                break
+            chunks.append(data)
+        stream.close()
+
+        a = tarfile.open(fileobj=StringIO.StringIO(''.join(chunks)))
+        self.assertEqual(a.extractfile('sub/big').read(), "0123456789" * 10000)
+        self.assertEqual(sorted(n for n in a.getnames() if n),
+                         [ 'sub', 'sub/big' ])
+
+
 class TestDownloadFile(CommandTestMixin, unittest.TestCase):
 
     def setUp(self):
@@ -502,6 +686,89 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_windowed(self):
+        self.fakemaster.data = test_data = 'tenchars--' * 100 # 1k
+        self.fakemaster.delay_read = True
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=64,
+            mode=None,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    'read(s)', 'close',
+                    {'rc': 0}
+                ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+            self.assertEqual(self.fakemaster.max_in_flight, 4)
+        d.addCallback(check)
+        return d
+
+    def test_windowed_truncated(self):
+        self.fakemaster.data = test_data = 'tenchars--' * 10
+        self.fakemaster.delay_read = True
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=50,
+            blocksize=16,
+            mode=None,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    'read(s)', 'close',
+                    {'rc': 1,
+                     'stderr': "Maximum filesize reached, truncating file '%s'"
+                                % os.path.join(self.basedir, '.', 'data')}
+                ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data[:50])
+        d.addCallback(check)
+        return d
+
+    def test_windowed_under_maxsize(self):
+        # the reads in flight may ask for up to maxsize bytes in all; a file
+        # shorter than that is not truncated
+        self.fakemaster.data = test_data = 'tenchars--' * 9
+        self.fakemaster.delay_read = True
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=100,
+            blocksize=32,
+            mode=None,
+            window=4,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    'read(s)', 'close',
+                    {'rc': 0}
+                ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
     def test_interrupted(self):
         self.fakemaster.data = 'tenchars--' * 100 # 1k
         self.fakemaster.delay_read = True # read veery slowly
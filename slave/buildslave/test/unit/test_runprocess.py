@@ -656,6 +656,8 @@ class TestLogging(BasedirMixin, unittest.TestCase):
             {'stderr': 'DIEEEEEEE'},
             {'stdout': 'world'},
             ])
+        # .. in a single message
+        self.failUnlessEqual(b.messages, 1)
 
     def testSendChunked(self):
         b = FakeSlaveBuilder(False, self.basedir)
@@ -672,6 +674,44 @@ class TestLogging(BasedirMixin, unittest.TestCase):
         s._addToBuffers('stdout', data)
         self.failUnlessEqual(len(b.updates), 1)
 
+    def testSendBatchLimit(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        for i in range(runprocess.RunProcess.MAX_BUFFER_SIZE / 256):
+            s.buffered.append(('stdout', 'x' * 256))
+            s.buffered.append(('stderr', 'y' * 256))
+        s.buffered.append(('stdout', 'z'))
+        s._sendBuffers()
+        self.failUnlessEqual(b.messages, 2)
+        self.failUnlessEqual(b.updates[-1], {'stdout': 'z'})
+
+    def testBufferSizeAdapts(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s._reactor = clock = task.Clock()
+        size = runprocess.RunProcess.BUFFER_SIZE
+        # fast output doubles the buffer size..
+        s._addToBuffers('stdout', 'x' * (size / 2))
+        s._addToBuffers('stdout', 'x' * (size / 2 + 1))
+        self.failUnlessEqual((b.messages, s.buffer_size), (1, size * 2))
+        s._addToBuffers('stdout', 'x' * size)
+        s._addToBuffers('stdout', 'x' * (size + 1))
+        self.failUnlessEqual((b.messages, s.buffer_size), (2, size * 4))
+        # .. but no further than MAX_BUFFER_SIZE
+        s._addToBuffers('stdout', 'x' * size * 2)
+        s._addToBuffers('stdout', 'x' * (size * 2 + 1))
+        self.failUnlessEqual((b.messages, s.buffer_size),
+                             (3, runprocess.RunProcess.MAX_BUFFER_SIZE))
+        # and slow output shrinks it again
+        s._addToBuffers('stdout', 'x')
+        clock.advance(runprocess.RunProcess.BUFFER_TIMEOUT)
+        self.failUnlessEqual((b.messages, s.buffer_size), (4, size * 2))
+        s._addToBuffers('stdout', 'x')
+        clock.advance(runprocess.RunProcess.BUFFER_TIMEOUT)
+        s._addToBuffers('stdout', 'x')
+        clock.advance(runprocess.RunProcess.BUFFER_TIMEOUT)
+        self.failUnlessEqual((b.messages, s.buffer_size), (6, size))
+
 class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
     def setUp(self):
         self.setUpBasedir()
@@ -698,3 +738,100 @@ class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
         st = lf.statFile()
         self.assertEqual(st and st[2], 2, "statfile.log exists and size is correct")
         os.remove('statfile.log')
+
+    def makeWatcher(self, logfile):
+        class Command:
+            def __init__(self):
+                self.data = []
+                self.added = None
+            def addLogfile(self, name, data):
+                self.data.append(data)
+                if self.added:
+                    d, self.added = self.added, None
+                    d.callback(None)
+        os.makedirs(self.basedir)
+        return runprocess.LogFileWatcher(Command(), 'test',
+                                         os.path.join(self.basedir, logfile))
+
+    def test_read_size(self):
+        lf = self.makeWatcher('read.log')
+        open(lf.logfile, 'wb').write('x' * 100000)
+        lf.poll()
+        self.assertEqual([ len(d) for d in lf.command.data ],
+                         [16384, 32768, 50848])
+        self.assertEqual(lf.read_size, 65536)
+        # slower output shrinks the reads again
+        open(lf.logfile, 'ab').write('x' * 10)
+        lf.poll()
+        self.assertEqual(lf.read_size, 32768)
+        lf.stop()
+
+    def test_notifier_dispatch(self):
+        if runprocess.inotify is None:
+            raise unittest.SkipTest("inotify is not available")
+        class Watcher:
+            def __init__(self, logfile):
+                self.logfile = logfile
+                self.events = []
+            def fileChanged(self):
+                self.events.append('changed')
+            def directoryGone(self):
+                self.events.append('gone')
+        class INotify:
+            def __init__(self):
+                self.calls = []
+            def watch(self, path, mask, callbacks):
+                self.calls.append(('watch', path.path))
+            def ignore(self, path):
+                self.calls.append(('ignore', path.path))
+            def loseConnection(self):
+                self.calls.append(('close',))
+        dir = os.path.abspath('logs')
+        notifier = runprocess.LogFileNotifier(INotify())
+        a = Watcher(os.path.join(dir, 'a.log'))
+        b = Watcher(os.path.join(dir, 'b.log'))
+        notifier.addWatcher(a)
+        notifier.addWatcher(b)
+        self.assertEqual(notifier.notifier.calls, [('watch', dir)])
+        path = runprocess.filepath.FilePath(dir)
+        notifier._notify(None, path.child('a.log'),
+                         runprocess.inotify.IN_MODIFY)
+        self.assertEqual((a.events, b.events), (['changed'], []))
+        notifier._notify(None, path, runprocess.inotify.IN_DELETE_SELF)
+        self.assertEqual((a.events, b.events), (['changed', 'gone'], ['gone']))
+        self.assertEqual(notifier.notifier.calls,
+                         [('watch', dir), ('ignore', dir), ('close',)])
+
+    def test_notified(self):
+        if runprocess.getLogFileNotifier() is None:
+            raise unittest.SkipTest("inotify is not available")
+        lf = self.makeWatcher('notified.log')
+        # changes must be noticed without waiting for a poll
+        lf.POLL_INTERVAL = 1000
+        lf.start()
+        self.assertNotEqual(lf.notifier, None)
+        d = lf.command.added = defer.Deferred()
+        open(lf.logfile, 'ab').write('hello\n')
+        def check(_):
+            self.assertEqual(lf.command.data, ['hello\n'])
+        d.addCallback(check)
+        # stop outside of the addLogfile call that fired d
+        def stop(r):
+            stopped = defer.Deferred()
+            reactor.callLater(0, lambda : (lf.stop(), stopped.callback(r)))
+            return stopped
+        d.addBoth(stop)
+        return d
+
+    def test_stop_from_addLogfile(self):
+        lf = self.makeWatcher('stopped.log')
+        open(lf.logfile, 'wb').write('x' * 100000)
+        def addLogfile(name, data):
+            lf.command.data.append(data)
+            lf.stop()
+        lf.command.addLogfile = addLogfile
+        lf.poll()
+        self.assertTrue(lf.stopped)
+        self.assertEqual(sum([ len(d) for d in lf.command.data ]), 100000)
+        # later polls do nothing
+        lf.poll()